@@ -3,18 +3,126 @@
 import path_import
 import sys
 
+from base import jvm_config
 from runtime.jclass import ClassLoader
+from runtime.heap import Heap
 from interpreter import interpreter
+from instruction.inline_cache import InlineCache
+from jgc.gc import GCLog
+from jthread.jthread import JThread
+
+
+def print_usage():
+    print('use: python Zvm.py [options] xx[.class]')
+    print('eg: python Zvm.py main')
+    print('eg: python Zvm.py main.class')
+    print('options:')
+    print('    -Xinterpreter:debug|fast    选择解释器模式，默认 debug')
+    print('    -Xtrace                     输出每条指令的 trace (线程，方法，pc，字节码，栈深度)')
+    print('    -Xms<size>                  初始堆大小 (字节)，可以带 k / m / g 后缀，eg: -Xms4m')
+    print('    -Xmx<size>                  最大堆大小 (字节)，可以带 k / m / g 后缀，eg: -Xmx64m')
+    print('    -Xgc:serial|generational|incremental    选择 gc 模式，默认 serial (半区复制)')
+    print('    -Xgcpause:<ms>              增量模式下每一步标记的最长时间，默认 5 毫秒')
+    print('    -Xgcmark:serial|process|numpy    分代模式 full gc 的标记方式，对象很多时用多进程或者 numpy 并行标记')
+    print('    -Xgcmarkmin:<count>         对象至少有多少个时才并行标记，默认 100000')
+    print('    -Xmn<size>                  分代模式下新生代的大小，默认为初始堆大小的 1/4')
+    print('    -Xicstats                   退出时输出 invokevirtual / invokeinterface 调用点内联缓存的命中率')
+    print('    -Xlog:gc[:<file>]           输出每次 gc 停顿的日志，退出时输出停顿分布和分配速率，可以写到文件')
+
+
+# 解析 -Xms / -Xmx 的大小，单位字节，格式错误返回 None
+def parse_size(size):
+    units = {'k': 1024, 'm': 1024 * 1024, 'g': 1024 * 1024 * 1024}
+    unit = 1
+    if size and size[-1].lower() in units:
+        unit = units[size[-1].lower()]
+        size = size[:-1]
+    if not size.isdigit():
+        return None
+    return int(size) * unit
+
+
+def parse_option(option):
+    if option.startswith('-Xinterpreter:'):
+        mode = option[len('-Xinterpreter:'):]
+        if mode not in (jvm_config.INTERPRETER_DEBUG, jvm_config.INTERPRETER_FAST):
+            return False
+        jvm_config.interpreter_mode = mode
+        return True
+    if option == '-Xtrace':
+        jvm_config.log_jvm_status = True
+        return True
+    if option.startswith('-Xgc:'):
+        mode = option[len('-Xgc:'):]
+        if mode not in (jvm_config.GC_SERIAL, jvm_config.GC_GENERATIONAL, jvm_config.GC_INCREMENTAL):
+            return False
+        jvm_config.gc_mode = mode
+        return True
+    if option.startswith('-Xgcmark:'):
+        mode = option[len('-Xgcmark:'):]
+        if mode not in (jvm_config.GC_MARK_SERIAL, jvm_config.GC_MARK_PROCESS, jvm_config.GC_MARK_NUMPY):
+            return False
+        jvm_config.gc_mark_mode = mode
+        return True
+    if option.startswith('-Xgcmarkmin:'):
+        count = option[len('-Xgcmarkmin:'):]
+        if not count.isdigit():
+            return False
+        jvm_config.gc_mark_min_objects = int(count)
+        return True
+    if option.startswith('-Xgcpause:'):
+        pause = option[len('-Xgcpause:'):]
+        if not pause.isdigit() or int(pause) <= 0:
+            return False
+        jvm_config.gc_pause_budget_ms = int(pause)
+        return True
+    if option.startswith('-Xmn'):
+        size = parse_size(option[4:])
+        if size is None or size <= 0:
+            return False
+        jvm_config.heap_young_size = size
+        return True
+    if option.startswith('-Xms') or option.startswith('-Xmx'):
+        size = parse_size(option[4:])
+        if size is None or size <= 0:
+            return False
+        if option.startswith('-Xms'):
+            jvm_config.heap_init_size = size
+        else:
+            jvm_config.heap_max_size = size
+        return True
+    if option == '-Xlog:gc' or option.startswith('-Xlog:gc:'):
+        jvm_config.gc_log = True
+        log_file = option[len('-Xlog:gc:'):]
+        if log_file:
+            jvm_config.gc_log_file = log_file
+        return True
+    if option == '-Xicstats':
+        jvm_config.print_inline_cache_stats = True
+        return True
+    return False
 
 
 def parse_params():
-    args = sys.argv
-    if len(args) <= 1:
-        print('use: python Zvm.py xx[.class]')
-        print('eg: python Zvm.py main')
-        print('eg: python Zvm.py main.class')
+    args = sys.argv[1:]
+    name = None
+    for arg in args:
+        if arg.startswith('-'):
+            if not parse_option(arg):
+                print('unknown option: ' + arg)
+                print_usage()
+                return None
+        else:
+            name = arg
+    if name is None:
+        print_usage()
+        return None
+    if jvm_config.heap_init_size > jvm_config.heap_max_size:
+        print('initial heap size (-Xms) is larger than the maximum heap size (-Xmx)')
+        return None
+    if jvm_config.heap_young_size is not None and jvm_config.heap_young_size >= jvm_config.heap_init_size:
+        print('young generation size (-Xmn) must be smaller than the initial heap size (-Xms)')
         return None
-    name = sys.argv[1]
     if name.endswith('.class'):
         name = name[:name.find('.class')]
     return name
@@ -24,11 +132,22 @@ def main():
     class_file = parse_params()
     if class_file is None:
         return
+    GCLog.open(jvm_config.gc_log, jvm_config.gc_log_file)
+    Heap.init_heap(jvm_config.heap_init_size, jvm_config.heap_max_size, jvm_config.gc_mode,
+                   jvm_config.heap_young_size, jvm_config.gc_pause_budget_ms, jvm_config.gc_mark_mode,
+                   jvm_config.gc_mark_min_objects)
     loader = ClassLoader()
     j_class = loader.load_class(class_file)
     print(j_class)
     method = j_class.get_main_method()
     interpreter.Interpreter.exec_method(method)
+    # 主线程结束之后等其他 java 线程跑完，它们的输出和 gc 都要算在汇总里
+    JThread.join_all()
+    if jvm_config.print_inline_cache_stats:
+        InlineCache.print_stats()
+    if jvm_config.gc_log:
+        GCLog.print_summary()
+    GCLog.close()
 
 
 if __name__ == '__main__':
@@ -7,7 +7,38 @@ log_jvm_status = False
 
 print_in_real_time = True
 
+# 解释器模式: debug 逐条执行指令对象，检查 pc 和操作数栈深度，方便调试; fast 执行解码时生成的 handler 闭包，没有检查
+INTERPRETER_DEBUG = 'debug'
+INTERPRETER_FAST = 'fast'
+interpreter_mode = INTERPRETER_DEBUG
+
+# 退出时输出 invokevirtual / invokeinterface 调用点内联缓存的命中情况
+print_inline_cache_stats = False
+
 cur_path = os.getcwd()
 jdk_path = [cur_path + '/', cur_path + '/test/']
 
-heap_size = 11  # 这个是按 ref 个数模拟的 gc，不是真实的 size
+# 堆大小 (字节)，按估算的对象大小记账，可以用 -Xms / -Xmx 指定
+heap_init_size = 1024 * 1024
+heap_max_size = 16 * 1024 * 1024
+
+# gc 模式: serial 每次回收整个堆; generational 分新生代和老年代，新生代单独回收;
+# incremental 增量标记，标记分成小步穿插在解释器执行中
+GC_SERIAL = 'serial'
+GC_GENERATIONAL = 'generational'
+GC_INCREMENTAL = 'incremental'
+gc_mode = GC_SERIAL
+gc_pause_budget_ms = 5  # 增量模式下每一步标记的最长时间 (毫秒)
+heap_young_size = None  # 新生代大小 (字节)，-Xmn 指定，默认为初始堆大小的 1/4
+tenure_threshold = 3  # 熬过几次 minor gc 晋升到老年代
+# 分代模式 full gc 的标记方式: serial 单线程; process 多进程按层标记; numpy 用 numpy 向量化标记
+# 只有对象很多时才会用到 process / numpy
+GC_MARK_SERIAL = 'serial'
+GC_MARK_PROCESS = 'process'
+GC_MARK_NUMPY = 'numpy'
+gc_mark_mode = GC_MARK_SERIAL
+gc_mark_min_objects = 100000  # 对象少于这个数时 full gc 还是串行标记，-Xgcmarkmin 指定
+
+# -Xlog:gc 输出每次 gc 停顿的日志和退出时的汇总，-Xlog:gc:<file> 输出到文件
+gc_log = False
+gc_log_file = None
@@ -13,6 +13,18 @@ def rise_class_cast_error():
     raise RuntimeError("error: java.lang.ClassCastException")
 
 
+def rise_incompatible_class_change_error():
+    raise RuntimeError("error: java.lang.IncompatibleClassChangeError")
+
+
+def rise_abstract_method_error():
+    raise RuntimeError("error: java.lang.AbstractMethodError")
+
+
+def rise_no_such_method_error(msg):
+    raise RuntimeError("error: java.lang.NoSuchMethodError: " + msg)
+
+
 def rise_error(error):
     raise error
 
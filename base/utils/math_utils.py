@@ -0,0 +1,156 @@
+# coding=utf-8
+
+import ctypes
+import math
+
+# java 算术运算的实现，所有 int / long 的溢出回绕都用位运算完成，不走 struct，正常路径上不会抛异常
+INT_SIGN = 0x80000000
+INT_MASK = 0xFFFFFFFF
+INT_MIN = -0x80000000
+INT_MAX = 0x7FFFFFFF
+LONG_SIGN = 0x8000000000000000
+LONG_MASK = 0xFFFFFFFFFFFFFFFF
+LONG_MIN = -0x8000000000000000
+LONG_MAX = 0x7FFFFFFFFFFFFFFF
+
+INT_SHIFT_MASK = 0x1f
+LONG_SHIFT_MASK = 0x3f
+
+NAN = float('nan')
+INF = float('inf')
+
+
+def to_int(val):
+    return ((val + INT_SIGN) & INT_MASK) - INT_SIGN
+
+
+def to_long(val):
+    return ((val + LONG_SIGN) & LONG_MASK) - LONG_SIGN
+
+
+# python 的 float 是 double，float 运算的结果需要舍入到单精度
+def to_float(val):
+    return ctypes.c_float(val).value
+
+
+# 整数除法向 0 取整，MIN / -1 回绕成 MIN，除数为 0 由调用方检查
+def idiv(val1, val2):
+    res = abs(val1) // abs(val2)
+    if (val1 < 0) != (val2 < 0):
+        res = -res
+    return ((res + INT_SIGN) & INT_MASK) - INT_SIGN
+
+
+def ldiv(val1, val2):
+    res = abs(val1) // abs(val2)
+    if (val1 < 0) != (val2 < 0):
+        res = -res
+    return ((res + LONG_SIGN) & LONG_MASK) - LONG_SIGN
+
+
+# 余数的符号和被除数相同
+def irem(val1, val2):
+    res = abs(val1) % abs(val2)
+    if val1 < 0:
+        return -res
+    return res
+
+
+lrem = irem
+
+
+def ishl(val, s):
+    return (((val << (s & INT_SHIFT_MASK)) + INT_SIGN) & INT_MASK) - INT_SIGN
+
+
+def lshl(val, s):
+    return (((val << (s & LONG_SHIFT_MASK)) + LONG_SIGN) & LONG_MASK) - LONG_SIGN
+
+
+def ishr(val, s):
+    return val >> (s & INT_SHIFT_MASK)
+
+
+def lshr(val, s):
+    return val >> (s & LONG_SHIFT_MASK)
+
+
+def iushr(val, s):
+    return ((((val & INT_MASK) >> (s & INT_SHIFT_MASK)) + INT_SIGN) & INT_MASK) - INT_SIGN
+
+
+def lushr(val, s):
+    return ((((val & LONG_MASK) >> (s & LONG_SHIFT_MASK)) + LONG_SIGN) & LONG_MASK) - LONG_SIGN
+
+
+def i2b(val):
+    return ((val + 0x80) & 0xFF) - 0x80
+
+
+def i2c(val):
+    return val & 0xFFFF
+
+
+def i2s(val):
+    return ((val + 0x8000) & 0xFFFF) - 0x8000
+
+
+# 浮点转整数: NaN 为 0，超出范围取边界值，其余向 0 取整
+def f2i(val):
+    if val != val:
+        return 0
+    if val >= INT_MAX:
+        return INT_MAX
+    if val <= INT_MIN:
+        return INT_MIN
+    return int(val)
+
+
+def f2l(val):
+    if val != val:
+        return 0
+    if val >= LONG_MAX:
+        return LONG_MAX
+    if val <= LONG_MIN:
+        return LONG_MIN
+    return int(val)
+
+
+# IEEE 754 的除法，除数为 0 时得到 NaN 或者带符号的无穷大
+def fdiv(val1, val2):
+    if val2 == 0.0:
+        if val1 == 0.0 or val1 != val1:
+            return NAN
+        return math.copysign(INF, val1) * math.copysign(1.0, val2)
+    return val1 / val2
+
+
+# java 的 % 对浮点数是截断取余 (fmod)，不是 python 的向下取余
+def frem(val1, val2):
+    if val2 == 0.0 or val1 != val1 or val2 != val2 or math.isinf(val1):
+        return NAN
+    if math.isinf(val2):
+        return val1
+    return math.fmod(val1, val2)
+
+
+# nan_result: fcmpl / dcmpl 遇到 NaN 返回 -1，fcmpg / dcmpg 返回 1
+def fcmp(val1, val2, nan_result):
+    if val1 > val2:
+        return 1
+    if val1 < val2:
+        return -1
+    if val1 == val2:
+        return 0
+    return nan_result
+
+
+if __name__ == '__main__':
+    print(to_int(INT_MAX + 1) == INT_MIN)
+    print(idiv(INT_MIN, -1) == INT_MIN)
+    print(idiv(-7, 2) == -3, irem(-7, 2) == -1, irem(7, -2) == 1)
+    print(ishl(1, 31) == INT_MIN, ishl(1, 32) == 1)
+    print(iushr(-1, 28) == 15, iushr(-1, 0) == -1, lushr(-1, 60) == 15)
+    print(i2b(200) == -56, i2c(-1) == 0xFFFF, i2s(40000) == -25536)
+    print(f2i(NAN) == 0, f2i(1e20) == INT_MAX, f2i(-2.7) == -2)
+    print(fdiv(1.0, -0.0) == -INF, fdiv(0.0, 0.0) != fdiv(0.0, 0.0), frem(-5.5, 2.0) == -1.5)
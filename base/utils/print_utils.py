@@ -1,5 +1,7 @@
 # coding=utf-8
 
+import sys
+
 from base import jvm_config
 
 
@@ -7,13 +9,25 @@ def print_error(msg):
     print("error: " + msg)
 
 
-def print_jvm_status(msg):
+# msg 可以带 % 格式，参数通过 args 传入，只有打开 log 时才会真正格式化
+def print_jvm_status(msg, *args):
     if jvm_config.log_jvm_status:
+        if args:
+            msg = msg % args
         print(msg)
 
 
+# 结构化的指令 trace: 线程，方法，pc，字节码，栈深度
+def print_ins_trace(thread, frame, ins):
+    method = frame.method
+    print('[%s] %s.%s%s pc=%d op=0x%02x %s frames=%d stack=%d'
+          % (thread.name, method.jclass.name, method.name, method.descriptor, thread.pc,
+             ins.code, ins.name, len(thread.all_frames()), frame.operand_stack.depth()))
+
+
+# 内容和换行一次写出，多个线程同时输出时不会拆开一行
 def print_msg(msg):
-    print(msg)
+    sys.stdout.write('%s\n' % (msg,))
 
 
 class StreamPrinter(object):
@@ -0,0 +1,1110 @@
+# coding=utf-8
+
+import operator
+
+from runtime.jclass import JString, JDouble, JLong, JFloat, JInteger
+from runtime.jobject import JArray, JRef
+from base.utils import error_handler, math_utils
+from instruction import instruction
+from instruction.instruction import InsUtils
+from instruction.inline_cache import InlineCache
+from jgc.gc import GC
+
+# fast 模式的指令 handler: 方法解码时给每条指令生成一个闭包，操作数和跳转目标 (绝对 pc) 都绑定在闭包里，
+# 直接读写 operand_stack.slots / top_index，执行时不再经过指令对象，get_index() 和 push / pop 方法
+# 要查常量池的指令 (字段，方法，类) 第一次执行时解析，然后把 handler 表里自己那一项换成解析好的 handler
+# 换了栈顶 frame 的 handler (调用，返回，athrow，执行 <clinit>) 返回 True，解释器据此重新取 frame，其他返回 None
+# 布局和指令对象一致: long / double 占两个 slot，值在低位，高位是 None
+
+FACTORIES = {}  # 指令类 -> factory(ins, pc, method)，返回 handler(frame)
+
+
+def register(factory, *classes):
+    for cls in classes:
+        FACTORIES[cls] = factory
+
+
+# 没有操作数的指令所有方法共用一个 handler
+def register_handler(handler, *classes):
+    register(lambda ins, pc, method: handler, *classes)
+
+
+# 第一次执行解析完之后替换掉表里这条指令的 handler
+def quicken(method, pc, next_pc, handler):
+    method.handlers[pc] = (handler, next_pc)
+
+
+def make_handler(ins, pc, method):
+    return FACTORIES[ins.__class__](ins, pc, method)
+
+
+# 按 pc 索引的 (handler, next_pc)，非指令起始位置为 None
+# 是 list 而不是 tuple，quicken 要原地替换
+def decode_handlers(method):
+    instructions = method.instructions
+    if instructions is None:
+        instructions = instruction.decode_method(method)
+        method.instructions = instructions
+    handlers = [None] * len(instructions)
+    for pc, ins in enumerate(instructions):
+        if ins is not None:
+            handlers[pc] = (make_handler(ins, pc, method), ins.next_pc)
+    method.handlers = handlers
+    return handlers
+
+
+def nop(frame):
+    pass
+
+
+# ---------------- 常量 ----------------
+
+def push(value):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index
+        operand_stack.slots[top] = value
+        operand_stack.top_index = top + 1
+    return execute
+
+
+def push_wide(value):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index
+        slots[top] = value
+        slots[top + 1] = None
+        operand_stack.top_index = top + 2
+    return execute
+
+
+def ldc(ins, pc, method):
+    const = method.jclass.constant_pool.constants[ins.index]
+    if isinstance(const, JInteger) or isinstance(const, JFloat):
+        return push(const.data)
+    if isinstance(const, JString) or isinstance(const, JRef):
+        return push(const)
+    return push(None)
+
+
+def ldc2_w(ins, pc, method):
+    const = method.jclass.constant_pool.constants[ins.index]
+    if isinstance(const, JLong) or isinstance(const, JDouble):
+        return push_wide(const.data)
+    if isinstance(const, JString):
+        return push(const)
+    return nop  # TODO: Class 对象
+
+
+# ---------------- 局部变量 ----------------
+
+def load(index):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index
+        operand_stack.slots[top] = frame.local_vars.slots[index]
+        operand_stack.top_index = top + 1
+    return execute
+
+
+def load_wide(index):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index
+        slots[top] = frame.local_vars.slots[index]
+        slots[top + 1] = None
+        operand_stack.top_index = top + 2
+    return execute
+
+
+def store(index):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - 1
+        operand_stack.top_index = top
+        frame.local_vars.slots[index] = operand_stack.slots[top]
+    return execute
+
+
+def store_wide(index):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - 2
+        operand_stack.top_index = top
+        local_slots = frame.local_vars.slots
+        local_slots[index] = operand_stack.slots[top]
+        local_slots[index + 1] = None
+    return execute
+
+
+def iinc(index, const):
+    def execute(frame):
+        local_slots = frame.local_vars.slots
+        local_slots[index] = ((local_slots[index] + const + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+    return execute
+
+
+# wide 前缀: 直接生成被修饰指令的 handler，下标 (和 iinc 的增量) 在解码时已经放进去了
+def wide(ins, pc, method):
+    return make_handler(ins.ins, pc, method)
+
+
+# ---------------- 数组 ----------------
+# 正常路径上直接检查 null 和下标，出错时交给 InsUtils.check_array 抛出对应的异常
+
+def xaload(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 1
+    index = slots[top]
+    aref = slots[top - 1]
+    if aref is None or aref.obj is None:
+        InsUtils.check_array(aref, index)
+    data = aref.obj.data
+    if index < 0 or index >= len(data):
+        InsUtils.check_array(aref, index)
+    slots[top - 1] = data[index]
+    operand_stack.top_index = top
+
+
+def xaload_wide(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 1
+    index = slots[top]
+    aref = slots[top - 1]
+    if aref is None or aref.obj is None:
+        InsUtils.check_array(aref, index)
+    data = aref.obj.data
+    if index < 0 or index >= len(data):
+        InsUtils.check_array(aref, index)
+    slots[top - 1] = data[index]
+    slots[top] = None
+
+
+# size 是这条指令弹出的 slot 数: 数组，下标，值 (long / double 两个 slot)
+# convert 把 int 截断成 char / short 数组元素的范围
+def xastore(size, convert):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - size
+        aref = slots[top]
+        index = slots[top + 1]
+        if aref is None or aref.obj is None:
+            InsUtils.check_array(aref, index)
+        data = aref.obj.data
+        if index < 0 or index >= len(data):
+            InsUtils.check_array(aref, index)
+        if convert is None:
+            data[index] = slots[top + 2]
+        else:
+            data[index] = convert(slots[top + 2])
+        operand_stack.top_index = top
+    return execute
+
+
+# byte 和 boolean 数组共用 bastore，boolean 只保留最低位
+def bastore(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 3
+    aref = slots[top]
+    index = slots[top + 1]
+    data = InsUtils.check_array(aref, index)
+    if aref.obj.atype == JArray.T_BOOLEAN:
+        data[index] = slots[top + 2] & 1
+    else:
+        data[index] = math_utils.i2b(slots[top + 2])
+    operand_stack.top_index = top
+
+
+def aastore(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 3
+    aref = slots[top]
+    index = slots[top + 1]
+    value = slots[top + 2]
+    if aref is None or aref.obj is None:
+        InsUtils.check_array(aref, index)
+    data = aref.obj.data
+    if index < 0 or index >= len(data):
+        InsUtils.check_array(aref, index)
+    data[index] = value
+    operand_stack.top_index = top
+    if GC.barrier_enabled:
+        GC.write_barrier(aref, value)
+
+
+def arraylength(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 1
+    ref = slots[top]
+    if ref is None or ref.obj is None:
+        error_handler.rise_null_point_error()
+    obj = ref.obj
+    if not isinstance(obj, JArray):
+        error_handler.rise_runtime_error('!!! not array !!!')
+    slots[top] = obj.length
+
+
+# ---------------- 操作数栈 ----------------
+
+def pop(frame):
+    frame.operand_stack.top_index -= 1
+
+
+def pop2(frame):
+    frame.operand_stack.top_index -= 2
+
+
+def dup(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index
+    slots[top] = slots[top - 1]
+    operand_stack.top_index = top + 1
+
+
+# ..., value2, value1 -> ..., value1, value2, value1
+def dup_x1(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index
+    value1 = slots[top - 1]
+    slots[top - 1] = slots[top - 2]
+    slots[top - 2] = value1
+    slots[top] = value1
+    operand_stack.top_index = top + 1
+
+
+# ..., value3, value2, value1 -> ..., value1, value3, value2, value1
+def dup_x2(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index
+    value1 = slots[top - 1]
+    slots[top - 1] = slots[top - 2]
+    slots[top - 2] = slots[top - 3]
+    slots[top - 3] = value1
+    slots[top] = value1
+    operand_stack.top_index = top + 1
+
+
+def dup2(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index
+    slots[top] = slots[top - 2]
+    slots[top + 1] = slots[top - 1]
+    operand_stack.top_index = top + 2
+
+
+# ..., value3, value2, value1 -> ..., value2, value1, value3, value2, value1
+def dup2_x1(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index
+    value1 = slots[top - 1]
+    value2 = slots[top - 2]
+    value3 = slots[top - 3]
+    slots[top - 3] = value2
+    slots[top - 2] = value1
+    slots[top - 1] = value3
+    slots[top] = value2
+    slots[top + 1] = value1
+    operand_stack.top_index = top + 2
+
+
+# ..., value4, value3, value2, value1 -> ..., value2, value1, value4, value3, value2, value1
+def dup2_x2(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index
+    value1 = slots[top - 1]
+    value2 = slots[top - 2]
+    value3 = slots[top - 3]
+    value4 = slots[top - 4]
+    slots[top - 4] = value2
+    slots[top - 3] = value1
+    slots[top - 2] = value4
+    slots[top - 1] = value3
+    slots[top] = value2
+    slots[top + 1] = value1
+    operand_stack.top_index = top + 2
+
+
+def swap(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index
+    slots[top - 1], slots[top - 2] = slots[top - 2], slots[top - 1]
+
+
+# ---------------- 运算 ----------------
+# 最常用的 int 加减乘直接写出回绕 (math_utils.to_int)，其余的按操作数占的 slot 数套用 fn
+
+def iadd(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 1
+    slots[top - 1] = ((slots[top - 1] + slots[top] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+    operand_stack.top_index = top
+
+
+def isub(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 1
+    slots[top - 1] = ((slots[top - 1] - slots[top] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+    operand_stack.top_index = top
+
+
+def imul(frame):
+    operand_stack = frame.operand_stack
+    slots = operand_stack.slots
+    top = operand_stack.top_index - 1
+    slots[top - 1] = ((slots[top - 1] * slots[top] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+    operand_stack.top_index = top
+
+
+# int / float: value1, value2 -> result
+def binary(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 1
+        slots[top - 1] = fn(slots[top - 1], slots[top])
+        operand_stack.top_index = top
+    return execute
+
+
+# long / double: value1, _, value2, _ -> result, _
+def binary_wide(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 2
+        slots[top - 2] = fn(slots[top - 2], slots[top])
+        operand_stack.top_index = top
+    return execute
+
+
+# long 移位: value1, _, int -> result, _
+def shift_wide(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 1
+        slots[top - 2] = fn(slots[top - 2], slots[top])
+        operand_stack.top_index = top
+    return execute
+
+
+# lcmp / dcmpx: value1, _, value2, _ -> int
+def compare_wide(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 4
+        slots[top] = fn(slots[top], slots[top + 2])
+        operand_stack.top_index = top + 1
+    return execute
+
+
+# 占一个 slot 的值原地转换
+def unary(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 1
+        slots[top] = fn(slots[top])
+    return execute
+
+
+def unary_wide(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 2
+        slots[top] = fn(slots[top])
+    return execute
+
+
+# int / float 转成 long / double
+def widen(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index
+        slots[top - 1] = fn(slots[top - 1])
+        slots[top] = None
+        operand_stack.top_index = top + 1
+    return execute
+
+
+# long / double 转成 int / float
+def narrow(fn):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 1
+        slots[top - 1] = fn(slots[top - 1])
+        operand_stack.top_index = top
+    return execute
+
+
+# 整数除法和取余先检查除数
+def checked(fn):
+    def compute(val1, val2):
+        if val2 == 0:
+            error_handler.rise_runtime_error('java.lang.ArithmeticException: / by zero')
+        return fn(val1, val2)
+    return compute
+
+
+def lcmp(val1, val2):
+    if val1 > val2:
+        return 1
+    if val1 < val2:
+        return -1
+    return 0
+
+
+# ---------------- 跳转 ----------------
+# 目标在解码时算成绝对 pc，只有向后跳转 (循环的回边) 检查安全点，和 JUMP_INC.jump_by 一致
+
+def goto(ins, pc, method):
+    target = pc + ins.branch
+    if ins.branch > 0:
+        def execute(frame):
+            frame.pc = target
+    else:
+        def execute(frame):
+            frame.pc = target
+            if GC.safepoint_poll:
+                GC.safepoint()
+    return execute
+
+
+# value 和 0 比较
+def if_zero(compare):
+    def factory(ins, pc, method):
+        target = pc + ins.branch
+        backward = ins.branch <= 0
+
+        def execute(frame):
+            operand_stack = frame.operand_stack
+            top = operand_stack.top_index - 1
+            operand_stack.top_index = top
+            if compare(operand_stack.slots[top], 0):
+                frame.pc = target
+                if backward and GC.safepoint_poll:
+                    GC.safepoint()
+        return execute
+    return factory
+
+
+# if_icmpxx / if_acmpxx: value1, value2
+def if_compare(compare):
+    def factory(ins, pc, method):
+        target = pc + ins.branch
+        backward = ins.branch <= 0
+
+        def execute(frame):
+            operand_stack = frame.operand_stack
+            slots = operand_stack.slots
+            top = operand_stack.top_index - 2
+            operand_stack.top_index = top
+            if compare(slots[top], slots[top + 1]):
+                frame.pc = target
+                if backward and GC.safepoint_poll:
+                    GC.safepoint()
+        return execute
+    return factory
+
+
+def is_null(ref, _):
+    return ref is None or ref.obj is None
+
+
+def is_not_null(ref, _):
+    return ref is not None and ref.obj is not None
+
+
+def switch_to(frame, target, pc):
+    frame.pc = target
+    if target <= pc and GC.safepoint_poll:
+        GC.safepoint()
+
+
+def tableswitch(ins, pc, method):
+    low = ins.low
+    high = ins.high
+    default = pc + ins.default
+    targets = [pc + offset for offset in ins.offsets]
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - 1
+        operand_stack.top_index = top
+        index = operand_stack.slots[top]
+        if low <= index <= high:
+            switch_to(frame, targets[index - low], pc)
+        else:
+            switch_to(frame, default, pc)
+    return execute
+
+
+def lookupswitch(ins, pc, method):
+    default = pc + ins.default
+    targets = dict((key, pc + offset) for key, offset in ins.pairs.items())
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - 1
+        operand_stack.top_index = top
+        switch_to(frame, targets.get(operand_stack.slots[top], default), pc)
+    return execute
+
+
+def athrow(ins, pc, method):
+    def execute(frame):
+        instruction.ATHROW.throw(frame, pc)
+        return True
+    return execute
+
+
+# ---------------- 方法调用和返回 ----------------
+
+# 解析好的方法: native 方法的 handler 就是 native 本身 (不换 frame，返回 None)，否则新建 frame 并按 slot 拷贝参数
+def call(n_method):
+    if n_method.native is not None:
+        return n_method.native
+    if n_method.code is None:
+        def execute(frame):
+            error_handler.rise_abstract_method_error()
+        return execute
+    count = n_method.invoke_slot_count
+
+    def execute(frame):
+        thread = frame.thread
+        n_frame = thread.new_frame(n_method)
+        thread.add_frame(n_frame)
+        if count:
+            operand_stack = frame.operand_stack
+            top = operand_stack.top_index
+            start = top - count
+            n_frame.local_vars.slots[0:count] = operand_stack.slots[start:top]
+            operand_stack.top_index = start
+        if GC.safepoint_poll:  # 方法进入是安全点
+            GC.safepoint()
+        return True
+    return execute
+
+
+# invokestatic / invokespecial 的目标不随接收者变化，解析一次之后直接调用
+def invoke_resolved(ins, pc, method):
+    def resolve(frame):
+        n_method_ref = method.jclass.constant_pool.constants[ins.index]
+        handler = call(n_method_ref.resolve_method(method.jclass.class_loader))
+        quicken(method, pc, ins.next_pc, handler)
+        return handler(frame)
+    return resolve
+
+
+def invokevirtual(ins, pc, method):
+    n_method_ref = method.jclass.constant_pool.constants[ins.index]
+    arg_index = n_method_ref.arg_slot_count + 1
+    inline_cache = InlineCache.new_cache(method, pc)
+    find_method = instruction.INVOKEVIRTUAL.find_method
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        ref = operand_stack.slots[operand_stack.top_index - arg_index]
+        if ref is None or ref.obj is None:
+            error_handler.rise_null_point_error()
+        jclass = ref.obj.jclass
+        n_method = inline_cache.lookup(jclass)
+        if n_method is None:
+            n_method = find_method(n_method_ref, method.jclass.class_loader, jclass)
+            inline_cache.update(jclass, n_method)
+        InsUtils.invoke(frame, n_method)
+        return True
+    return execute
+
+
+def invokeinterface(ins, pc, method):
+    n_method_ref = method.jclass.constant_pool.constants[ins.index]
+    arg_index = n_method_ref.arg_slot_count + 1
+    inline_cache = InlineCache.new_cache(method, pc)
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        ref = operand_stack.slots[operand_stack.top_index - arg_index]
+        if ref is None or ref.obj is None:
+            error_handler.rise_null_point_error()
+        jclass = ref.obj.jclass
+        n_method = inline_cache.lookup(jclass)
+        if n_method is None:
+            n_method = n_method_ref.find_interface_method(method.jclass.class_loader, jclass)
+            inline_cache.update(jclass, n_method)
+        InsUtils.invoke(frame, n_method)
+        return True
+    return execute
+
+
+# ireturn / freturn / areturn
+def xreturn(frame):
+    operand_stack = frame.operand_stack
+    value = operand_stack.slots[operand_stack.top_index - 1]
+    thread = frame.thread
+    thread.pop_frame()
+    c_stack = thread.top_frame().operand_stack
+    top = c_stack.top_index
+    c_stack.slots[top] = value
+    c_stack.top_index = top + 1
+    if GC.safepoint_poll:  # 方法返回是安全点
+        GC.safepoint()
+    return True
+
+
+# lreturn / dreturn
+def xreturn_wide(frame):
+    operand_stack = frame.operand_stack
+    value = operand_stack.slots[operand_stack.top_index - 2]
+    thread = frame.thread
+    thread.pop_frame()
+    c_stack = thread.top_frame().operand_stack
+    c_slots = c_stack.slots
+    top = c_stack.top_index
+    c_slots[top] = value
+    c_slots[top + 1] = None
+    c_stack.top_index = top + 2
+    if GC.safepoint_poll:
+        GC.safepoint()
+    return True
+
+
+def vreturn(frame):
+    frame.thread.pop_frame()
+    if GC.safepoint_poll:
+        GC.safepoint()
+    return True
+
+
+# ---------------- 字段 ----------------
+
+def is_wide(ftype):
+    return ftype == InsUtils.TYPE_LONG or ftype == InsUtils.TYPE_DOUBLE
+
+
+# 解析用 GETFIELD / PUTFIELD 自己的 resolve，和 debug 模式得到同样的下标
+def getfield(ins, pc, method):
+    def resolve(frame):
+        field_index = ins.field_index
+        if field_index is None:
+            field_index = ins.resolve(frame)
+        handler = getfield_resolved(field_index, ins.wide)
+        quicken(method, pc, ins.next_pc, handler)
+        return handler(frame)
+    return resolve
+
+
+def getfield_resolved(field_index, wide):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 1
+        ref = slots[top]
+        if ref is None or ref.obj is None:
+            error_handler.rise_null_point_error()
+        slots[top] = ref.obj.data[field_index]
+        if wide:
+            slots[top + 1] = None
+            operand_stack.top_index = top + 2
+    return execute
+
+
+def putfield(ins, pc, method):
+    def resolve(frame):
+        field_index = ins.field_index
+        if field_index is None:
+            field_index = ins.resolve(frame)
+        handler = putfield_resolved(field_index, 3 if ins.wide else 2, ins.is_ref)
+        quicken(method, pc, ins.next_pc, handler)
+        return handler(frame)
+    return resolve
+
+
+# size 是弹出的 slot 数: 对象和值 (long / double 两个 slot)
+def putfield_resolved(field_index, size, is_ref):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - size
+        ref = slots[top]
+        if ref is None or ref.obj is None:
+            error_handler.rise_runtime_error('java.lang.NullPointerException ref is null')
+        value = slots[top + 1]
+        ref.obj.data[field_index] = value
+        operand_stack.top_index = top
+        if is_ref and GC.barrier_enabled:
+            GC.write_barrier(ref, value)
+    return execute
+
+
+# 类还没有初始化时先执行 <clinit>，之后重新执行这条指令，类初始化之后才替换 handler
+def resolve_static(ins, pc, frame, method):
+    ref = method.jclass.constant_pool.constants[ins.index]
+    ref.resolve_field(method.jclass.class_loader)
+    jclass = ref.cache_class
+    if not jclass.has_inited:
+        instruction.INNER_INVOKE_C_INIT.invoke(frame, jclass, pc)
+        jclass.has_inited = True
+        return None, None
+    return jclass.static_fields[ref.field.name], InsUtils.get_type_by_descriptor(ref.descriptor)
+
+
+def getstatic(ins, pc, method):
+    def resolve(frame):
+        slot, ftype = resolve_static(ins, pc, frame, method)
+        if slot is None:
+            return True
+        if ftype == InsUtils.TYPE_REF or ftype == InsUtils.TYPE_ARRAY:
+            handler = getstatic_ref(slot)
+        else:
+            handler = getstatic_num(slot, is_wide(ftype))
+        quicken(method, pc, ins.next_pc, handler)
+        return handler(frame)
+    return resolve
+
+
+def getstatic_num(slot, wide):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index
+        slots[top] = slot.num
+        if wide:
+            slots[top + 1] = None
+            operand_stack.top_index = top + 2
+        else:
+            operand_stack.top_index = top + 1
+    return execute
+
+
+def getstatic_ref(slot):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index
+        operand_stack.slots[top] = slot.ref
+        operand_stack.top_index = top + 1
+    return execute
+
+
+def putstatic(ins, pc, method):
+    def resolve(frame):
+        slot, ftype = resolve_static(ins, pc, frame, method)
+        if slot is None:
+            return True
+        if ftype == InsUtils.TYPE_REF or ftype == InsUtils.TYPE_ARRAY:
+            handler = putstatic_ref(slot)
+        else:
+            handler = putstatic_num(slot, 2 if is_wide(ftype) else 1)
+        quicken(method, pc, ins.next_pc, handler)
+        return handler(frame)
+    return resolve
+
+
+def putstatic_num(slot, size):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - size
+        operand_stack.top_index = top
+        slot.num = operand_stack.slots[top]
+    return execute
+
+
+def putstatic_ref(slot):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - 1
+        operand_stack.top_index = top
+        slot.ref = operand_stack.slots[top]
+        if GC.barrier_enabled:
+            GC.static_write_barrier(slot, slot.ref)
+    return execute
+
+
+# ---------------- 对象和类型 ----------------
+
+def new(ins, pc, method):
+    def resolve(frame):
+        class_loader = InsUtils.get_class_loader(frame)
+        jclass = class_loader.load_class(method.jclass.constant_pool.constants[ins.index].class_name)
+        handler = new_resolved(jclass)
+        quicken(method, pc, ins.next_pc, handler)
+        return handler(frame)
+    return resolve
+
+
+def new_resolved(jclass):
+    def execute(frame):
+        ref = JRef.new_object(jclass)
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index
+        operand_stack.slots[top] = ref
+        operand_stack.top_index = top + 1
+    return execute
+
+
+# newarray / anewarray: 数组类第一次执行时加载，之后只分配
+def new_array(class_name, allocate):
+    def factory(ins, pc, method):
+        def resolve(frame):
+            jclass = InsUtils.get_class_loader(frame).load_class(class_name(ins, method))
+            handler = new_array_resolved(jclass, allocate(ins))
+            quicken(method, pc, ins.next_pc, handler)
+            return handler(frame)
+        return resolve
+    return factory
+
+
+def new_array_resolved(jclass, allocate):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - 1
+        operand_stack.top_index = top
+        count = operand_stack.slots[top]
+        InsUtils.check_array_count(count)
+        jref = allocate(jclass, count)
+        operand_stack.slots[top] = jref
+        operand_stack.top_index = top + 1
+    return execute
+
+
+def primitive_array_name(ins, method):
+    return JArray.get_array_jclass_name(ins.atype)
+
+
+def ref_array_name(ins, method):
+    return JArray.get_ref_array_jclass_name(method.jclass.constant_pool.constants[ins.index].class_name)
+
+
+def primitive_array_allocate(ins):
+    atype = ins.atype
+    return lambda jclass, count: JRef.new_array(jclass, atype, count)
+
+
+def ref_array_allocate(ins):
+    return JRef.new_ref_array
+
+
+def multianewarray(ins, pc, method):
+    class_name = method.jclass.constant_pool.constants[ins.index].class_name
+    dimensions = ins.dimensions
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index - dimensions
+        counts = operand_stack.slots[top:top + dimensions]
+        for count in counts:
+            InsUtils.check_array_count(count)
+        operand_stack.top_index = top
+        jref = instruction.MULTIANEWARRAY.new_array(InsUtils.get_class_loader(frame), class_name, counts, frame.thread)
+        operand_stack.slots[top] = jref
+        operand_stack.top_index = top + 1
+    return execute
+
+
+def checkcast(ins, pc, method):
+    class_name = method.jclass.constant_pool.constants[ins.index].class_name
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        ref = operand_stack.slots[operand_stack.top_index - 1]
+        if ref is None:
+            return
+        if not isinstance(ref, JRef):
+            error_handler.rise_runtime_error('checkcast param must be ref')
+        cast_class = ref.obj.jclass
+        if cast_class is not None and cast_class.is_subclass_of(class_name):
+            return
+        error_handler.rise_class_cast_error()
+    return execute
+
+
+def instanceof(ins, pc, method):
+    class_name = method.jclass.constant_pool.constants[ins.index].class_name
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index - 1
+        ref = slots[top]
+        if ref is not None and not isinstance(ref, JRef):
+            error_handler.rise_runtime_error('instance param must be ref')
+        if JRef.check_null(ref):
+            slots[top] = 0
+            return
+        cast_class = ref.obj.jclass
+        if cast_class is not None and cast_class.is_subclass_of(class_name):
+            slots[top] = 1
+        else:
+            slots[top] = 0
+    return execute
+
+
+register_handler(nop, instruction.NOP, instruction.IMPDEP1, instruction.IMPDEP2, instruction.Breakpoint)
+register(lambda ins, pc, method: push(None), instruction.ACONST_NULL)
+register(lambda ins, pc, method: push(ins.get_index()),
+         instruction.ICONST_M1, instruction.ICONST_0, instruction.ICONST_1, instruction.ICONST_2,
+         instruction.ICONST_3, instruction.ICONST_4, instruction.ICONST_5,
+         instruction.FCONST_0, instruction.FCONST_1, instruction.FCONST_2)
+register(lambda ins, pc, method: push_wide(ins.get_index()),
+         instruction.LCONST_0, instruction.LCONST_1, instruction.DCONST_0, instruction.DCONST_1)
+register(lambda ins, pc, method: push(ins.byte), instruction.BIPUSH, instruction.SIPUSH)
+register(ldc, instruction.LDC, instruction.LDC_W)
+register(ldc2_w, instruction.LDC2_W)
+
+register(lambda ins, pc, method: load(ins.index), instruction.ILOAD, instruction.FLOAD, instruction.ALOAD)
+register(lambda ins, pc, method: load(ins.get_index()),
+         instruction.ILOAD_0, instruction.ILOAD_1, instruction.ILOAD_2, instruction.ILOAD_3,
+         instruction.FLOAD_0, instruction.FLOAD_1, instruction.FLOAD_2, instruction.FLOAD_3,
+         instruction.ALOAD_0, instruction.ALOAD_1, instruction.ALOAD_2, instruction.ALOAD_3)
+register(lambda ins, pc, method: load_wide(ins.get_index()),
+         instruction.LLOAD, instruction.LLOAD_0, instruction.LLOAD_1, instruction.LLOAD_2, instruction.LLOAD_3,
+         instruction.DLOAD, instruction.DLOAD_0, instruction.DLOAD_1, instruction.DLOAD_2, instruction.DLOAD_3)
+register(lambda ins, pc, method: store(ins.index), instruction.ASTORE)
+register(lambda ins, pc, method: store(ins.get_index()),
+         instruction.ISTORE, instruction.ISTORE_0, instruction.ISTORE_1, instruction.ISTORE_2, instruction.ISTORE_3,
+         instruction.FSTORE, instruction.FSTORE_0, instruction.FSTORE_1, instruction.FSTORE_2, instruction.FSTORE_3,
+         instruction.ASTORE_0, instruction.ASTORE_1, instruction.ASTORE_2, instruction.ASTORE_3)
+register(lambda ins, pc, method: store_wide(ins.get_index()),
+         instruction.LSTORE, instruction.LSTORE_0, instruction.LSTORE_1, instruction.LSTORE_2, instruction.LSTORE_3,
+         instruction.DSTORE, instruction.DSTORE_0, instruction.DSTORE_1, instruction.DSTORE_2, instruction.DSTORE_3)
+register(lambda ins, pc, method: iinc(ins.index, ins.const), instruction.IINC)
+register(wide, instruction.WIDE)
+
+register_handler(xaload, instruction.IALOAD, instruction.FALOAD, instruction.AALOAD, instruction.BALOAD,
+                 instruction.CALOAD, instruction.SALOAD)
+register_handler(xaload_wide, instruction.LALOAD, instruction.DALOAD)
+register_handler(xastore(3, None), instruction.IASTORE, instruction.FASTORE)
+register_handler(xastore(4, None), instruction.LASTORE, instruction.DASTORE)
+register_handler(xastore(3, math_utils.i2c), instruction.CASTORE)
+register_handler(xastore(3, math_utils.i2s), instruction.SASTORE)
+register_handler(bastore, instruction.BASTORE)
+register_handler(aastore, instruction.AASTORE)
+register_handler(arraylength, instruction.ARRAY_LENGTH)
+
+register_handler(pop, instruction.POP)
+register_handler(pop2, instruction.POP2)
+register_handler(dup, instruction.DUP)
+register_handler(dup_x1, instruction.DUP_X1)
+register_handler(dup_x2, instruction.DUP_X2)
+register_handler(dup2, instruction.DUP2)
+register_handler(dup2_x1, instruction.DUP2_X1)
+register_handler(dup2_x2, instruction.DUP2_X2)
+register_handler(swap, instruction.SWAP)
+
+register_handler(iadd, instruction.IADD)
+register_handler(isub, instruction.ISUB)
+register_handler(imul, instruction.IMUL)
+register_handler(binary(checked(math_utils.idiv)), instruction.IDIV)
+register_handler(binary(checked(math_utils.irem)), instruction.IREM)
+register_handler(binary(operator.and_), instruction.IAND)
+register_handler(binary(operator.or_), instruction.IOR)
+register_handler(binary(operator.xor), instruction.IXOR)
+register_handler(binary(math_utils.ishl), instruction.ISHL)
+register_handler(binary(math_utils.ishr), instruction.ISHR)
+register_handler(binary(math_utils.iushr), instruction.IUSHR)
+register_handler(unary(lambda val: math_utils.to_int(-val)), instruction.INEG)
+register_handler(binary_wide(lambda val1, val2: math_utils.to_long(val1 + val2)), instruction.LADD)
+register_handler(binary_wide(lambda val1, val2: math_utils.to_long(val1 - val2)), instruction.LSUB)
+register_handler(binary_wide(lambda val1, val2: math_utils.to_long(val1 * val2)), instruction.LMUL)
+register_handler(binary_wide(checked(math_utils.ldiv)), instruction.LDIV)
+register_handler(binary_wide(checked(math_utils.lrem)), instruction.LREM)
+register_handler(binary_wide(operator.and_), instruction.LAND)
+register_handler(binary_wide(operator.or_), instruction.LOR)
+register_handler(binary_wide(operator.xor), instruction.LXOR)
+register_handler(shift_wide(math_utils.lshl), instruction.LSHL)
+register_handler(shift_wide(math_utils.lshr), instruction.LSHR)
+register_handler(shift_wide(math_utils.lushr), instruction.LUSHR)
+register_handler(unary_wide(lambda val: math_utils.to_long(-val)), instruction.LNEG)
+register_handler(binary(lambda val1, val2: math_utils.to_float(val1 + val2)), instruction.FADD)
+register_handler(binary(lambda val1, val2: math_utils.to_float(val1 - val2)), instruction.FSUB)
+register_handler(binary(lambda val1, val2: math_utils.to_float(val1 * val2)), instruction.FMUL)
+register_handler(binary(lambda val1, val2: math_utils.to_float(math_utils.fdiv(val1, val2))), instruction.FDIV)
+register_handler(binary(lambda val1, val2: math_utils.to_float(math_utils.frem(val1, val2))), instruction.FREM)
+register_handler(unary(operator.neg), instruction.FNEG)
+register_handler(binary_wide(operator.add), instruction.DADD)
+register_handler(binary_wide(operator.sub), instruction.DSUB)
+register_handler(binary_wide(operator.mul), instruction.DMUL)
+register_handler(binary_wide(math_utils.fdiv), instruction.DDIV)
+register_handler(binary_wide(math_utils.frem), instruction.DREM)
+register_handler(unary_wide(operator.neg), instruction.DNEG)
+
+register_handler(widen(int), instruction.I2L)
+register_handler(unary(math_utils.to_float), instruction.I2F)
+register_handler(widen(float), instruction.I2D)
+register_handler(narrow(math_utils.to_int), instruction.L2I)
+register_handler(narrow(math_utils.to_float), instruction.L2F)
+register_handler(unary_wide(float), instruction.L2D)
+register_handler(unary(math_utils.f2i), instruction.F2I)
+register_handler(widen(math_utils.f2l), instruction.F2L)
+register_handler(widen(float), instruction.F2D)
+register_handler(narrow(math_utils.f2i), instruction.D2I)
+register_handler(unary_wide(math_utils.f2l), instruction.D2L)
+register_handler(narrow(math_utils.to_float), instruction.D2F)
+register_handler(unary(math_utils.i2b), instruction.I2B)
+register_handler(unary(math_utils.i2c), instruction.I2C)
+register_handler(unary(math_utils.i2s), instruction.I2S)
+register_handler(compare_wide(lcmp), instruction.LCMP)
+register_handler(binary(lambda val1, val2: math_utils.fcmp(val1, val2, -1)), instruction.FCMPL)
+register_handler(binary(lambda val1, val2: math_utils.fcmp(val1, val2, 1)), instruction.FCMPD)
+register_handler(compare_wide(lambda val1, val2: math_utils.fcmp(val1, val2, -1)), instruction.DCMPL)
+register_handler(compare_wide(lambda val1, val2: math_utils.fcmp(val1, val2, 1)), instruction.DCMPD)
+
+register(goto, instruction.GOTO, instruction.GOTO_W)
+register(if_zero(operator.eq), instruction.IFEQ)
+register(if_zero(operator.ne), instruction.IFNE)
+register(if_zero(operator.lt), instruction.IFLT)
+register(if_zero(operator.ge), instruction.IFGE)
+register(if_zero(operator.gt), instruction.IFGT)
+register(if_zero(operator.le), instruction.IFLE)
+register(if_zero(is_null), instruction.IF_NULL)
+register(if_zero(is_not_null), instruction.IF_NON_NULL)
+register(if_compare(operator.eq), instruction.IF_ICMPEQ)
+register(if_compare(operator.ne), instruction.IF_ICMPNE)
+register(if_compare(operator.lt), instruction.IF_ICMPLT)
+register(if_compare(operator.ge), instruction.IF_ICMPGE)
+register(if_compare(operator.gt), instruction.IF_ICMPGT)
+register(if_compare(operator.le), instruction.IF_ICMPLE)
+register(if_compare(operator.is_), instruction.IF_ACMPEQ)
+register(if_compare(operator.is_not), instruction.IF_ACMPNE)
+register(tableswitch, instruction.TABLE_SWITCH)
+register(lookupswitch, instruction.LOOK_UP_SWITCH)
+register(athrow, instruction.ATHROW)
+
+register(invoke_resolved, instruction.INVOKESTATIC, instruction.INVOKESPECIAL)
+register(invokevirtual, instruction.INVOKEVIRTUAL)
+register(invokeinterface, instruction.INVOKEINTERFACE)
+register_handler(xreturn, instruction.IRETURN, instruction.FRETURN, instruction.ARETURN)
+register_handler(xreturn_wide, instruction.LRETURN, instruction.DRETURN)
+register_handler(vreturn, instruction.RETURN)
+
+register(getfield, instruction.GETFIELD)
+register(putfield, instruction.PUTFIELD)
+register(getstatic, instruction.GETSTATIC)
+register(putstatic, instruction.PUTSTATIC)
+register(new, instruction.NEW)
+register(new_array(primitive_array_name, primitive_array_allocate), instruction.NEWARRAY)
+register(new_array(ref_array_name, ref_array_allocate), instruction.ANEWARRAY)
+register(multianewarray, instruction.MULTIANEWARRAY)
+register(checkcast, instruction.CHECK_CAST)
+register(instanceof, instruction.INSTANCE_OF)
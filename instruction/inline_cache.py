@@ -0,0 +1,73 @@
+# coding=utf-8
+
+
+# invokevirtual / invokeinterface 调用点的内联缓存，每个方法的每个 pc 一个
+# 缓存最近的 (接收者 JClass -> Method)，接收者类型超过 MAX_ENTRIES 个之后变成 megamorphic，
+# 不再缓存，每次都查虚方法表
+# 计数器只用来观察调用点的情况，多线程下不加锁，可能有少量误差
+class InlineCache(object):
+    MAX_ENTRIES = 4
+
+    all_caches = []
+
+    __slots__ = ('site', 'entries', 'megamorphic', 'hits', 'misses', 'megamorphic_calls')
+
+    def __init__(self, site):
+        self.site = site
+        self.entries = {}
+        self.megamorphic = False
+        self.hits = 0
+        self.misses = 0
+        self.megamorphic_calls = 0
+
+    @staticmethod
+    def new_cache(method, pc):
+        site = '%s.%s%s @%d' % (method.jclass.name, method.name, method.descriptor, pc)
+        cache = InlineCache(site)
+        InlineCache.all_caches.append(cache)
+        return cache
+
+    # 没有命中返回 None，由调用方查虚方法表后 update
+    def lookup(self, jclass):
+        if self.megamorphic:
+            self.megamorphic_calls += 1
+            return None
+        method = self.entries.get(jclass)
+        if method is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return method
+
+    def update(self, jclass, method):
+        if self.megamorphic:
+            return
+        if len(self.entries) >= InlineCache.MAX_ENTRIES:
+            self.megamorphic = True
+            self.entries.clear()
+            return
+        self.entries[jclass] = method
+
+    def calls(self):
+        return self.hits + self.misses + self.megamorphic_calls
+
+    def state(self):
+        if self.megamorphic:
+            return 'megamorphic'
+        if len(self.entries) > 1:
+            return 'polymorphic'
+        return 'monomorphic'
+
+    @staticmethod
+    def print_stats():
+        caches = sorted(InlineCache.all_caches, key=lambda c: c.calls(), reverse=True)
+        print('=================== inline cache =====================')
+        print('%10s %8s %8s %8s  %-12s %s' % ('calls', 'hit%', 'miss%', 'mega%', 'state', 'site'))
+        for cache in caches:
+            calls = cache.calls()
+            if calls == 0:
+                continue
+            print('%10d %7.1f%% %7.1f%% %7.1f%%  %-12s %s' % (calls, 100.0 * cache.hits / calls,
+                                                          100.0 * cache.misses / calls,
+                                                          100.0 * cache.megamorphic_calls / calls,
+                                                          cache.state(), cache.site))
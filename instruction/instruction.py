@@ -2,14 +2,14 @@
 
 import abc
 import ctypes
-import struct
 
-from runtime.thread import Frame, LocalVars
-from runtime.jclass import ClassLoader, JString, JDouble, JLong, JClass, JFloat, JInteger
+from runtime.jclass import ClassLoader, Method, JString, JDouble, JLong, JClass, JFloat, JInteger
 from runtime.jobject import JObject, JArray, JRef
-from base.utils import print_utils, common_utils, error_handler
+from base.utils import print_utils, common_utils, error_handler, math_utils
 from interpreter.code_parser import CodeParser
-from jthread.jthread import JThread
+from instruction.inline_cache import InlineCache
+from instruction import intrinsics, natives  # 注册 native 方法的实现，要在加载类之前导入
+from jgc.gc import GC
 
 '''
 以下指令没有测试
@@ -28,10 +28,8 @@ swap
 未实现指令
 jsr
 ret
-invokeinterface	
 monitorenter
 monitorexit
-multianewarray
 jsr_w
 breakpoint
 impdep1
@@ -65,22 +63,85 @@ class InsUtils(object):
         else:
             return InsUtils.TYPE_UNKNOWN
 
+    # newarray / anewarray / multianewarray 的长度
+    @staticmethod
+    def check_array_count(count):
+        if count < 0:
+            error_handler.rise_runtime_error('java.lang.NegativeArraySizeException: %d' % count)
+
+    # 方法所在类的类加载器，没有的话新建一个
+    @staticmethod
+    def get_class_loader(frame):
+        class_loader = frame.method.jclass.class_loader
+        if class_loader is None:
+            class_loader = ClassLoader()
+            frame.method.jclass.class_loader = class_loader
+        return class_loader
+
+    # 数组读写前检查 null 和下标，返回数组的元素 (array.array 或者 list)
+    @staticmethod
+    def check_array(aref, index):
+        if aref is None or aref.obj is None:
+            error_handler.rise_null_point_error()
+        data = aref.obj.data
+        if index < 0 or index >= len(data):
+            error_handler.rise_runtime_error('java.lang.ArrayIndexOutOfBoundsException: %d' % index)
+        return data
+
+    # 实例字段在对象里的下标 (JClass.build_field_layout)
+    @staticmethod
+    def resolve_field_index(frame, field_ref):
+        field = field_ref.resolve_field(frame.method.jclass.class_loader)
+        if field is None or field.index is None:
+            error_handler.rise_runtime_error('java.lang.NoSuchFieldError: ' + field_ref.name)
+        return field.index
+
     @staticmethod
     def check_ref_null(ref):
         if JRef.check_null(ref):
             error_handler.rise_null_point_error()
 
+    # 调用解析好的方法: native 方法直接在调用方的操作数栈上执行，否则新建 frame 并传参
+    # 既不是 native 也没有字节码的是抽象方法
+    @staticmethod
+    def invoke(frame, n_method):
+        native = n_method.native
+        if native is not None:
+            native(frame)
+            return
+        if n_method.code is None:
+            error_handler.rise_abstract_method_error()
+        n_frame = frame.thread.new_frame(n_method)
+        frame.thread.add_frame(n_frame)
+        InsUtils.pass_args(frame, n_frame, n_method)
+        if GC.safepoint_poll:  # 方法进入是安全点
+            GC.safepoint()
+
+    # 操作数栈和局部变量表的 slot 布局一致 (long / double 都占两个 slot)，
+    # 参数 (包括 this) 直接按 slot 整段拷贝到被调方法局部变量表的开头
+    @staticmethod
+    def pass_args(frame, n_frame, n_method):
+        count = n_method.invoke_slot_count
+        if count == 0:
+            return
+        operand_stack = frame.operand_stack
+        top = operand_stack.top_index
+        start = top - count
+        n_frame.local_vars.slots[0:count] = operand_stack.slots[start:top]
+        operand_stack.top_index = start
+
 
 class Instruction(object):
     code = None  # 字节码
     name = None  # 助记符
+    next_pc = 0  # 解码后下一条指令的 pc
 
     def read_operands(self, code_parser):
         pass
 
+    # 只在 trace 模式下使用
     def execute_wrapper(self, frame):
-        hex_code = '%x' % self.code
-        print_utils.print_jvm_status('execute ins: ' + self.name + '  ' + hex_code + '   ' + str(frame) + '\n')
+        print_utils.print_ins_trace(frame.thread, frame, self)
         self.execute(frame)
 
     @abc.abstractmethod
@@ -100,15 +161,20 @@ class INNER_INVOKE_C_INIT(INNER_INS):
         self.jclass = jclass
 
     def execute(self, frame):
+        INNER_INVOKE_C_INIT.invoke(frame, self.jclass, frame.thread.pc)
+
+    # pc 是触发初始化的 getstatic / putstatic，初始化之后 (或者没有 <clinit>) 重新执行这条指令
+    @staticmethod
+    def invoke(frame, jclass, pc):
         method = None
-        for m in self.jclass.methods:
+        for m in jclass.methods:
             if m.name == '<clinit>':
                 method = m
                 break
         if method is not None:
-            n_frame = Frame(frame.thread, method)
+            n_frame = frame.thread.new_frame(method)
             frame.thread.add_frame(n_frame)
-            frame.pc = frame.thread.pc
+        frame.pc = pc
 
 
 class ACONST_NULL(Instruction):
@@ -182,10 +248,12 @@ class ARETURN(Instruction):
     name = 'areturn'
 
     def execute(self, frame):
-        frame.thread.pop_frame()
         r_value = frame.operand_stack.pop_ref()
+        frame.thread.pop_frame()
         c_frame = frame.thread.top_frame()
         c_frame.operand_stack.push_ref(r_value)
+        if GC.safepoint_poll:  # 方法返回是安全点
+            GC.safepoint()
 
 
 class ASTORE(Instruction):
@@ -255,22 +323,20 @@ class BIPUSH(Instruction):
         self.byte = 0
 
     def read_operands(self, code_parser):
-        self.byte = code_parser.read_op()
+        self.byte = ctypes.c_byte(code_parser.read_op()).value
 
     def execute(self, frame):
-        frame.operand_stack.push_int(ctypes.c_byte(self.byte).value)
+        frame.operand_stack.push_int(self.byte)
 
 
+# long 和 double 在操作数栈上占两个 slot，所以 dup 系列指令只需要按 slot 搬运，不用关心类型
 class DUP(Instruction):
     code = 0x59
     name = 'dup'
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        value = operand_stack.top()
-        if isinstance(value, JRef):
-            value = value.clone()
-        operand_stack.push(value)
+        operand_stack.push(operand_stack.top())
 
 
 class DUP_X1(Instruction):
@@ -279,12 +345,9 @@ class DUP_X1(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        value1 = operand_stack.top()
-        value2 = operand_stack.top(2)
-        if isinstance(value1, JRef):
-            value1 = value1.clone()
-        if isinstance(value2, JRef):
-            value1 = value2.clone()
+        value1 = operand_stack.pop()
+        value2 = operand_stack.pop()
+        operand_stack.push(value1)
         operand_stack.push(value2)
         operand_stack.push(value1)
 
@@ -295,24 +358,13 @@ class DUP_X2(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        value1 = operand_stack.top()
-        value2 = operand_stack.top(2)
-        if operand_stack.is_top_type1(2):
-            if isinstance(value1, JRef):
-                value1 = value1.clone()
-            operand_stack.push(value2)
-            operand_stack.push(value1)
-        else:
-            value3 = operand_stack.top(3)
-            if isinstance(value1, JRef):
-                value1 = value1.clone()
-            if isinstance(value2, JRef):
-                value1 = value2.clone()
-            if isinstance(value3, JRef):
-                value1 = value3.clone()
-            operand_stack.push(value3)
-            operand_stack.push(value2)
-            operand_stack.push(value1)
+        value1 = operand_stack.pop()
+        value2 = operand_stack.pop()
+        value3 = operand_stack.pop()
+        operand_stack.push(value1)
+        operand_stack.push(value3)
+        operand_stack.push(value2)
+        operand_stack.push(value1)
 
 
 class DUP2(Instruction):
@@ -321,18 +373,10 @@ class DUP2(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        value = operand_stack.top()
-        if operand_stack.is_top_type1():
-            operand_stack.push(value)
-            return
-
-        value2 = operand_stack.top(2)
-        if isinstance(value, JRef):
-            value = value.clone()
-        if isinstance(value2, JRef):
-            value = value.clone()
+        value1 = operand_stack.top()
+        value2 = operand_stack.top(1)
         operand_stack.push(value2)
-        operand_stack.push(value)
+        operand_stack.push(value1)
 
 
 class DUP2_X1(Instruction):
@@ -341,24 +385,14 @@ class DUP2_X1(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        value1 = operand_stack.top()
-        value2 = operand_stack.top(2)
-        if operand_stack.is_top_type1():
-            if isinstance(value2, JRef):
-                value1 = value2.clone()
-            operand_stack.push(value2)
-            operand_stack.push(value1)
-        else:
-            value3 = operand_stack.top(3)
-            if isinstance(value1, JRef):
-                value1 = value1.clone()
-            if isinstance(value2, JRef):
-                value1 = value2.clone()
-            if isinstance(value3, JRef):
-                value1 = value3.clone()
-            operand_stack.push(value3)
-            operand_stack.push(value2)
-            operand_stack.push(value1)
+        value1 = operand_stack.pop()
+        value2 = operand_stack.pop()
+        value3 = operand_stack.pop()
+        operand_stack.push(value2)
+        operand_stack.push(value1)
+        operand_stack.push(value3)
+        operand_stack.push(value2)
+        operand_stack.push(value1)
 
 
 class DUP2_X2(Instruction):
@@ -367,33 +401,16 @@ class DUP2_X2(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        value1 = operand_stack.top()
-        value2 = operand_stack.top(2)
-        value3 = operand_stack.top(3)
-        if operand_stack.is_top_type1() or operand_stack.is_top_type1(2) or operand_stack.is_top_type1(3):
-            if isinstance(value1, JRef):
-                value1 = value1.clone()
-            if isinstance(value2, JRef):
-                value1 = value2.clone()
-            if isinstance(value3, JRef):
-                value1 = value3.clone()
-            operand_stack.push(value3)
-            operand_stack.push(value2)
-            operand_stack.push(value1)
-        else:
-            value4 = operand_stack.top(4)
-            if isinstance(value1, JRef):
-                value1 = value1.clone()
-            if isinstance(value2, JRef):
-                value1 = value2.clone()
-            if isinstance(value3, JRef):
-                value1 = value3.clone()
-            if isinstance(value4, JRef):
-                value1 = value4.clone()
-            operand_stack.push(value4)
-            operand_stack.push(value3)
-            operand_stack.push(value2)
-            operand_stack.push(value1)
+        value1 = operand_stack.pop()
+        value2 = operand_stack.pop()
+        value3 = operand_stack.pop()
+        value4 = operand_stack.pop()
+        operand_stack.push(value2)
+        operand_stack.push(value1)
+        operand_stack.push(value4)
+        operand_stack.push(value3)
+        operand_stack.push(value2)
+        operand_stack.push(value1)
 
 
 class PUTSTATIC(Instruction):
@@ -433,6 +450,8 @@ class PUTSTATIC(Instruction):
             slot.num = operand_stack.pop_double()
         else:
             slot.ref = operand_stack.pop_ref()
+            if GC.barrier_enabled:
+                GC.static_write_barrier(slot, slot.ref)
 
 
 class GETSTATIC(Instruction):
@@ -480,11 +499,11 @@ class GETSTATIC(Instruction):
 
 
 class JUMP_INC(Instruction):
+    # 向后跳转 (循环的回边) 是安全点
     def jump_by(self, frame, offset):
         frame.pc = frame.thread.pc + offset
-
-    def jump_to(self, frame, pc):
-        frame.pc = pc
+        if offset <= 0 and GC.safepoint_poll:
+            GC.safepoint()
 
 
 class GOTO(JUMP_INC):
@@ -513,11 +532,7 @@ class GOTO_W(JUMP_INC):
         self.branch = 0
 
     def read_operands(self, code_parser):
-        branch1 = code_parser.read_op()
-        branch2 = code_parser.read_op()
-        branch3 = code_parser.read_op()
-        branch4 = code_parser.read_op()
-        self.branch = (branch1 << 24) | (branch2 << 16) | (branch3 << 8) | branch4
+        self.branch = code_parser.read_4byte()
 
     def execute(self, frame):
         self.jump_by(frame, self.branch)
@@ -531,9 +546,8 @@ class IASTORE(Instruction):
         operand_stack = frame.operand_stack
         value = operand_stack.pop_int()
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_item(index, value)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        data[index] = value
 
 
 class IALOAD(Instruction):
@@ -543,10 +557,8 @@ class IALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_int(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_int(data[index])
 
 
 class CASTORE(Instruction):
@@ -557,9 +569,8 @@ class CASTORE(Instruction):
         operand_stack = frame.operand_stack
         value = operand_stack.pop_int()
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_item(index, value)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        data[index] = math_utils.i2c(value)
 
 
 class CALOAD(Instruction):
@@ -569,10 +580,8 @@ class CALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_int(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_int(data[index])
 
 
 class DASTORE(Instruction):
@@ -583,9 +592,8 @@ class DASTORE(Instruction):
         operand_stack = frame.operand_stack
         value = operand_stack.pop_double()
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_item(index, value)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        data[index] = value
 
 
 class DALOAD(Instruction):
@@ -595,10 +603,8 @@ class DALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_double(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_double(data[index])
 
 
 class FASTORE(Instruction):
@@ -609,9 +615,8 @@ class FASTORE(Instruction):
         operand_stack = frame.operand_stack
         value = operand_stack.pop_float()
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_item(index, value)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        data[index] = value
 
 
 class FALOAD(Instruction):
@@ -621,10 +626,8 @@ class FALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_float(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_float(data[index])
 
 
 class LASTORE(Instruction):
@@ -635,9 +638,8 @@ class LASTORE(Instruction):
         operand_stack = frame.operand_stack
         value = operand_stack.pop_long()
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_item(index, value)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        data[index] = value
 
 
 class LALOAD(Instruction):
@@ -647,10 +649,8 @@ class LALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_long(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_long(data[index])
 
 
 class SASTORE(Instruction):
@@ -661,9 +661,8 @@ class SASTORE(Instruction):
         operand_stack = frame.operand_stack
         value = operand_stack.pop_int()
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_item(index, value)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        data[index] = math_utils.i2s(value)
 
 
 class SALOAD(Instruction):
@@ -673,10 +672,8 @@ class SALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_int(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_int(data[index])
 
 
 class AASTORE(Instruction):
@@ -688,8 +685,10 @@ class AASTORE(Instruction):
         value = operand_stack.pop_ref()
         index = operand_stack.pop_int()
         aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_ref_item(index, value)
+        data = InsUtils.check_array(aref, index)
+        data[index] = value
+        if GC.barrier_enabled:
+            GC.write_barrier(aref, value)
 
 
 class AALOAD(Instruction):
@@ -699,23 +698,25 @@ class AALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_ref(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_ref(data[index])
 
 
 class BASTORE(Instruction):
     code = 0x54
     name = 'bastore'
 
+    # byte 和 boolean 数组共用这条指令，boolean 只保留最低位
     def execute(self, frame):
         operand_stack = frame.operand_stack
         value = operand_stack.pop_int()
         index = operand_stack.pop_int()
         aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        aref.handler.obj.add_item(index, value)
+        data = InsUtils.check_array(aref, index)
+        if aref.obj.atype == JArray.T_BOOLEAN:
+            data[index] = value & 1
+        else:
+            data[index] = math_utils.i2b(value)
 
 
 class BALOAD(Instruction):
@@ -725,10 +726,8 @@ class BALOAD(Instruction):
     def execute(self, frame):
         operand_stack = frame.operand_stack
         index = operand_stack.pop_int()
-        aref = operand_stack.pop_ref()
-        InsUtils.check_ref_null(aref)
-        val = aref.handler.obj.get_item(index)
-        operand_stack.push_int(val)
+        data = InsUtils.check_array(operand_stack.pop_ref(), index)
+        operand_stack.push_int(data[index])
 
 
 class IINC(Instruction):
@@ -742,12 +741,11 @@ class IINC(Instruction):
 
     def read_operands(self, code_parser):
         self.index = code_parser.read_op()
-        self.const = code_parser.read_op()
+        self.const = ctypes.c_byte(code_parser.read_op()).value
 
     def execute(self, frame):
-        val = frame.local_vars.get_int(self.index)
-        val += self.const
-        frame.local_vars.add_int(self.index, val)
+        local_vars = frame.local_vars
+        local_vars.add_int(self.index, math_utils.to_int(local_vars.get_int(self.index) + self.const))
 
 
 class I2L(Instruction):
@@ -755,8 +753,9 @@ class I2L(Instruction):
     name = 'i2l'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_int()
-        frame.operand_stack.push_long(val)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_int()
+        operand_stack.push_long(val)
 
 
 class I2F(Instruction):
@@ -764,8 +763,9 @@ class I2F(Instruction):
     name = 'i2f'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_int()
-        frame.operand_stack.push_float(ctypes.c_float(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_int()
+        operand_stack.push_float(math_utils.to_float(val))
 
 
 class I2D(Instruction):
@@ -773,8 +773,9 @@ class I2D(Instruction):
     name = 'i2d'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_int()
-        frame.operand_stack.push_double(ctypes.c_double(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_int()
+        operand_stack.push_double(float(val))
 
 
 class L2I(Instruction):
@@ -782,8 +783,9 @@ class L2I(Instruction):
     name = 'l2i'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_long()
-        frame.operand_stack.push_int(ctypes.c_int32(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_long()
+        operand_stack.push_int(math_utils.to_int(val))
 
 
 class L2F(Instruction):
@@ -791,8 +793,9 @@ class L2F(Instruction):
     name = 'l2f'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_long()
-        frame.operand_stack.push_float(ctypes.c_float(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_long()
+        operand_stack.push_float(math_utils.to_float(val))
 
 
 class L2D(Instruction):
@@ -800,8 +803,9 @@ class L2D(Instruction):
     name = 'l2d'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_long()
-        frame.operand_stack.push_double(ctypes.c_double(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_long()
+        operand_stack.push_double(float(val))
 
 
 class F2I(Instruction):
@@ -809,8 +813,9 @@ class F2I(Instruction):
     name = 'f2i'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_float()
-        frame.operand_stack.push_int(ctypes.c_int32(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_float()
+        operand_stack.push_int(math_utils.f2i(val))
 
 
 class F2L(Instruction):
@@ -818,8 +823,9 @@ class F2L(Instruction):
     name = 'f2l'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_float()
-        frame.operand_stack.push_long(ctypes.c_long(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_float()
+        operand_stack.push_long(math_utils.f2l(val))
 
 
 class F2D(Instruction):
@@ -827,8 +833,9 @@ class F2D(Instruction):
     name = 'f2d'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_float()
-        frame.operand_stack.push_double(ctypes.c_double(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_float()
+        operand_stack.push_double(val)
 
 
 class D2I(Instruction):
@@ -836,8 +843,9 @@ class D2I(Instruction):
     name = 'd2i'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_double()
-        frame.operand_stack.push_int(ctypes.c_int32(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_double()
+        operand_stack.push_int(math_utils.f2i(val))
 
 
 class D2L(Instruction):
@@ -845,8 +853,9 @@ class D2L(Instruction):
     name = 'd2l'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_double()
-        frame.operand_stack.push_long(ctypes.c_long(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_double()
+        operand_stack.push_long(math_utils.f2l(val))
 
 
 class D2F(Instruction):
@@ -854,8 +863,9 @@ class D2F(Instruction):
     name = 'd2f'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_double()
-        frame.operand_stack.push_float(ctypes.c_float(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_double()
+        operand_stack.push_float(math_utils.to_float(val))
 
 
 class I2B(Instruction):
@@ -863,8 +873,9 @@ class I2B(Instruction):
     name = 'i2b'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_int()
-        frame.operand_stack.push_int(ctypes.c_byte(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.i2b(val))
 
 
 class I2C(Instruction):
@@ -872,8 +883,9 @@ class I2C(Instruction):
     name = 'i2c'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_int()
-        frame.operand_stack.push_int(ctypes.c_char(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.i2c(val))
 
 
 class I2S(Instruction):
@@ -881,8 +893,9 @@ class I2S(Instruction):
     name = 'i2s'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_int()
-        frame.operand_stack.push_int(ctypes.c_short(val).value)
+        operand_stack = frame.operand_stack
+        val = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.i2s(val))
 
 
 class LCMP(Instruction):
@@ -901,16 +914,13 @@ class LCMP(Instruction):
 
 
 class FCMPOP(Instruction):
-    # TODO: 对 fcmpl 和 fcmpd 没有做区分
+    nan_result = -1  # 有 NaN 时的结果，xcmpl 为 -1，xcmpg 为 1
+
     def execute(self, frame):
-        value2 = frame.operand_stack.pop_float()
-        value1 = frame.operand_stack.pop_float()
-        if value1 > value2:
-            frame.operand_stack.push_int(1)
-        elif value1 < value2:
-            frame.operand_stack.push_int(-1)
-        else:
-            frame.operand_stack.push_int(0)
+        operand_stack = frame.operand_stack
+        value2 = operand_stack.pop_float()
+        value1 = operand_stack.pop_float()
+        operand_stack.push_int(math_utils.fcmp(value1, value2, self.nan_result))
 
 
 class FCMPL(FCMPOP):
@@ -920,20 +930,18 @@ class FCMPL(FCMPOP):
 
 class FCMPD(FCMPOP):
     code = 0x96
-    name = 'fcmpd'
+    name = 'fcmpg'
+    nan_result = 1
 
 
 class DCMPOP(Instruction):
-    # TODO: 对 dcmpl 和 dcmpd 没有做区分
+    nan_result = -1
+
     def execute(self, frame):
-        value2 = frame.operand_stack.pop_double()
-        value1 = frame.operand_stack.pop_double()
-        if value1 > value2:
-            frame.operand_stack.push_int(1)
-        elif value1 < value2:
-            frame.operand_stack.push_int(-1)
-        else:
-            frame.operand_stack.push_int(0)
+        operand_stack = frame.operand_stack
+        value2 = operand_stack.pop_double()
+        value1 = operand_stack.pop_double()
+        operand_stack.push_int(math_utils.fcmp(value1, value2, self.nan_result))
 
 
 class DCMPL(DCMPOP):
@@ -941,9 +949,10 @@ class DCMPL(DCMPOP):
     name = 'dcmpl'
 
 
-class DCMPD(FCMPOP):
+class DCMPD(DCMPOP):
     code = 0x98
-    name = 'dcmpd'
+    name = 'dcmpg'
+    nan_result = 1
 
 
 class ICONST_I(Instruction):
@@ -1086,7 +1095,7 @@ class DCONST_L(Instruction):
         stack.push_double(index)
 
 
-class DCONST_0(FCONST_L):
+class DCONST_0(DCONST_L):
     code = 0xe
     name = 'dconst_0'
 
@@ -1094,7 +1103,7 @@ class DCONST_0(FCONST_L):
         return 0.0
 
 
-class DCONST_1(FCONST_L):
+class DCONST_1(DCONST_L):
     code = 0xf
     name = 'dconst_1'
 
@@ -1351,10 +1360,9 @@ class IADD(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_int()
         val2 = operand_stack.pop_int()
-        res = val1 + val2
-        operand_stack.push_int(res)
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.to_int(val1 + val2))
 
 
 class LADD(Instruction):
@@ -1363,10 +1371,9 @@ class LADD(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_long()
         val2 = operand_stack.pop_long()
-        res = val1 + val2
-        operand_stack.push_long(res)
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(math_utils.to_long(val1 + val2))
 
 
 class FADD(Instruction):
@@ -1375,10 +1382,9 @@ class FADD(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_float()
         val2 = operand_stack.pop_float()
-        res = val1 + val2
-        operand_stack.push_float(res)
+        val1 = operand_stack.pop_float()
+        operand_stack.push_float(math_utils.to_float(val1 + val2))
 
 
 class DADD(Instruction):
@@ -1387,10 +1393,9 @@ class DADD(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_double()
         val2 = operand_stack.pop_double()
-        res = val1 + val2
-        operand_stack.push_double(res)
+        val1 = operand_stack.pop_double()
+        operand_stack.push_double(val1 + val2)
 
 
 class ISUB(Instruction):
@@ -1399,10 +1404,9 @@ class ISUB(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_int()
         val2 = operand_stack.pop_int()
-        res = val1 - val2
-        operand_stack.push_int(res)
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.to_int(val1 - val2))
 
 
 class LSUB(Instruction):
@@ -1411,10 +1415,9 @@ class LSUB(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_long()
         val2 = operand_stack.pop_long()
-        res = val1 - val2
-        operand_stack.push_long(res)
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(math_utils.to_long(val1 - val2))
 
 
 class FSUB(Instruction):
@@ -1423,10 +1426,9 @@ class FSUB(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_float()
         val2 = operand_stack.pop_float()
-        res = val1 - val2
-        operand_stack.push_float(res)
+        val1 = operand_stack.pop_float()
+        operand_stack.push_float(math_utils.to_float(val1 - val2))
 
 
 class DSUB(Instruction):
@@ -1435,10 +1437,9 @@ class DSUB(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_double()
         val2 = operand_stack.pop_double()
-        res = val1 - val2
-        operand_stack.push_double(res)
+        val1 = operand_stack.pop_double()
+        operand_stack.push_double(val1 - val2)
 
 
 class IMUL(Instruction):
@@ -1447,10 +1448,9 @@ class IMUL(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_int()
         val2 = operand_stack.pop_int()
-        res = val1 * val2
-        operand_stack.push_int(res)
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.to_int(val1 * val2))
 
 
 class LMUL(Instruction):
@@ -1459,10 +1459,9 @@ class LMUL(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_long()
         val2 = operand_stack.pop_long()
-        res = val1 * val2
-        operand_stack.push_long(res)
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(math_utils.to_long(val1 * val2))
 
 
 class FMUL(Instruction):
@@ -1471,10 +1470,9 @@ class FMUL(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_float()
         val2 = operand_stack.pop_float()
-        res = val1 * val2
-        operand_stack.push_float(res)
+        val1 = operand_stack.pop_float()
+        operand_stack.push_float(math_utils.to_float(val1 * val2))
 
 
 class DMUL(Instruction):
@@ -1483,10 +1481,9 @@ class DMUL(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_double()
         val2 = operand_stack.pop_double()
-        res = val1 * val2
-        operand_stack.push_double(res)
+        val1 = operand_stack.pop_double()
+        operand_stack.push_double(val1 * val2)
 
 
 class IDIV(Instruction):
@@ -1495,12 +1492,11 @@ class IDIV(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_int()
         val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_int()
         if val2 == 0:
-            error_handler.rise_runtime_error('java.lang.ArithmeticException: x / 0')
-        res = val1 / val2
-        operand_stack.push_int(res)
+            error_handler.rise_runtime_error('java.lang.ArithmeticException: / by zero')
+        operand_stack.push_int(math_utils.idiv(val1, val2))
 
 
 class LDIV(Instruction):
@@ -1509,12 +1505,11 @@ class LDIV(Instruction):
 
     def execute(self, frame):
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_long()
         val2 = operand_stack.pop_long()
+        val1 = operand_stack.pop_long()
         if val2 == 0:
-            error_handler.rise_runtime_error('java.lang.ArithmeticException: x / 0')
-        res = val1 / val2
-        operand_stack.push_long(res)
+            error_handler.rise_runtime_error('java.lang.ArithmeticException: / by zero')
+        operand_stack.push_long(math_utils.ldiv(val1, val2))
 
 
 class FDIV(Instruction):
@@ -1522,12 +1517,10 @@ class FDIV(Instruction):
     name = 'fdiv'
 
     def execute(self, frame):
-        # TODO: IEEE 规范中规定的运算规则
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_float()
         val2 = operand_stack.pop_float()
-        res = val1 / val2
-        operand_stack.push_float(res)
+        val1 = operand_stack.pop_float()
+        operand_stack.push_float(math_utils.to_float(math_utils.fdiv(val1, val2)))
 
 
 class DDIV(Instruction):
@@ -1535,12 +1528,10 @@ class DDIV(Instruction):
     name = 'ddiv'
 
     def execute(self, frame):
-        # TODO: IEEE 规范中规定的运算规则
         operand_stack = frame.operand_stack
-        val1 = operand_stack.pop_double()
         val2 = operand_stack.pop_double()
-        res = val1 / val2
-        operand_stack.push_double(res)
+        val1 = operand_stack.pop_double()
+        operand_stack.push_double(math_utils.fdiv(val1, val2))
 
 
 class IREM(Instruction):
@@ -1552,10 +1543,8 @@ class IREM(Instruction):
         val2 = operand_stack.pop_int()
         val1 = operand_stack.pop_int()
         if val2 == 0:
-            error_handler.rise_runtime_error('java.lang.ArithmeticException: x / 0')
-        # res = val1 - int(val1 / val2) * val2
-        res = val1 % val2
-        operand_stack.push_int(res)
+            error_handler.rise_runtime_error('java.lang.ArithmeticException: / by zero')
+        operand_stack.push_int(math_utils.irem(val1, val2))
 
 
 class LREM(Instruction):
@@ -1567,10 +1556,8 @@ class LREM(Instruction):
         val2 = operand_stack.pop_long()
         val1 = operand_stack.pop_long()
         if val2 == 0:
-            error_handler.rise_runtime_error('java.lang.ArithmeticException: x / 0')
-        # res = val1 - int(val1 / val2) * val2
-        res = val1 % val2
-        operand_stack.push_long(res)
+            error_handler.rise_runtime_error('java.lang.ArithmeticException: / by zero')
+        operand_stack.push_long(math_utils.lrem(val1, val2))
 
 
 class FREM(Instruction):
@@ -1578,12 +1565,10 @@ class FREM(Instruction):
     name = 'frem'
 
     def execute(self, frame):
-        # TODO: IEEE 规范中规定的运算规则
         operand_stack = frame.operand_stack
         val2 = operand_stack.pop_float()
         val1 = operand_stack.pop_float()
-        res = val1 % val2
-        operand_stack.push_float(res)
+        operand_stack.push_float(math_utils.to_float(math_utils.frem(val1, val2)))
 
 
 class DREM(Instruction):
@@ -1591,12 +1576,10 @@ class DREM(Instruction):
     name = 'drem'
 
     def execute(self, frame):
-        # TODO: IEEE 规范中规定的运算规则
         operand_stack = frame.operand_stack
         val2 = operand_stack.pop_double()
         val1 = operand_stack.pop_double()
-        res = val1 % val2
-        operand_stack.push_double(res)
+        operand_stack.push_double(math_utils.frem(val1, val2))
 
 
 class INEG(Instruction):
@@ -1604,8 +1587,8 @@ class INEG(Instruction):
     name = 'ineg'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_int()
-        frame.operand_stack.push_int(-val)
+        operand_stack = frame.operand_stack
+        operand_stack.push_int(math_utils.to_int(-operand_stack.pop_int()))
 
 
 class LNEG(Instruction):
@@ -1613,8 +1596,8 @@ class LNEG(Instruction):
     name = 'lneg'
 
     def execute(self, frame):
-        val = frame.operand_stack.pop_long()
-        frame.operand_stack.push_long(-val)
+        operand_stack = frame.operand_stack
+        operand_stack.push_long(math_utils.to_long(-operand_stack.pop_long()))
 
 
 class FNEG(Instruction):
@@ -1640,11 +1623,10 @@ class ISHL(Instruction):
     name = 'ishl'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_int()
-        val1 = frame.operand_stack.pop_int()
-        s = val2 & 0x1f
-        res = val1 << s
-        frame.operand_stack.push_int(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.ishl(val1, val2))
 
 
 class LSHL(Instruction):
@@ -1652,11 +1634,10 @@ class LSHL(Instruction):
     name = 'lshl'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_long()
-        val1 = frame.operand_stack.pop_long()
-        s = val2 & 0x3f
-        res = val1 << s
-        frame.operand_stack.push_long(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(math_utils.lshl(val1, val2))
 
 
 class ISHR(Instruction):
@@ -1664,11 +1645,10 @@ class ISHR(Instruction):
     name = 'ishr'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_int()
-        val1 = frame.operand_stack.pop_int()
-        s = val2 & 0x1f
-        res = val1 >> s
-        frame.operand_stack.push_int(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.ishr(val1, val2))
 
 
 class LSHR(Instruction):
@@ -1676,11 +1656,10 @@ class LSHR(Instruction):
     name = 'lshr'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_long()
-        val1 = frame.operand_stack.pop_long()
-        s = val2 & 0x3f
-        res = val1 >> s
-        frame.operand_stack.push_long(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(math_utils.lshr(val1, val2))
 
 
 class IUSHR(Instruction):
@@ -1688,12 +1667,10 @@ class IUSHR(Instruction):
     name = 'iushr'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_int()
-        val1 = frame.operand_stack.pop_int()
-        s = val2 & 0x1f
-        val = ctypes.c_uint32(val1).value
-        res = ctypes.c_int32(val >> s).value
-        frame.operand_stack.push_int(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(math_utils.iushr(val1, val2))
 
 
 class LUSHR(Instruction):
@@ -1701,12 +1678,10 @@ class LUSHR(Instruction):
     name = 'lushr'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_long()
-        val1 = frame.operand_stack.pop_long()
-        s = val2 & 0x3f
-        val = ctypes.c_uint64(val1).value
-        res = ctypes.c_int64(val >> s).value
-        frame.operand_stack.push_int(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(math_utils.lushr(val1, val2))
 
 
 class IAND(Instruction):
@@ -1714,10 +1689,10 @@ class IAND(Instruction):
     name = 'iand'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_int()
-        val1 = frame.operand_stack.pop_int()
-        res = val1 & val2
-        frame.operand_stack.push_int(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(val1 & val2)
 
 
 class LAND(Instruction):
@@ -1725,10 +1700,10 @@ class LAND(Instruction):
     name = 'land'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_long()
-        val1 = frame.operand_stack.pop_long()
-        res = val1 & val2
-        frame.operand_stack.push_long(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_long()
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(val1 & val2)
 
 
 class IOR(Instruction):
@@ -1736,10 +1711,10 @@ class IOR(Instruction):
     name = 'ior'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_int()
-        val1 = frame.operand_stack.pop_int()
-        res = val1 | val2
-        frame.operand_stack.push_int(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(val1 | val2)
 
 
 class LOR(Instruction):
@@ -1747,10 +1722,10 @@ class LOR(Instruction):
     name = 'lor'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_long()
-        val1 = frame.operand_stack.pop_long()
-        res = val1 | val2
-        frame.operand_stack.push_long(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_long()
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(val1 | val2)
 
 
 class IXOR(Instruction):
@@ -1758,10 +1733,10 @@ class IXOR(Instruction):
     name = 'ixor'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_int()
-        val1 = frame.operand_stack.pop_int()
-        res = val1 ^ val2
-        frame.operand_stack.push_int(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_int()
+        val1 = operand_stack.pop_int()
+        operand_stack.push_int(val1 ^ val2)
 
 
 class LXOR(Instruction):
@@ -1769,10 +1744,10 @@ class LXOR(Instruction):
     name = 'lxor'
 
     def execute(self, frame):
-        val2 = frame.operand_stack.pop_long()
-        val1 = frame.operand_stack.pop_long()
-        res = val1 ^ val2
-        frame.operand_stack.push_long(res)
+        operand_stack = frame.operand_stack
+        val2 = operand_stack.pop_long()
+        val1 = operand_stack.pop_long()
+        operand_stack.push_long(val1 ^ val2)
 
 
 class INVOKESPECIAL(Instruction):
@@ -1792,33 +1767,9 @@ class INVOKESPECIAL(Instruction):
         # TODO: 方法校验
         constant_pool = frame.method.jclass.constant_pool.constants
         n_method_ref = constant_pool[self.index]
-        # TODO: 先忽略基础类的所有方法
-        if n_method_ref.class_name == 'java/lang/Object':
-            return
-        print_utils.print_jvm_status('invokespecial: ' + n_method_ref.name)
+        print_utils.print_jvm_status('invokespecial: %s', n_method_ref.name)
         n_method = n_method_ref.resolve_method(frame.method.jclass.class_loader)
-        n_frame = Frame(frame.thread, n_method)
-        frame.thread.add_frame(n_frame)
-        arg_desc = n_method.arg_desc
-        i = len(arg_desc)
-        for arg in arg_desc:
-            if arg == 'I' or arg == 'S' or arg == 'Z' or arg == 'C':
-                value = frame.operand_stack.pop_int()
-                n_frame.local_vars.add_int(i, value)
-            elif arg == 'J':
-                value = frame.operand_stack.pop_long()
-                n_frame.local_vars.add_long(i, value)
-            elif arg == 'F':
-                value = frame.operand_stack.pop_float()
-                n_frame.local_vars.add_float(i, value)
-            elif arg == 'D':
-                value = frame.operand_stack.pop_double()
-                n_frame.local_vars.add_double(i, value)
-            elif arg[0] == 'L':
-                jref = frame.operand_stack.pop_ref()
-                n_frame.local_vars.add_ref(i, jref)
-            i -= 1
-        n_frame.local_vars.add_ref(0, frame.operand_stack.pop())
+        InsUtils.invoke(frame, n_method)
 
 
 class INVOKEVIRTUAL(Instruction):
@@ -1828,6 +1779,7 @@ class INVOKEVIRTUAL(Instruction):
     def __init__(self):
         super(INVOKEVIRTUAL, self).__init__()
         self.index = -1
+        self.inline_cache = None
 
     def read_operands(self, code_parser):
         index1 = code_parser.read_op()
@@ -1838,90 +1790,63 @@ class INVOKEVIRTUAL(Instruction):
         # TODO: 方法校验
         constant_pool = frame.method.jclass.constant_pool.constants
         n_method_ref = constant_pool[self.index]
-        # TODO: 先忽略基类的所有方法
-        if n_method_ref.class_name == 'java/lang/Object':
-            return
-        print_utils.print_jvm_status('invokevirtual: ' + n_method_ref.name)
-        # 主要是为了获取参数个数
-        n_method = n_method_ref.resolve_method_with_super(frame.method.jclass.class_loader)
-        arg_desc = n_method.arg_desc
-        ref = frame.operand_stack.top(len(arg_desc))
-        if ref is not None:
-            real_class_name = ref.handler.obj.jclass.name
-            if n_method_ref.class_name != real_class_name:
-                n_method = n_method_ref.re_resolve_method_with_super_by_class_name(frame.method.jclass.class_loader,
-                                                                                   real_class_name)
-        n_frame = Frame(frame.thread, n_method)
-        frame.thread.add_frame(n_frame)
-        i = len(arg_desc)
-        for arg in arg_desc:
-            if arg == 'I' or arg == 'S' or arg == 'Z' or arg == 'C' or arg == 'B':
-                value = frame.operand_stack.pop_int()
-                n_frame.local_vars.add_int(i, value)
-            elif arg == 'J':
-                value = frame.operand_stack.pop_long()
-                n_frame.local_vars.add_long(i, value)
-            elif arg == 'F':
-                value = frame.operand_stack.pop_float()
-                n_frame.local_vars.add_float(i, value)
-            elif arg == 'D':
-                value = frame.operand_stack.pop_double()
-                n_frame.local_vars.add_double(i, value)
-            elif arg[0] == 'L':
-                jref = frame.operand_stack.pop_ref()
-                n_frame.local_vars.add_ref(i, jref)
-            i -= 1
-        n_frame.local_vars.add_ref(0, frame.operand_stack.pop())
-        self.__hack(n_frame, n_method)
-
-    # 暂时做一些 hack 处理，比如输出
-    def __hack(self, n_frame, method):
-        # 处理 print
-        self.__hack_println(n_frame, method)
-        # 处理 thread
-        self.__hack_thread(n_frame, method)
-
-    def __hack_thread(self, n_frame, method):
-        jthis = n_frame.local_vars.get_ref(0)
-        if method.name == 'start' and jthis.handler.obj.jclass.super_class_name == 'java/lang/Thread':
-            for m in jthis.handler.obj.jclass.methods:
-                if m.name == 'run':
-                    JThread.start_new_thread(m)
-
-    def __hack_println(self, n_frame, method):
-        if method.name == 'println' and method.jclass.name == 'java/io/PrintStream':
-            if method.descriptor == '(Ljava/lang/String;)Ljava/io/PrintStream;':
-                jref = n_frame.local_vars.get_ref(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, jref.data)
-            elif method.descriptor == '(I)Ljava/io/PrintStream;':
-                jint = n_frame.local_vars.get_int(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, jint)
-            elif method.descriptor == '(S)Ljava/io/PrintStream;':
-                jint = n_frame.local_vars.get_int(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, jint)
-            elif method.descriptor == '(B)Ljava/io/PrintStream;':
-                jint = n_frame.local_vars.get_int(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, jint)
-            elif method.descriptor == '(C)Ljava/io/PrintStream;':
-                jint = n_frame.local_vars.get_int(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, chr(jint))
-            elif method.descriptor == '(J)Ljava/io/PrintStream;':
-                jlong = n_frame.local_vars.get_long(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, jlong)
-            elif method.descriptor == '(D)Ljava/io/PrintStream;':
-                jdouble = n_frame.local_vars.get_double(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, jdouble)
-            elif method.descriptor == '(F)Ljava/io/PrintStream;':
-                jfloat = n_frame.local_vars.get_float(1)
-                print_utils.StreamPrinter.append_msg(n_frame.thread, jfloat)
-            elif method.descriptor == '(Z)Ljava/io/PrintStream;':
-                jint = n_frame.local_vars.get_int(1)
-                if jint == 0:  # False
-                    print_utils.StreamPrinter.append_msg(n_frame.thread, 'false')
-                elif jint == 1:  # True
-                    print_utils.StreamPrinter.append_msg(n_frame.thread, 'true')
-                else:
-                    error_handler.rise_runtime_error('runtime error: boolean not true or false')
+        print_utils.print_jvm_status('invokevirtual: %s', n_method_ref.name)
+        ref = frame.operand_stack.top(n_method_ref.arg_slot_count)
+        InsUtils.check_ref_null(ref)
+        jclass = ref.obj.jclass
+        inline_cache = self.inline_cache
+        if inline_cache is None:
+            inline_cache = InlineCache.new_cache(frame.method, frame.thread.pc)
+            self.inline_cache = inline_cache
+        n_method = inline_cache.lookup(jclass)
+        if n_method is None:
+            n_method = INVOKEVIRTUAL.find_method(n_method_ref, frame.method.jclass.class_loader, jclass)
+            inline_cache.update(jclass, n_method)
+        InsUtils.invoke(frame, n_method)
+
+    # 内联缓存没有命中时查接收者类的虚方法表
+    @staticmethod
+    def find_method(n_method_ref, class_loader, jclass):
+        index = n_method_ref.resolve_vtable_index(class_loader)
+        if index < 0:
+            return n_method_ref.resolve_method(class_loader)
+        return jclass.vtable[index]
+
+
+class INVOKEINTERFACE(Instruction):
+    code = 0xb9
+    name = 'invokeinterface'
+
+    def __init__(self):
+        super(INVOKEINTERFACE, self).__init__()
+        self.index = -1
+        self.count = 0
+        self.inline_cache = None
+
+    def read_operands(self, code_parser):
+        index1 = code_parser.read_op()
+        index2 = code_parser.read_op()
+        self.index = (index1 << 8) | index2
+        self.count = code_parser.read_op()
+        code_parser.read_op()  # 固定为 0
+
+    # 和 invokevirtual 一样先查调用点的内联缓存，没命中再查接收者类的 itable
+    def execute(self, frame):
+        constant_pool = frame.method.jclass.constant_pool.constants
+        n_method_ref = constant_pool[self.index]
+        print_utils.print_jvm_status('invokeinterface: %s', n_method_ref.name)
+        ref = frame.operand_stack.top(n_method_ref.arg_slot_count)
+        InsUtils.check_ref_null(ref)
+        jclass = ref.obj.jclass
+        inline_cache = self.inline_cache
+        if inline_cache is None:
+            inline_cache = InlineCache.new_cache(frame.method, frame.thread.pc)
+            self.inline_cache = inline_cache
+        n_method = inline_cache.lookup(jclass)
+        if n_method is None:
+            n_method = n_method_ref.find_interface_method(frame.method.jclass.class_loader, jclass)
+            inline_cache.update(jclass, n_method)
+        InsUtils.invoke(frame, n_method)
 
 
 class INVOKESTATIC(Instruction):
@@ -1941,29 +1866,9 @@ class INVOKESTATIC(Instruction):
         # TODO: 方法校验
         constant_pool = frame.method.jclass.constant_pool.constants
         n_method_ref = constant_pool[self.index]
-        print_utils.print_jvm_status('invokestatic: ' + n_method_ref.name)
+        print_utils.print_jvm_status('invokestatic: %s', n_method_ref.name)
         n_method = n_method_ref.resolve_method(frame.method.jclass.class_loader)
-        n_frame = Frame(frame.thread, n_method)
-        frame.thread.add_frame(n_frame)
-        arg_desc = n_method.arg_desc
-        i = len(arg_desc)
-        for arg in arg_desc:
-            i -= 1
-            if arg == 'I' or arg == 'S' or arg == 'Z' or arg == 'C':
-                value = frame.operand_stack.pop_int()
-                n_frame.local_vars.add_int(i, value)
-            elif arg == 'J':
-                value = frame.operand_stack.pop_long()
-                n_frame.local_vars.add_long(i, value)
-            elif arg == 'F':
-                value = frame.operand_stack.pop_float()
-                n_frame.local_vars.add_float(i, value)
-            elif arg == 'D':
-                value = frame.operand_stack.pop_double()
-                n_frame.local_vars.add_double(i, value)
-            elif arg[0] == 'L':
-                jref = frame.operand_stack.pop_ref()
-                n_frame.local_vars.add_ref(i, jref)
+        InsUtils.invoke(frame, n_method)
 
 
 class IRETURN(Instruction):
@@ -1971,10 +1876,12 @@ class IRETURN(Instruction):
     name = 'ireturn'
 
     def execute(self, frame):
-        frame.thread.pop_frame()
         r_value = frame.operand_stack.pop_int()
+        frame.thread.pop_frame()
         c_frame = frame.thread.top_frame()
         c_frame.operand_stack.push_int(r_value)
+        if GC.safepoint_poll:  # 方法返回是安全点
+            GC.safepoint()
 
 
 class LRETURN(Instruction):
@@ -1982,10 +1889,12 @@ class LRETURN(Instruction):
     name = 'lreturn'
 
     def execute(self, frame):
-        frame.thread.pop_frame()
         r_value = frame.operand_stack.pop_long()
+        frame.thread.pop_frame()
         c_frame = frame.thread.top_frame()
         c_frame.operand_stack.push_long(r_value)
+        if GC.safepoint_poll:  # 方法返回是安全点
+            GC.safepoint()
 
 
 class FRETURN(Instruction):
@@ -1993,10 +1902,12 @@ class FRETURN(Instruction):
     name = 'freturn'
 
     def execute(self, frame):
-        frame.thread.pop_frame()
         r_value = frame.operand_stack.pop_float()
+        frame.thread.pop_frame()
         c_frame = frame.thread.top_frame()
         c_frame.operand_stack.push_float(r_value)
+        if GC.safepoint_poll:  # 方法返回是安全点
+            GC.safepoint()
 
 
 class DRETURN(Instruction):
@@ -2004,10 +1915,12 @@ class DRETURN(Instruction):
     name = 'dreturn'
 
     def execute(self, frame):
-        frame.thread.pop_frame()
         r_value = frame.operand_stack.pop_double()
+        frame.thread.pop_frame()
         c_frame = frame.thread.top_frame()
         c_frame.operand_stack.push_double(r_value)
+        if GC.safepoint_poll:  # 方法返回是安全点
+            GC.safepoint()
 
 
 class ARETURN(Instruction):
@@ -2015,10 +1928,12 @@ class ARETURN(Instruction):
     name = 'areturn'
 
     def execute(self, frame):
-        frame.thread.pop_frame()
         r_value = frame.operand_stack.pop_ref()
+        frame.thread.pop_frame()
         c_frame = frame.thread.top_frame()
         c_frame.operand_stack.push_ref(r_value)
+        if GC.safepoint_poll:  # 方法返回是安全点
+            GC.safepoint()
 
 
 class ISTORE_N(Instruction):
@@ -2476,8 +2391,8 @@ class IF_ACMP_COND(JUMP_INC):
         branch2 = code_parser.read_op()
         self.branch = common_utils.get_short_from_bytes(branch1, branch2)
 
+    # 每个对象只有一个 JRef (gc 搬移对象时更新 ref.obj)，比较 ref 本身就是比较对象
     def execute(self, frame):
-        # TODO: ref 怎么做比较?
         value2 = frame.operand_stack.pop_ref()
         value1 = frame.operand_stack.pop_ref()
         if self.compare(value1, value2):
@@ -2489,7 +2404,7 @@ class IF_ACMPEQ(IF_ACMP_COND):
     name = 'if_acmpeq'
 
     def compare(self, ref1, ref2):
-        return ref1 == ref2
+        return ref1 is ref2
 
 
 class IF_ACMPNE(IF_ACMP_COND):
@@ -2497,7 +2412,7 @@ class IF_ACMPNE(IF_ACMP_COND):
     name = 'if_acmpne'
 
     def compare(self, ref1, ref2):
-        return ref1 != ref2
+        return ref1 is not ref2
 
 
 # impdep1 impdep2 breakpoint 为保留操作符
@@ -2562,10 +2477,8 @@ class NEWARRAY(Instruction):
 
     def execute(self, frame):
         count = frame.operand_stack.pop_int()
-        class_loader = frame.method.jclass.class_loader
-        if class_loader is None:
-            class_loader = ClassLoader()
-            frame.method.jclass.class_loader = class_loader
+        InsUtils.check_array_count(count)
+        class_loader = InsUtils.get_class_loader(frame)
         jclass = class_loader.load_class(JArray.get_array_jclass_name(self.atype))
         jref = JRef.new_array(jclass, self.atype, count)
         frame.operand_stack.push_ref(jref)
@@ -2584,15 +2497,14 @@ class ANEWARRAY(Instruction):
         index2 = code_parser.read_op()
         self.index = (index1 << 8) | index2
 
+    # 元素类型可以是数组 (比如 new int[3][] 的第一维)
     def execute(self, frame):
         count = frame.operand_stack.pop_int()
-        class_loader = frame.method.jclass.class_loader
-        if class_loader is None:
-            class_loader = ClassLoader()
-            frame.method.jclass.class_loader = class_loader
+        InsUtils.check_array_count(count)
+        class_loader = InsUtils.get_class_loader(frame)
         clref = frame.method.jclass.constant_pool.constants[self.index]
         jclass = class_loader.load_class(JArray.get_ref_array_jclass_name(clref.class_name))
-        jref = JRef.new_ref_array(jclass, clref, count)
+        jref = JRef.new_ref_array(jclass, count)
         frame.operand_stack.push_ref(jref)
 
 
@@ -2603,14 +2515,82 @@ class ARRAY_LENGTH(Instruction):
     def execute(self, frame):
         ref = frame.operand_stack.pop_ref()
         InsUtils.check_ref_null(ref)
-        if ref.handler.obj is None:
+        if ref.obj is None:
             error_handler.rise_null_point_error()
-        obj = ref.handler.obj
-        if not isinstance(ref.handler.obj, JArray):
+        obj = ref.obj
+        if not isinstance(ref.obj, JArray):
             error_handler.rise_runtime_error('!!! not array !!!')
         frame.operand_stack.push_int(obj.length)
 
 
+# 多维数组: 按维度从外到内逐层分配，count 为 0 的那一层以下不再分配，维数少于数组类型的维数时最里层是 null
+# 每一行都是单独的数组对象，有自己的 data，堆按每行自己的大小记账，行被替换或者单独存活时也能正确回收
+class MULTIANEWARRAY(Instruction):
+    code = 0xc5
+    name = 'multianewarray'
+
+    def __init__(self):
+        super(MULTIANEWARRAY, self).__init__()
+        self.index = 0
+        self.dimensions = 0
+
+    def read_operands(self, code_parser):
+        index1 = code_parser.read_op()
+        index2 = code_parser.read_op()
+        self.index = (index1 << 8) | index2
+        self.dimensions = code_parser.read_op()
+
+    def execute(self, frame):
+        operand_stack = frame.operand_stack
+        counts = [operand_stack.pop_int() for _ in range(self.dimensions)]
+        counts.reverse()
+        for count in counts:
+            InsUtils.check_array_count(count)
+        class_loader = InsUtils.get_class_loader(frame)
+        clref = frame.method.jclass.constant_pool.constants[self.index]
+        jref = MULTIANEWARRAY.new_array(class_loader, clref.class_name, counts, frame.thread)
+        operand_stack.push_ref(jref)
+
+    # descriptor 是最外层数组的类名，比如 [[D
+    @staticmethod
+    def new_array(class_loader, descriptor, counts, thread):
+        depth = len(counts)
+        element = descriptor[depth:]
+        if depth == 1:
+            return MULTIANEWARRAY.new_level(class_loader, descriptor, element, counts[0])
+        jref = JRef.new_ref_array(class_loader.load_class(descriptor), counts[0])
+        # 分配下面几层时可能 gc，最外层放在 handles 里，里面的数组分配完马上存进上一层，都能从它到达
+        thread.handles.append(jref)
+        try:
+            parents = [jref]
+            for level in range(1, depth):
+                count = counts[level]
+                descriptor = descriptor[1:]
+                children = []
+                for parent in parents:
+                    data = parent.obj.data
+                    for i in range(len(data)):
+                        child = MULTIANEWARRAY.new_level(class_loader, descriptor, element, count)
+                        data[i] = child
+                        if GC.barrier_enabled:
+                            GC.write_barrier(parent, child)
+                        children.append(child)
+                if count == 0:
+                    break
+                parents = children
+        finally:
+            thread.handles.pop()
+        return jref
+
+    # 一层数组，element 是最里层的元素描述符，descriptor 只剩一维时才是基本类型数组
+    @staticmethod
+    def new_level(class_loader, descriptor, element, count):
+        jclass = class_loader.load_class(descriptor)
+        if descriptor[1:] == element and element in JArray.ATYPES:
+            return JRef.new_array(jclass, JArray.ATYPES[element], count)
+        return JRef.new_ref_array(jclass, count)
+
+
 class POP(Instruction):
     code = 0x57
     name = 'pop'
@@ -2625,8 +2605,7 @@ class POP2(Instruction):
 
     def execute(self, frame):
         frame.operand_stack.pop()
-        if frame.operand_stack.is_top_type1():
-            frame.operand_stack.pop()
+        frame.operand_stack.pop()
 
 
 class PUTFIELD(Instruction):
@@ -2636,6 +2615,9 @@ class PUTFIELD(Instruction):
     def __init__(self):
         super(PUTFIELD, self).__init__()
         self.index = 0
+        self.field_index = None  # 第一次执行时解析成字段在对象里的下标
+        self.wide = False  # long / double 在操作数栈上占两个 slot
+        self.is_ref = False
 
     def read_operands(self, code_parser):
         index1 = code_parser.read_op()
@@ -2643,25 +2625,37 @@ class PUTFIELD(Instruction):
         self.index = (index1 << 8) | index2
 
     @staticmethod
-    def check_state(frame, field_ref, cl_ref):
+    def check_state(frame, field_ref):
         if field_ref.is_static():
             error_handler.rise_runtime_error('java.lang.IncompatibleClassChangeError: put field to static value')
         if field_ref.is_final() and frame.method.name != '<init>':
             error_handler.rise_runtime_error('java.lang.IllegalAccessError: val is final')
-        if cl_ref is None or cl_ref.handler is None or cl_ref.handler.obj is None:
-            error_handler.rise_runtime_error('java.lang.NullPointerException ref is null')
 
-    def execute(self, frame):
+    def resolve(self, frame):
         # TODO: field 验证
         field_ref = frame.method.jclass.constant_pool.constants[self.index]
-        val = frame.operand_stack.pop()
-        cl_ref = frame.operand_stack.pop_ref()
-        PUTFIELD.check_state(frame, field_ref, cl_ref)
-        if isinstance(val, JRef):
-            InsUtils.check_ref_null(cl_ref)
-            cl_ref.handler.obj.put_ref_field(field_ref.name, val)
+        PUTFIELD.check_state(frame, field_ref)
+        ftype = InsUtils.get_type_by_descriptor(field_ref.descriptor)
+        self.wide = ftype == InsUtils.TYPE_LONG or ftype == InsUtils.TYPE_DOUBLE
+        self.is_ref = ftype == InsUtils.TYPE_REF or ftype == InsUtils.TYPE_ARRAY
+        self.field_index = InsUtils.resolve_field_index(frame, field_ref)
+        return self.field_index
+
+    def execute(self, frame):
+        field_index = self.field_index
+        if field_index is None:
+            field_index = self.resolve(frame)
+        operand_stack = frame.operand_stack
+        if self.wide:
+            val = operand_stack.pop_long()
         else:
-            cl_ref.handler.obj.put_field(field_ref.name, val)
+            val = operand_stack.pop()
+        cl_ref = operand_stack.pop_ref()
+        if cl_ref is None or cl_ref.obj is None:
+            error_handler.rise_runtime_error('java.lang.NullPointerException ref is null')
+        cl_ref.obj.data[field_index] = val
+        if self.is_ref and GC.barrier_enabled:
+            GC.write_barrier(cl_ref, val)
 
 
 class GETFIELD(Instruction):
@@ -2671,29 +2665,33 @@ class GETFIELD(Instruction):
     def __init__(self):
         super(GETFIELD, self).__init__()
         self.index = 0
+        self.field_index = None  # 第一次执行时解析成字段在对象里的下标
+        self.wide = False
 
     def read_operands(self, code_parser):
         index1 = code_parser.read_op()
         index2 = code_parser.read_op()
         self.index = (index1 << 8) | index2
 
+    def resolve(self, frame):
+        field_ref = frame.method.jclass.constant_pool.constants[self.index]
+        ftype = InsUtils.get_type_by_descriptor(field_ref.descriptor)
+        self.wide = ftype == InsUtils.TYPE_LONG or ftype == InsUtils.TYPE_DOUBLE
+        self.field_index = InsUtils.resolve_field_index(frame, field_ref)
+        return self.field_index
+
     def execute(self, frame):
-        fieldref = frame.method.jclass.constant_pool.constants[self.index]
-        clref = frame.operand_stack.pop_ref()
-        InsUtils.check_ref_null(clref)
-        InsUtils.check_ref_null(clref)
-        val = clref.handler.obj.get_field(fieldref.name)
-        ftype = InsUtils.get_type_by_descriptor(fieldref.descriptor)
-        if ftype == InsUtils.TYPE_INT:
-            frame.operand_stack.push_int(val)
-        elif ftype == InsUtils.TYPE_FLOAT:
-            frame.operand_stack.push_float(val)
-        elif ftype == InsUtils.TYPE_LONG:
-            frame.operand_stack.push_long(val)
-        elif ftype == InsUtils.TYPE_DOUBLE:
-            frame.operand_stack.push_double(val)
-        elif ftype == InsUtils.TYPE_REF or ftype == InsUtils.TYPE_ARRAY:
-            frame.operand_stack.push_ref(val)
+        field_index = self.field_index
+        if field_index is None:
+            field_index = self.resolve(frame)
+        operand_stack = frame.operand_stack
+        clref = operand_stack.pop_ref()
+        if clref is None or clref.obj is None:
+            error_handler.rise_null_point_error()
+        if self.wide:
+            operand_stack.push_long(clref.obj.data[field_index])
+        else:
+            operand_stack.push(clref.obj.data[field_index])
 
 
 class RETURN(Instruction):
@@ -2705,6 +2703,8 @@ class RETURN(Instruction):
 
     def execute(self, frame):
         frame.thread.pop_frame()
+        if GC.safepoint_poll:  # 方法返回是安全点
+            GC.safepoint()
 
 
 class SIPUSH(Instruction):
@@ -2718,10 +2718,10 @@ class SIPUSH(Instruction):
     def read_operands(self, code_parser):
         byte1 = code_parser.read_op()
         byte2 = code_parser.read_op()
-        self.byte = (byte1 << 8) | byte2
+        self.byte = common_utils.get_short_from_bytes(byte1, byte2)
 
     def execute(self, frame):
-        frame.operand_stack.push_int(ctypes.c_short(self.byte).value)
+        frame.operand_stack.push_int(self.byte)
 
 
 class SWAP(Instruction):
@@ -2729,7 +2729,11 @@ class SWAP(Instruction):
     name = 'swap'
 
     def execute(self, frame):
-        value1 = frame.operand_stack.pop()
+        operand_stack = frame.operand_stack
+        value1 = operand_stack.pop()
+        value2 = operand_stack.pop()
+        operand_stack.push(value1)
+        operand_stack.push(value2)
 
 
 class TABLE_SWITCH(JUMP_INC):
@@ -2811,17 +2815,15 @@ class CHECK_CAST(Instruction):
         self.index = (index1 << 8) | index2
 
     def execute(self, frame):
-        # TODO: interface 实现
         ref = frame.operand_stack.top()
+        if ref is None:
+            return
         if not isinstance(ref, JRef):
             error_handler.rise_runtime_error('checkcast param must be ref')
         cl_ref = frame.method.jclass.constant_pool.constants[self.index]
-        name = cl_ref.class_name
-        cast_class = ref.handler.obj.jclass
-        while cast_class is not None:
-            if cast_class.name == name:
-                return
-            cast_class = cast_class.super_class
+        cast_class = ref.obj.jclass
+        if cast_class is not None and cast_class.is_subclass_of(cl_ref.class_name):
+            return
         error_handler.rise_class_cast_error()
 
 
@@ -2839,22 +2841,18 @@ class INSTANCE_OF(Instruction):
         self.index = (index1 << 8) | index2
 
     def execute(self, frame):
-        # TODO: interface 实现
-        ref = frame.operand_stack.top()
-        if not isinstance(ref, JRef):
+        ref = frame.operand_stack.pop_ref()
+        if ref is not None and not isinstance(ref, JRef):
             error_handler.rise_runtime_error('instance param must be ref')
-        cl_ref = frame.method.jclass.constant_pool.constants[self.index]
-        name = cl_ref.class_name
-        if ref.handler is None:
+        if JRef.check_null(ref):
             frame.operand_stack.push_int(0)
             return
-        cast_class = ref.handler.obj.jclass
-        while cast_class is not None:
-            if cast_class.name == name:
-                frame.operand_stack.push_int(1)
-                return
-            cast_class = cast_class.super_class
-        frame.operand_stack.push_int(0)
+        cl_ref = frame.method.jclass.constant_pool.constants[self.index]
+        cast_class = ref.obj.jclass
+        if cast_class is not None and cast_class.is_subclass_of(cl_ref.class_name):
+            frame.operand_stack.push_int(1)
+        else:
+            frame.operand_stack.push_int(0)
 
 
 class WIDE(Instruction):
@@ -2897,7 +2895,7 @@ class WIDE(Instruction):
             ins.index = self.index
             const1 = code_parser.read_op()
             const2 = code_parser.read_op()
-            self.const = (const1 << 8) | const2
+            self.const = common_utils.get_short_from_bytes(const1, const2)
             ins.const = self.const
             self.ins = ins
 
@@ -2916,11 +2914,11 @@ class IF_NULL(JUMP_INC):
     def read_operands(self, code_parser):
         branch1 = code_parser.read_op()
         branch2 = code_parser.read_op()
-        self.branch = (branch1 << 8) | branch2
+        self.branch = common_utils.get_short_from_bytes(branch1, branch2)
 
     def execute(self, frame):
         ref = frame.operand_stack.pop_ref()
-        if ref is None or ref.handler is None or ref.handler.obj is None:
+        if ref is None or ref.obj is None:
             self.jump_by(frame, self.branch)
 
 
@@ -2935,11 +2933,11 @@ class IF_NON_NULL(JUMP_INC):
     def read_operands(self, code_parser):
         branch1 = code_parser.read_op()
         branch2 = code_parser.read_op()
-        self.branch = (branch1 << 8) | branch2
+        self.branch = common_utils.get_short_from_bytes(branch1, branch2)
 
     def execute(self, frame):
         ref = frame.operand_stack.pop_ref()
-        if ref is not None and ref.handler is not None and ref.handler.obj is not None:
+        if ref is not None and ref.obj is not None:
             self.jump_by(frame, self.branch)
 
 
@@ -2948,6 +2946,13 @@ class ATHROW(JUMP_INC):
     name = 'athrow'
 
     def execute(self, frame):
+        ATHROW.throw(frame, frame.thread.pc)
+
+    # pc 是 athrow 指令自己的 pc
+    # 只有 try 块 [start_pc, end_pc) 覆盖抛出位置的异常处理才生效，
+    # 调用者的 frame.pc 是调用指令的下一条，减 1 落在调用指令上
+    @staticmethod
+    def throw(frame, pc):
         thread = frame.thread
         ref = frame.operand_stack.pop_ref()
         exceptions = frame.method.exceptions
@@ -2955,13 +2960,21 @@ class ATHROW(JUMP_INC):
         catched = False
         while exceptions is not None:
             for ex in exceptions:
+                if not ex.start_pc <= pc < ex.end_pc:
+                    continue
+                if ex.catch_type == 0:  # finally
+                    frame.operand_stack.clear()
+                    frame.operand_stack.push_ref(ref)
+                    frame.pc = ex.handler_pc
+                    catched = True
+                    break
                 cl_ref = frame.method.jclass.constant_pool.constants[ex.catch_type]
-                jclass = ref.handler.obj.jclass
+                jclass = ref.obj.jclass
                 while jclass is not None and jclass.name != 'java/lang/Object':
                     if cl_ref.class_name == jclass.name:
                         frame.operand_stack.clear()
                         frame.operand_stack.push_ref(ref)
-                        self.jump_to(frame, ex.handler_pc)
+                        frame.pc = ex.handler_pc
                         catched = True
                         break
                     jclass = jclass.super_class
@@ -2974,8 +2987,9 @@ class ATHROW(JUMP_INC):
                 break
             frame = thread.top_frame()
             exceptions = frame.method.exceptions
+            pc = frame.pc - 1
         if not catched:
-            error_handler.rise_runtime_error('none catched exception: ' + ref.handler.obj.jclass.name)
+            error_handler.rise_runtime_error('none catched exception: ' + ref.obj.jclass.name)
 
 
 instruction_cache = dict()
@@ -3153,6 +3167,7 @@ register_instruction(LSTORE_3)
 register_instruction(IMPDEP1)
 register_instruction(IMPDEP2)
 register_instruction(INVOKESPECIAL)
+register_instruction(INVOKEINTERFACE)
 register_instruction(INVOKESTATIC)
 register_instruction(INVOKEVIRTUAL)
 register_instruction(RETURN)
@@ -3168,6 +3183,7 @@ register_instruction(NEW)
 register_instruction(NEWARRAY)
 register_instruction(ANEWARRAY)
 register_instruction(ARRAY_LENGTH)
+register_instruction(MULTIANEWARRAY)
 register_instruction(POP)
 register_instruction(POP2)
 register_instruction(PUTFIELD)
@@ -3190,6 +3206,21 @@ def get_instruction(code):
     error_handler.rise_runtime_error('sorry! code %x is not realized!' % code)
 
 
+# 方法第一次执行时整体解码，得到按 pc 索引的指令数组，操作数都已经读好
+# 非指令起始位置为 None，每条指令记录下一条指令的 pc
+def decode_method(method):
+    code = method.code
+    instructions = [None] * len(code)
+    code_parser = CodeParser(code)
+    while code_parser.pc < len(code):
+        pc = code_parser.pc
+        ins = get_instruction(code_parser.read_code())
+        ins.read_operands(code_parser)
+        ins.next_pc = code_parser.pc
+        instructions[pc] = ins
+    return tuple(instructions)
+
+
 if __name__ == '__main__':
     print(sorted(instruction_cache))
     for code in range(255):
@@ -0,0 +1,230 @@
+# coding=utf-8
+
+import math
+from array import array
+
+from runtime.jobject import JArray, JRef
+from runtime.native import NativeMethods
+from runtime.thread import OperandStack
+from base.utils import error_handler, math_utils
+from jgc.gc import GC
+
+
+# System.arraycopy 和 java.util.Arrays 的批量数组操作，注册到 NativeMethods，调用时不建 frame
+# 直接在 JArray.data (array.array 或者 list) 上做切片赋值，排序和比较，不用在解释器里一个元素一个元素地循环
+
+SYSTEM = 'java/lang/System'
+ARRAYS = 'java/util/Arrays'
+OBJECT = 'Ljava/lang/Object;'
+PRIMITIVES = ('Z', 'B', 'C', 'S', 'I', 'J', 'F', 'D')
+
+# 从操作数栈上取一个元素
+POP_ELEMENT = {'Z': OperandStack.pop_int, 'B': OperandStack.pop_int, 'C': OperandStack.pop_int,
+               'S': OperandStack.pop_int, 'I': OperandStack.pop_int, 'J': OperandStack.pop_long,
+               'F': OperandStack.pop_float, 'D': OperandStack.pop_double, OBJECT: OperandStack.pop_ref}
+
+FLOAT_NAN_BITS = 0x7fc00000
+DOUBLE_NAN_BITS = 0x7ff8000000000000
+
+
+def array_obj(ref):
+    if ref is None or ref.obj is None:
+        error_handler.rise_null_point_error()
+    return ref.obj
+
+
+def check_range(length, start, end):
+    if start > end:
+        error_handler.rise_runtime_error('java.lang.IllegalArgumentException: fromIndex(%d) > toIndex(%d)' % (start, end))
+    if start < 0 or end > length:
+        error_handler.rise_runtime_error('java.lang.ArrayIndexOutOfBoundsException: %d' % (start if start < 0 else end))
+
+
+# 引用数组批量写入之后补上写屏障
+def ref_barrier(holder, values):
+    if GC.barrier_enabled:
+        for value in values:
+            GC.write_barrier(holder, value)
+
+
+# System.arraycopy(Object src, int srcPos, Object dest, int destPos, int length)
+# 先切出源数据再赋值，src 和 dest 是同一个数组并且区间重叠时也正确
+# 引用数组不检查每个元素能否存入 dest 的元素类型
+def arraycopy(frame):
+    operand_stack = frame.operand_stack
+    length = operand_stack.pop_int()
+    dest_pos = operand_stack.pop_int()
+    dest = operand_stack.pop_ref()
+    src_pos = operand_stack.pop_int()
+    src = operand_stack.pop_ref()
+    src_obj = array_obj(src)
+    dest_obj = array_obj(dest)
+    if not isinstance(src_obj, JArray) or not isinstance(dest_obj, JArray) or src_obj.atype != dest_obj.atype:
+        error_handler.rise_runtime_error('java.lang.ArrayStoreException: arraycopy: type mismatch')
+    if src_pos < 0 or dest_pos < 0 or length < 0 \
+            or src_pos + length > len(src_obj.data) or dest_pos + length > len(dest_obj.data):
+        error_handler.rise_runtime_error('java.lang.ArrayIndexOutOfBoundsException: arraycopy: last source index %d '
+                                         'out of bounds' % (src_pos + length))
+    values = src_obj.data[src_pos:src_pos + length]
+    dest_obj.data[dest_pos:dest_pos + length] = values
+    if dest_obj.atype == JArray.T_REF:
+        ref_barrier(dest, values)
+
+
+# Arrays.fill(a, val) / Arrays.fill(a, fromIndex, toIndex, val)
+def fill(element, ranged):
+    pop_element = POP_ELEMENT[element]
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        value = pop_element(operand_stack)
+        if ranged:
+            end = operand_stack.pop_int()
+            start = operand_stack.pop_int()
+        ref = operand_stack.pop_ref()
+        obj = array_obj(ref)
+        data = obj.data
+        if ranged:
+            check_range(len(data), start, end)
+        else:
+            start, end = 0, len(data)
+        if element == OBJECT:
+            data[start:end] = [value] * (end - start)
+            ref_barrier(ref, (value,))
+        else:
+            data[start:end] = array(JArray.TYPECODES[obj.atype], (value,)) * (end - start)
+    return execute
+
+
+# Arrays.copyOf(original, newLength) / Arrays.copyOfRange(original, from, to)
+# 新数组和原数组的类型一样，超出原数组的部分是 0 或者 null
+def copy_of(ranged):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        if ranged:
+            end = operand_stack.pop_int()
+            start = operand_stack.pop_int()
+        else:
+            end = operand_stack.pop_int()
+            start = 0
+        ref = operand_stack.pop_ref()
+        length = len(array_obj(ref).data)
+        if end - start < 0:
+            if ranged:
+                error_handler.rise_runtime_error('java.lang.IllegalArgumentException: %d > %d' % (start, end))
+            error_handler.rise_runtime_error('java.lang.NegativeArraySizeException: %d' % end)
+        if start < 0 or start > length:
+            error_handler.rise_runtime_error('java.lang.ArrayIndexOutOfBoundsException: %d' % start)
+        # 分配新数组可能触发 gc，期间原数组放在 handles 里，gc 之后要重新取 ref.obj
+        handles = frame.thread.handles
+        handles.append(ref)
+        try:
+            new_ref = JRef.new_array_like(ref.obj, end - start)
+        finally:
+            handles.pop()
+        original = ref.obj
+        values = original.data[start:min(end, length)]
+        new_ref.obj.data[:len(values)] = values
+        if original.atype == JArray.T_REF:
+            ref_barrier(new_ref, values)
+        operand_stack.push_ref(new_ref)
+    return execute
+
+
+# Float.floatToIntBits / Double.doubleToLongBits，NaN 统一成标准的 NaN
+def float_bits(data):
+    if data.itemsize == 4:
+        bits, nan = array('i', data.tobytes()), FLOAT_NAN_BITS
+    else:
+        bits, nan = array('q', data.tobytes()), DOUBLE_NAN_BITS
+    return [nan if value != value else bit for value, bit in zip(data, bits)]
+
+
+# Arrays.equals(a, a2)，float / double 和 java 一样按位比较: NaN 等于 NaN，0.0 不等于 -0.0
+def equals(element):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        ref2 = operand_stack.pop_ref()
+        ref1 = operand_stack.pop_ref()
+        null1 = JRef.check_null(ref1)
+        null2 = JRef.check_null(ref2)
+        if null1 or null2:
+            result = null1 and null2
+        elif ref1.obj is ref2.obj:
+            result = True
+        elif element in ('F', 'D'):
+            result = len(ref1.obj.data) == len(ref2.obj.data) and float_bits(ref1.obj.data) == float_bits(ref2.obj.data)
+        else:
+            result = ref1.obj.data == ref2.obj.data
+        operand_stack.push_int(1 if result else 0)
+    return execute
+
+
+# Arrays.hashCode(a): result = 31 * result + 元素的 hashCode，null 返回 0
+def hash_code(element):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        ref = operand_stack.pop_ref()
+        if JRef.check_null(ref):
+            operand_stack.push_int(0)
+            return
+        data = ref.obj.data
+        if element == 'Z':
+            values = [1231 if value else 1237 for value in data]
+        elif element == 'F':
+            values = float_bits(data)
+        elif element in ('J', 'D'):
+            values = float_bits(data) if element == 'D' else data
+            values = [value ^ ((value & math_utils.LONG_MASK) >> 32) for value in values]
+        else:
+            values = data
+        result = 1
+        for value in values:
+            result = (31 * result + value) & math_utils.INT_MASK
+        operand_stack.push_int(math_utils.to_int(result))
+    return execute
+
+
+# float / double 排序和 Double.compare 一致: -0.0 排在 0.0 前面，NaN 排在最后
+def float_key(value):
+    return value != value, value, math.copysign(1.0, value)
+
+
+# Arrays.sort(a) / Arrays.sort(a, fromIndex, toIndex)，只有基本类型数组
+def sort(element, ranged):
+    key = float_key if element in ('F', 'D') else None
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        if ranged:
+            end = operand_stack.pop_int()
+            start = operand_stack.pop_int()
+        obj = array_obj(operand_stack.pop_ref())
+        data = obj.data
+        if ranged:
+            check_range(len(data), start, end)
+        else:
+            start, end = 0, len(data)
+        data[start:end] = array(JArray.TYPECODES[obj.atype], sorted(data[start:end], key=key))
+    return execute
+
+
+def register_all():
+    NativeMethods.register(SYSTEM, 'arraycopy', '(%sI%sII)V' % (OBJECT, OBJECT), arraycopy)
+    for element in PRIMITIVES + (OBJECT,):
+        desc = '[' + element
+        NativeMethods.register(ARRAYS, 'fill', '(%s%s)V' % (desc, element), fill(element, False))
+        NativeMethods.register(ARRAYS, 'fill', '(%sII%s)V' % (desc, element), fill(element, True))
+        NativeMethods.register(ARRAYS, 'copyOf', '(%sI)%s' % (desc, desc), copy_of(False))
+        NativeMethods.register(ARRAYS, 'copyOfRange', '(%sII)%s' % (desc, desc), copy_of(True))
+    # 引用数组的 equals / hashCode / sort 要调用元素的 equals / hashCode / compareTo，不能在这里直接算
+    for element in PRIMITIVES:
+        desc = '[' + element
+        NativeMethods.register(ARRAYS, 'equals', '(%s%s)Z' % (desc, desc), equals(element))
+        NativeMethods.register(ARRAYS, 'hashCode', '(%s)I' % desc, hash_code(element))
+        if element != 'Z':
+            NativeMethods.register(ARRAYS, 'sort', '(%s)V' % desc, sort(element, False))
+            NativeMethods.register(ARRAYS, 'sort', '(%sII)V' % desc, sort(element, True))
+
+
+register_all()
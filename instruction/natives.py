@@ -0,0 +1,260 @@
+# coding=utf-8
+
+import math
+import time
+
+from runtime.native import NativeMethods
+from runtime.thread import OperandStack
+from base.utils import print_utils, error_handler, math_utils
+from jthread.jthread import JThread
+from jgc.gc import GC, ReferenceProcessor
+
+# 精简 jdk 里 java.lang 和 java.io 的 native 方法: Object，System，Math，Thread.start，PrintStream.println
+# 和 ReferenceQueue.remove
+
+OBJECT = 'java/lang/Object'
+SYSTEM = 'java/lang/System'
+MATH = 'java/lang/Math'
+THREAD = 'java/lang/Thread'
+PRINT_STREAM = 'java/io/PrintStream'
+REFERENCE_QUEUE = 'java/lang/ref/ReferenceQueue'
+
+NAN = math_utils.NAN
+INF = math_utils.INF
+
+
+def pop_this(operand_stack):
+    ref = operand_stack.pop_ref()
+    if ref is None or ref.obj is None:
+        error_handler.rise_null_point_error()
+    return ref
+
+
+# Object 的构造方法什么都不做
+def object_init(frame):
+    frame.operand_stack.pop_ref()
+
+
+def object_hash_code(frame):
+    operand_stack = frame.operand_stack
+    operand_stack.push_int(pop_this(operand_stack).obj.identity_hash())
+
+
+def object_equals(frame):
+    operand_stack = frame.operand_stack
+    other = operand_stack.pop_ref()
+    this = pop_this(operand_stack)
+    operand_stack.push_int(1 if other is not None and other.obj is this.obj else 0)
+
+
+def nano_time(frame):
+    frame.operand_stack.push_long(time.monotonic_ns())
+
+
+def current_time_millis(frame):
+    frame.operand_stack.push_long(int(time.time() * 1000))
+
+
+# 在新线程里执行 this 的 run 方法 (按虚方法表分派)，线程结束之前 this 一直是 gc root
+def thread_start(frame):
+    this = pop_this(frame.operand_stack)
+    jclass = this.obj.jclass
+    run = jclass.vtable[jclass.vtable_map[('run', '()V')]]
+    JThread.start_new_thread(run, this)
+
+
+# 和 ReferenceQueue.poll 一样取下队头
+def poll_queue(queue):
+    ref = queue.obj.get_field('head')
+    if ref is not None:
+        next_ref = ref.obj.get_field('next')
+        queue.obj.put_field('head', next_ref)
+        ref.obj.put_field('next', None)
+        if GC.barrier_enabled:
+            GC.write_barrier(queue, next_ref)
+    return ref
+
+
+# ReferenceQueue.remove()，队列是空的就阻塞，gc 往 (任意一个) 队列里挂了引用之后再看一次
+# 等待期间当作停在安全点，queue 放在 handles 里，gc 搬移之后 queue.obj 是新的位置
+def reference_queue_remove(frame):
+    operand_stack = frame.operand_stack
+    queue = pop_this(operand_stack)
+    handles = frame.thread.handles
+    handles.append(queue)
+    try:
+        ref = poll_queue(queue)
+        while ref is None:
+            enqueued = ReferenceProcessor.enqueued
+            GC.wait_until(lambda: ReferenceProcessor.enqueued != enqueued)
+            ref = poll_queue(queue)
+    finally:
+        handles.pop()
+    operand_stack.push_ref(ref)
+
+
+# PrintStream.println(x)，返回 this
+def println(pop, to_msg):
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        value = pop(operand_stack)
+        this = operand_stack.pop_ref()
+        print_utils.StreamPrinter.append_msg(frame.thread, to_msg(value))
+        operand_stack.push_ref(this)
+    return execute
+
+
+def string_msg(jstring):
+    return 'null' if jstring is None else jstring.data
+
+
+def boolean_msg(value):
+    return 'true' if value else 'false'
+
+
+def same(value):
+    return value
+
+
+# Math 的实现，特殊值 (NaN，无穷大，-0.0) 的处理和 java 一致，python 的 math 在这些情况下会抛异常
+def is_odd_integer(value):
+    return math.isfinite(value) and value == math.floor(value) and math.fmod(value, 2.0) != 0.0
+
+
+def java_pow(a, b):
+    if b != b or (abs(a) == 1.0 and math.isinf(b)):
+        return NAN
+    try:
+        return math.pow(a, b)
+    except ValueError:
+        if a != 0.0:
+            return NAN
+    except OverflowError:
+        pass
+    # 0 的负数次方，或者结果溢出
+    negative = (a < 0.0 or math.copysign(1.0, a) < 0.0) and is_odd_integer(b)
+    return -INF if negative else INF
+
+
+def java_sqrt(value):
+    return math.sqrt(value) if value >= 0.0 else NAN
+
+
+def java_exp(value):
+    try:
+        return math.exp(value)
+    except OverflowError:
+        return INF
+
+
+def java_log(value):
+    if value > 0.0:
+        return math.log(value)
+    if value == 0.0:
+        return -INF
+    return NAN
+
+
+# sin / cos / tan 的参数是 NaN 或者无穷大时返回 NaN
+def finite_only(function):
+    def java_function(value):
+        return function(value) if math.isfinite(value) else NAN
+    return java_function
+
+
+# floor / ceil 保留 NaN，无穷大和 0 的符号
+def java_floor(value):
+    if not math.isfinite(value) or value == 0.0:
+        return value
+    return float(math.floor(value))
+
+
+def java_ceil(value):
+    if not math.isfinite(value) or value == 0.0:
+        return value
+    result = float(math.ceil(value))
+    return -0.0 if result == 0.0 and value < 0.0 else result
+
+
+# 浮点数的 max / min: 有 NaN 返回 NaN，0.0 比 -0.0 大
+def float_max(a, b):
+    if a != a or b != b:
+        return NAN
+    if a == 0.0 and b == 0.0:
+        return b if math.copysign(1.0, a) < 0.0 else a
+    return a if a >= b else b
+
+
+def float_min(a, b):
+    if a != a or b != b:
+        return NAN
+    if a == 0.0 and b == 0.0:
+        return a if math.copysign(1.0, a) < 0.0 else b
+    return a if a <= b else b
+
+
+# 类型描述符: (取参数，压返回值)
+STACK_OPS = {'I': (OperandStack.pop_int, OperandStack.push_int),
+             'J': (OperandStack.pop_long, OperandStack.push_long),
+             'F': (OperandStack.pop_float, OperandStack.push_float),
+             'D': (OperandStack.pop_double, OperandStack.push_double)}
+
+
+def unary(element, function):
+    pop, push = STACK_OPS[element]
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        push(operand_stack, function(pop(operand_stack)))
+    return execute
+
+
+def binary(element, function):
+    pop, push = STACK_OPS[element]
+
+    def execute(frame):
+        operand_stack = frame.operand_stack
+        b = pop(operand_stack)
+        a = pop(operand_stack)
+        push(operand_stack, function(a, b))
+    return execute
+
+
+def register_math():
+    abs_functions = {'I': lambda value: math_utils.to_int(abs(value)),
+                     'J': lambda value: math_utils.to_long(abs(value)),
+                     'F': abs, 'D': abs}
+    for element in ('I', 'J', 'F', 'D'):
+        NativeMethods.register(MATH, 'abs', '(%s)%s' % (element, element), unary(element, abs_functions[element]))
+        floating = element in ('F', 'D')
+        NativeMethods.register(MATH, 'max', '(%s%s)%s' % (element, element, element),
+                               binary(element, float_max if floating else max))
+        NativeMethods.register(MATH, 'min', '(%s%s)%s' % (element, element, element),
+                               binary(element, float_min if floating else min))
+    for name, function in (('sqrt', java_sqrt), ('exp', java_exp), ('log', java_log),
+                           ('sin', finite_only(math.sin)), ('cos', finite_only(math.cos)),
+                           ('tan', finite_only(math.tan)), ('atan', math.atan),
+                           ('floor', java_floor), ('ceil', java_ceil)):
+        NativeMethods.register(MATH, name, '(D)D', unary('D', function))
+    NativeMethods.register(MATH, 'pow', '(DD)D', binary('D', java_pow))
+    NativeMethods.register(MATH, 'atan2', '(DD)D', binary('D', math.atan2))
+
+
+def register_all():
+    NativeMethods.register(OBJECT, '<init>', '()V', object_init)
+    NativeMethods.register(OBJECT, 'hashCode', '()I', object_hash_code)
+    NativeMethods.register(OBJECT, 'equals', '(Ljava/lang/Object;)Z', object_equals)
+    NativeMethods.register(SYSTEM, 'nanoTime', '()J', nano_time)
+    NativeMethods.register(SYSTEM, 'currentTimeMillis', '()J', current_time_millis)
+    NativeMethods.register(THREAD, 'start', '()V', thread_start)
+    NativeMethods.register(REFERENCE_QUEUE, 'remove', '()Ljava/lang/ref/Reference;', reference_queue_remove)
+    for desc, pop, to_msg in (('Ljava/lang/String;', OperandStack.pop_ref, string_msg),
+                              ('I', OperandStack.pop_int, same), ('S', OperandStack.pop_int, same),
+                              ('B', OperandStack.pop_int, same), ('C', OperandStack.pop_int, chr),
+                              ('J', OperandStack.pop_long, same), ('D', OperandStack.pop_double, same),
+                              ('F', OperandStack.pop_float, same), ('Z', OperandStack.pop_int, boolean_msg)):
+        NativeMethods.register(PRINT_STREAM, 'println', '(%s)Ljava/io/PrintStream;' % desc, println(pop, to_msg))
+    register_math()
+
+
+register_all()
@@ -1,10 +1,9 @@
 # coding=utf-8
 
-from runtime.thread import Thread, Frame, JavaStack
 from runtime.jclass import Method
+from base import jvm_config
 from base.utils import print_utils, error_handler
-from instruction import instruction
-from interpreter.code_parser import CodeParser
+from instruction import instruction, handlers
 from jgc.gc import GC
 import threading
 
@@ -13,34 +12,87 @@ class Interpreter(object):
     def __init__(self):
         self.thread = None
 
-    def run(self, method):
-        print_utils.print_jvm_status(threading.currentThread.__name__)
+    # args 是放到局部变量表开头的 ref，比如 finalize 的 this
+    def run(self, method, args=()):
+        print_utils.print_jvm_status('%s', threading.current_thread().name)
         print_utils.print_jvm_status('\n=================== running status =====================\n')
-        self.thread = Thread.new_thread()
+        self.thread = GC.new_thread()
         thread = self.thread
-        frame = Frame(thread, method)
+        frame = thread.new_frame(method)
+        for index, ref in enumerate(args):
+            frame.local_vars.add_ref(index, ref)
         thread.add_frame(frame)
-        code_parser = CodeParser(method.code)
+        # 启动时选好循环，关闭 log 时执行路径上没有任何 trace 代码
+        if jvm_config.log_jvm_status:
+            Interpreter.__loop_traced(thread)
+        elif jvm_config.interpreter_mode == jvm_config.INTERPRETER_FAST:
+            Interpreter.__loop_fast(thread)
+        else:
+            Interpreter.__loop(thread)
+
+        print_utils.print_jvm_status('\n=================== output =====================')
+        print_utils.StreamPrinter.print_all(thread)
+        GC.finish_thread(thread)
+
+    # debug 模式逐条执行指令对象，可以在各条指令的 execute 里下断点
+    # 执行前检查 pc 落在指令的起始位置，执行后检查操作数栈没有弹空或者越界，出错时报出方法和 pc
+    @staticmethod
+    def __loop(thread):
         while True:
             if not thread.has_frame():
                 break
-            GC.check_gc()
             frame = thread.top_frame()
             method = frame.method
-            code_parser.reset(method.code, frame.pc)
-            ins_code = code_parser.read_code()
-            print_utils.print_jvm_status('ins_code: %x' % ins_code)
-            ins = instruction.get_instruction(ins_code)
-            ins.read_operands(code_parser)
-            thread.pc = frame.pc  # 保存上一条 pc
-            frame.pc = code_parser.pc
+            instructions = method.instructions
+            if instructions is None:  # 第一次执行时解码
+                instructions = instruction.decode_method(method)
+                method.instructions = instructions
+            pc = frame.pc
+            ins = instructions[pc] if 0 <= pc < len(instructions) else None
+            if ins is None:
+                error_handler.rise_runtime_error('bad pc %d in %s.%s%s: not an instruction start'
+                                                 % (pc, method.jclass.name, method.name, method.descriptor))
+            thread.pc = pc  # 保存上一条 pc
+            frame.pc = ins.next_pc
+            ins.execute(frame)
+            depth = frame.operand_stack.depth()
+            if depth < 0 or depth > frame.max_stack:
+                error_handler.rise_runtime_error('operand stack depth %d (max %d) after %s at %s.%s%s pc=%d'
+                                                 % (depth, frame.max_stack, ins.name, method.jclass.name,
+                                                    method.name, method.descriptor, pc))
+
+    # 每条指令执行前输出 trace
+    @staticmethod
+    def __loop_traced(thread):
+        while thread.has_frame():
+            frame = thread.top_frame()
+            method = frame.method
+            instructions = method.instructions
+            if instructions is None:
+                instructions = instruction.decode_method(method)
+                method.instructions = instructions
+            ins = instructions[frame.pc]
+            thread.pc = frame.pc
+            frame.pc = ins.next_pc
             ins.execute_wrapper(frame)
 
-        print_utils.print_jvm_status('\n=================== output =====================')
-        print_utils.StreamPrinter.print_all(thread)
-        Thread.finish_thread(thread)
+    # 直接调用 handlers.decode_handlers 生成的闭包，不经过指令对象
+    # handler 自己绑定了 pc，不需要维护 thread.pc，handler 返回 True 时栈顶 frame 变了，重新取 frame 和 handler 表
+    @staticmethod
+    def __loop_fast(thread):
+        frames = thread.all_frames()
+        decode_handlers = handlers.decode_handlers
+        while frames:
+            frame = frames[-1]
+            table = frame.method.handlers
+            if table is None:
+                table = decode_handlers(frame.method)
+            while True:
+                handler, frame.pc = table[frame.pc]
+                if handler(frame):
+                    break
 
     @staticmethod
-    def exec_method(method):
+    def exec_method(method, args=()):
         m_interpreter = Interpreter()
-        m_interpreter.run(method)
+        m_interpreter.run(method, args)
@@ -1,96 +1,1043 @@
 # coding=utf-8
 
-from base.utils import print_utils
+from base.utils import print_utils, error_handler
+from jgc.ref_map import RefMap
+from jgc import parallel_mark
 from runtime.thread import Thread
 import runtime
 
+from array import array
+from collections import deque
+import sys
 import threading
+import time
 
 
+class GCEvent(object):
+    __slots__ = ('gc_id', 'kind', 'cause', 'start', 'pause', 'used_before', 'used_after', 'capacity',
+                 'objects_before', 'objects_after', 'promoted', 'roots')
+
+    def __init__(self, gc_id, kind, cause):
+        self.gc_id = gc_id
+        self.kind = kind
+        self.cause = cause
+        self.start = 0.0  # 距离虚拟机启动的秒数
+        self.pause = 0.0  # 停顿时间 (秒)，包括等其他线程到达安全点的时间
+        self.used_before = 0
+        self.used_after = 0
+        self.capacity = 0
+        self.objects_before = 0
+        self.objects_after = 0
+        self.promoted = 0  # 晋升到老年代的对象数
+        self.roots = 0  # 扫描的根的个数
+
+
+# gc 日志: 每次停顿记一个 GCEvent，最近 RING_SIZE 个放在环形缓冲里，总次数和总停顿时间单独累计
+# -Xlog:gc 时每个事件输出一行 (类似 hotspot 的 unified logging)，退出时输出汇总
+# 堆的使用情况通过 heap_usage 回调拿到，返回 (已用字节, 容量, 对象个数, 累计分配的字节)
+class GCLog(object):
+    RING_SIZE = 1024
+
+    PAUSE_FULL = 'Pause Full'
+    PAUSE_YOUNG = 'Pause Young'
+    PAUSE_MARK_START = 'Pause Mark Start'
+    PAUSE_MARK = 'Pause Mark'
+    PAUSE_REMARK = 'Pause Remark'
+
+    CAUSE_ALLOCATION = 'Allocation Failure'
+    CAUSE_OCCUPANCY = 'Occupancy'
+    CAUSE_INCREMENTAL = 'Incremental'
+
+    events = deque(maxlen=RING_SIZE)
+    enabled = False
+    output = None
+    start_time = time.time()
+    heap_usage = None
+    gc_count = 0
+    total_pause = 0.0
+    current = []  # 正在进行的事件，gc 可能嵌套
+
+    @staticmethod
+    def open(enabled, log_file=None):
+        GCLog.enabled = enabled
+        GCLog.output = sys.stdout
+        if enabled and log_file is not None:
+            GCLog.output = open(log_file, 'w')
+        GCLog.start_time = time.time()
+
+    @staticmethod
+    def close():
+        if GCLog.output is not None and GCLog.output is not sys.stdout:
+            GCLog.output.close()
+        GCLog.output = None
+
+    # 在停下所有线程之后调用 (同一时间只有一个 gc)，start 是开始请求停下线程的时间
+    @staticmethod
+    def begin(kind, cause, start):
+        event = GCEvent(GCLog.gc_count, kind, cause)
+        GCLog.gc_count += 1
+        if GCLog.heap_usage is not None:
+            event.used_before, _, event.objects_before, _ = GCLog.heap_usage()
+        event.start = start - GCLog.start_time
+        GCLog.current.append(event)
+
+    @staticmethod
+    def add_roots(count):
+        if GCLog.current:
+            GCLog.current[-1].roots += count
+
+    @staticmethod
+    def add_promoted(count):
+        if GCLog.current:
+            GCLog.current[-1].promoted += count
+
+    @staticmethod
+    def end():
+        event = GCLog.current.pop()
+        event.pause = time.time() - GCLog.start_time - event.start
+        if GCLog.heap_usage is not None:
+            event.used_after, event.capacity, event.objects_after, _ = GCLog.heap_usage()
+        GCLog.events.append(event)
+        GCLog.total_pause += event.pause
+        if GCLog.enabled:
+            GCLog.write(GCLog.format_event(event))
+
+    @staticmethod
+    def write(line):
+        GCLog.output.write('[%.3fs][info][gc] %s\n' % (time.time() - GCLog.start_time, line))
+
+    @staticmethod
+    def format_event(event):
+        line = 'GC(%d) %s (%s) %s->%s(%s) %.3fms objects %d->%d roots %d' % (
+            event.gc_id, event.kind, event.cause, GCLog.format_size(event.used_before),
+            GCLog.format_size(event.used_after), GCLog.format_size(event.capacity), event.pause * 1000,
+            event.objects_before, event.objects_after, event.roots)
+        if event.promoted:
+            line += ' promoted %d' % event.promoted
+        return line
+
+    @staticmethod
+    def format_size(size):
+        if size >= 1024 * 1024:
+            return '%.1fM' % (size / 1024.0 / 1024.0)
+        if size >= 1024:
+            return '%dK' % (size // 1024)
+        return '%dB' % size
+
+    # 按从小到大排好的序列取百分位
+    @staticmethod
+    def percentile(values, p):
+        if not values:
+            return 0.0
+        index = int(round(p / 100.0 * (len(values) - 1)))
+        return values[index]
+
+    # 汇总: 停顿的 p50 / p99 (最近 RING_SIZE 次)，gc 占总时间的比例，分配速率
+    @staticmethod
+    def summary():
+        elapsed = max(time.time() - GCLog.start_time, 1e-9)
+        pauses = sorted(event.pause for event in GCLog.events)
+        used, capacity, objects, allocated = 0, 0, 0, 0
+        if GCLog.heap_usage is not None:
+            used, capacity, objects, allocated = GCLog.heap_usage()
+        return [
+            'summary: %d pauses, total %.3fms, %.2f%% of %.3fs' % (
+                GCLog.gc_count, GCLog.total_pause * 1000, 100.0 * GCLog.total_pause / elapsed, elapsed),
+            'pause p50 %.3fms p99 %.3fms max %.3fms (last %d)' % (
+                GCLog.percentile(pauses, 50) * 1000, GCLog.percentile(pauses, 99) * 1000,
+                (pauses[-1] if pauses else 0.0) * 1000, len(pauses)),
+            'allocated %s, allocation rate %s/s' % (GCLog.format_size(allocated),
+                                                    GCLog.format_size(int(allocated / elapsed))),
+            'heap %s used, %s capacity, %d objects' % (GCLog.format_size(used), GCLog.format_size(capacity), objects),
+        ]
+
+    @staticmethod
+    def print_summary():
+        for line in GCLog.summary():
+            GCLog.write(line)
+
+
+# 线程只在安全点 (回边，方法进入和返回) 检查 safepoint_poll，需要 gc 或者增量标记时才打开
+# gc 前先请求所有线程停下来，等其他线程都停在安全点之后再开始，gc 结束后唤醒它们
+# 正在分配对象而触发 gc 的线程自己也在一条指令的中间，这时栈上没有悬空的引用
 class GC(object):
-    __gc_lock = threading.RLock()
+    __cond = threading.Condition(threading.RLock())
+    __stop_requested = False
+    __owner = None  # 正在 gc 的线程
+    __depth = 0
+    __parked = 0  # 停在安全点的线程数
+
+    safepoint_poll = False
+
+    # 分代模式下一直打开，增量模式下标记期间打开，PUTFIELD / AASTORE / PUTSTATIC 存引用时调用写屏障
+    barrier_enabled = False
+    barrier_handler = None  # GenGCHandler 或者 IncrementalGCHandler
+
+    # 线程到达安全点
+    @staticmethod
+    def safepoint():
+        if GC.__stop_requested:
+            GC.__park()
+        if IncrementalGCHandler.marking:
+            IncrementalGCHandler.poll()
 
     @staticmethod
-    def check_gc():  # gc 的时候要暂停所有线程
-        GC.__gc_lock.acquire()
-        GC.__gc_lock.release()
+    def update_safepoint_poll():
+        GC.safepoint_poll = GC.__stop_requested or IncrementalGCHandler.marking
 
     @staticmethod
-    def start_gc(heap, static_fields):
+    def __park():
+        cond = GC.__cond
+        with cond:
+            if GC.__owner is threading.current_thread():
+                return
+            GC.__parked += 1
+            cond.notify_all()
+            while GC.__stop_requested:
+                cond.wait()
+            GC.__parked -= 1
+
+    @staticmethod
+    def __stop_the_world():
+        cond = GC.__cond
+        cond.acquire()
+        current = threading.current_thread()
+        if GC.__owner is current:
+            GC.__depth += 1
+            return
+        # 别的线程正在 gc，当作停在安全点，等它做完
+        while GC.__stop_requested:
+            GC.__parked += 1
+            cond.notify_all()
+            cond.wait()
+            GC.__parked -= 1
+        GC.__stop_requested = True
+        GC.__owner = current
+        GC.__depth = 1
+        GC.update_safepoint_poll()
+        while GC.__parked < GC.__running_threads(current):
+            cond.wait()
+
+    # 线程在虚拟机代码里阻塞等待 ready() 为真 (比如 ReferenceQueue.remove)，等待期间当作停在安全点，gc 可以照常进行
+    # ready 在持有锁并且没有 gc 时检查，gc 结束唤醒所有线程时会重新检查，返回时没有 gc 在进行
+    @staticmethod
+    def wait_until(ready):
+        cond = GC.__cond
+        with cond:
+            GC.__parked += 1
+            cond.notify_all()
+            while GC.__stop_requested or not ready():
+                cond.wait()
+            GC.__parked -= 1
+
+    @staticmethod
+    def __running_threads(current):
+        count = 0
+        for thread in Thread.all_thread():
+            if thread.name != current.name:
+                count += 1
+        return count
+
+    @staticmethod
+    def __resume_the_world():
+        cond = GC.__cond
+        GC.__depth -= 1
+        if GC.__depth == 0:
+            GC.__stop_requested = False
+            GC.__owner = None
+            GC.update_safepoint_poll()
+            cond.notify_all()
+        cond.release()
+
+    # 线程的创建和退出也要和 gc 同步，gc 过程中新线程要等 gc 结束才能加入
+    @staticmethod
+    def new_thread():
+        with GC.__cond:
+            while GC.__stop_requested:
+                GC.__cond.wait()
+            return Thread.new_thread()
+
+    @staticmethod
+    def finish_thread(thread):
+        with GC.__cond:
+            Thread.finish_thread(thread)
+            GC.__cond.notify_all()
+
+    # 复制 gc，返回复制好的 to-space
+    @staticmethod
+    def start_gc(collect_static_field, cause=GCLog.CAUSE_ALLOCATION):
         print_utils.print_jvm_status("!!!!!! start gc !!!!!!")
-        GC.__gc_lock.acquire()
-        return GCHandler.start_gc(heap, static_fields)
+        start = time.time()
+        GC.__stop_the_world()
+        GCLog.begin(GCLog.PAUSE_FULL, cause, start)
+        roots = GCHandler.collect_root()
+        roots.extend(collect_static_field())
+        GCLog.add_roots(len(roots))
+        return GCHandler.start_gc(roots)
+
+    # 只回收新生代，返回晋升到老年代的对象
+    @staticmethod
+    def start_minor_gc(young, tenure_threshold, cause=GCLog.CAUSE_ALLOCATION):
+        print_utils.print_jvm_status("!!!!!! start minor gc !!!!!!")
+        start = time.time()
+        GC.__stop_the_world()
+        GCLog.begin(GCLog.PAUSE_YOUNG, cause, start)
+        return GenGCHandler.minor_gc(young, tenure_threshold)
+
+    # 新生代和老年代一起回收
+    @staticmethod
+    def start_major_gc(young, old, collect_static_field, cause=GCLog.CAUSE_ALLOCATION):
+        print_utils.print_jvm_status("!!!!!! start major gc !!!!!!")
+        start = time.time()
+        GC.__stop_the_world()
+        GCLog.begin(GCLog.PAUSE_FULL, cause, start)
+        GenGCHandler.major_gc(young, old, collect_static_field())
+
+    # 开始一轮增量标记，标记完成后清除并调用 on_finish
+    @staticmethod
+    def start_incremental_gc(heap, collect_static_field, on_finish, cause=GCLog.CAUSE_OCCUPANCY):
+        print_utils.print_jvm_status("!!!!!! start incremental gc !!!!!!")
+        start = time.time()
+        GC.__stop_the_world()
+        GCLog.begin(GCLog.PAUSE_MARK_START, cause, start)
+        try:
+            IncrementalGCHandler.start(heap, collect_static_field, on_finish)
+        finally:
+            GC.stop_gc()
+
+    # 堆满了等不及增量标记，一次做完剩下的标记和清除
+    @staticmethod
+    def finish_incremental_gc(cause=GCLog.CAUSE_ALLOCATION):
+        print_utils.print_jvm_status("!!!!!! finish incremental gc !!!!!!")
+        start = time.time()
+        GC.__stop_the_world()
+        GCLog.begin(GCLog.PAUSE_REMARK, cause, start)
+        IncrementalGCHandler.finish()
 
+    # 做一小步增量标记
+    @staticmethod
+    def incremental_step():
+        start = time.time()
+        GC.__stop_the_world()
+        GCLog.begin(GCLog.PAUSE_MARK, GCLog.CAUSE_INCREMENTAL, start)
+        try:
+            IncrementalGCHandler.step()
+        finally:
+            GC.stop_gc()
+
+    # 结束一次停顿，和上面的 start_xx 一一对应
     @staticmethod
     def stop_gc():
-        GC.__gc_lock.release()
+        GCLog.end()
+        GC.__resume_the_world()
+
+    # holder 的字段 (或者数组元素) 写入了 value
+    @staticmethod
+    def write_barrier(holder, value):
+        GC.barrier_handler.write_barrier(holder, value)
+
+    # 静态字段 slot 写入了 value
+    @staticmethod
+    def static_write_barrier(slot, value):
+        GC.barrier_handler.static_write_barrier(slot, value)
 
 
+# 串行 gc: 半区复制，从根出发把存活对象复制到 to-space，复制完 to-space 就是新的分配空间，from-space 整个丢掉
+# 复制时在旧对象上留下转发指针，同一个对象只复制一次，遇到的 ref (包括字段里的) 都改成指向新对象
+# 分代和增量 gc 不搬移对象，用这里的 mark_alive / sweep 做标记-清除
 class GCHandler(object):
+    global_handles = {}  # id: ref
 
+    # roots 是根上的 ref，返回 to-space
     @staticmethod
-    def start_gc(heap, static_fields):
-        alive_obj = GCHandler.collect_alive_ref(static_fields)
-        alive_list = []
-        index = 0
-        for ref in heap:
-            if ref in alive_obj:
-                alive_list.append(index)
-            index += 1
-        for i in range(len(heap)):
-            if i not in alive_list:
-                heap[i].handler = None
-        for i in range(len(alive_list)):
-            heap[i] = heap[alive_list[i]]
-        return len(alive_list)
-
-    @staticmethod
-    def collect_alive_ref(static_fields):
-        # TODO: gc root 目前只收集了 heap 中的对象 和 static
-        roots = GCHandler.collect_root()
-        roots.extend(static_fields)
-        alive_obj = []
-        for root in roots:
-            obj = root.handler.obj
-            alive_obj.append(root)
-            if obj.type == runtime.jobject.JObject.TYPE_OBJ:
-                GCHandler.collect_obj_ref(root, alive_obj)
-            elif obj.type == runtime.jobject.JObject.TYPE_ARRAY:
-                GCHandler.collect_array_ref(root, alive_obj)
-        return alive_obj
-
-    @staticmethod
-    def collect_obj_ref(ref, alive_obj):
-        obj = ref.handler.obj
-        for o in obj.data.values():
-            if isinstance(o, runtime.jobject.JRef):
-                alive_obj.append(o)
-                GCHandler.collect_obj_ref(o, alive_obj)
-
-    @staticmethod
-    def collect_array_ref(ref, alive_obj):
-        array = ref.handler.obj
-        if array.atype == runtime.jobject.JArray.T_REF:
-            for slot in array.data:
-                aref = slot.ref
-                if aref is not None:
-                    GCHandler.collect_obj_ref(aref, alive_obj)
+    def start_gc(roots):
+        to_space = []
+        evacuate = GCHandler.evacuate
+        for ref in roots:
+            ref.obj = evacuate(ref.obj, to_space)
+        GCHandler.scan(to_space, 0)
+        ReferenceProcessor.process(GCHandler.forwarded, lambda obj: GCHandler.copy_alive(obj, to_space))
+        for obj in to_space:
+            obj.forward = None
+        return to_space
+
+    # to_space[scan:] 是已经复制但字段还没处理的对象 (Cheney 扫描)，不需要额外的工作栈
+    @staticmethod
+    def scan(to_space, scan):
+        evacuate = GCHandler.evacuate
+        while scan < len(to_space):
+            for ref in GCHandler.child_refs(to_space[scan]):
+                ref.obj = evacuate(ref.obj, to_space)
+            scan += 1
+
+    # 已经复制过的对象返回 to-space 里的新对象，否则返回 None
+    @staticmethod
+    def forwarded(obj):
+        return obj.forward
+
+    # 处理引用时让 obj 存活: 复制 obj 和它能到达的对象
+    @staticmethod
+    def copy_alive(obj, to_space):
+        start = len(to_space)
+        new_obj = GCHandler.evacuate(obj, to_space)
+        GCHandler.scan(to_space, start)
+        return new_obj
+
+    @staticmethod
+    def evacuate(obj, to_space):
+        forward = obj.forward
+        if forward is not None:
+            return forward
+        new_obj = obj.move()
+        obj.forward = new_obj
+        new_obj.forward = new_obj  # 已经在 to-space 里，这次 gc 再遇到不用复制
+        to_space.append(new_obj)
+        return new_obj
+
+    # 把存活的对象依次移动到列表前面，删掉后面死掉的对象，返回存活个数
+    @staticmethod
+    def sweep(heap, marked):
+        alive = 0
+        for obj in heap:
+            if id(obj) in marked:
+                heap[alive] = obj
+                alive += 1
+        del heap[alive:]
+        return alive
+
+    # 按并行标记返回的位图清除，start 是 heap 第一个对象在位图里的下标
+    @staticmethod
+    def sweep_bitmap(heap, bitmap, start):
+        alive = 0
+        for i, obj in enumerate(heap):
+            if bitmap[start + i]:
+                heap[alive] = obj
+                alive += 1
+        del heap[alive:]
+        return alive
 
+    # 从根出发用显式的工作栈做标记，不递归，每个对象只访问一次 (有环也没问题)
+    # 标记位是对象的 id()，标记期间这些对象都被堆引用着，id 不会被复用
+    @staticmethod
+    def mark_alive(roots):
+        return GCHandler.mark_from([ref.obj for ref in roots], set())
+
+    @staticmethod
+    def mark_from(worklist, marked):
+        while worklist:
+            obj = worklist.pop()
+            key = id(obj)
+            if key in marked:
+                continue
+            marked.add(key)
+            for child in GCHandler.child_refs(obj):
+                if id(child.obj) not in marked:
+                    worklist.append(child.obj)
+        return marked
+
+    # 处理引用时让 obj 存活: 标记 obj 和它能到达的对象
+    @staticmethod
+    def mark_keep_alive(obj, marked):
+        GCHandler.mark_from([obj], marked)
+        return obj
+
+    # 字符串常量 (JString) 不在堆里，但是也会出现在引用 slot 和字段里
+    @staticmethod
+    def is_heap_ref(ref):
+        return ref.__class__ is runtime.jobject.JRef
+
+    # 对象字段或者引用数组 (包括多维数组) 里指向堆对象的 ref，引用对象的 referent 不算
+    @staticmethod
+    def child_refs(obj):
+        jref = runtime.jobject.JRef
+        if obj.type == runtime.jobject.JObject.TYPE_OBJ:
+            values = obj.data
+            if obj.jclass.reference_kind is not None:
+                values = list(values)
+                values[obj.jclass.field_index[ReferenceProcessor.REFERENT]] = None
+            return [value for value in values if value.__class__ is jref]
+        if obj.atype == runtime.jobject.JArray.T_REF:
+            return [value for value in obj.data if value.__class__ is jref]
+        return []
+
+    # gc root: 线程栈 (按 RefMap 只看引用 slot)，虚拟机代码临时持有的 ref (线程的 handles)，全局 handles
+    # 和等着调用 finalize 的对象，静态字段由 Heap.collect_static_field 单独收集
     @staticmethod
     def collect_root():
-        thread_pool = Thread.all_thread()
         gc_root = []
-        for thread in thread_pool:
-            frames = thread.all_frames()
-            for frame in frames:
-                items = frame.operand_stack.get_all_data()
-                for item in items:
-                    if isinstance(item.data, runtime.jobject.JRef):
-                        gc_root.append(item.data)
-                vars = frame.local_vars.get_items()
-                for var in vars:
-                    if isinstance(var.ref, runtime.jobject.JRef):
-                        gc_root.append(var.ref)
+        for thread in Thread.all_thread():
+            for frame in thread.all_frames():
+                GCHandler.collect_frame_root(frame, gc_root)
+            gc_root.extend(thread.handles)
+        gc_root.extend(GCHandler.global_handles.values())
+        gc_root.extend(ReferenceProcessor.roots())
         return gc_root
 
+    @staticmethod
+    def collect_frame_root(frame, gc_root):
+        method = frame.method
+        if method.code is None:
+            return
+        ref_map = RefMap.get(method)[frame.pc]
+        if ref_map is None:
+            error_handler.rise_runtime_error('no ref map at %s.%s @%d' % (method.jclass.name, method.name, frame.pc))
+        jref = runtime.jobject.JRef
+        operand_stack = frame.operand_stack
+        slots = operand_stack.slots
+        top = operand_stack.top_index
+        for index in ref_map.stack:
+            if index >= top:
+                break
+            ref = slots[index]
+            if ref.__class__ is jref:
+                gc_root.append(ref)
+        slots = frame.local_vars.slots
+        for index in ref_map.locals:
+            ref = slots[index]
+            if ref.__class__ is jref:
+                gc_root.append(ref)
 
+    # 虚拟机自己长期持有的 ref (比如以后的字符串常量池)，不在任何线程栈上
+    @staticmethod
+    def add_global_handle(ref):
+        GCHandler.global_handles[id(ref)] = ref
+
+    @staticmethod
+    def remove_global_handle(ref):
+        GCHandler.global_handles.pop(id(ref), None)
+
+
+# 分代 gc: 对象先分配在新生代，minor gc 只回收新生代，熬过 tenure_threshold 次 minor gc 的对象晋升到老年代
+# 老年代对象 (和静态字段) 指向新生代的引用由写屏障记到 remembered set 里，minor gc 把它们当作根，不扫描老年代
+# 不搬移对象，晋升只是改 gen 并且换到老年代的列表里
+class GenGCHandler(object):
+    YOUNG = 0
+    OLD = 1
+
+    remembered_objs = {}  # id: obj，可能引用了新生代对象的老年代对象
+    remembered_slots = {}  # id: Slot，可能引用了新生代对象的静态字段
+
+    @staticmethod
+    def write_barrier(holder, value):
+        if not GCHandler.is_heap_ref(value):
+            return
+        obj = holder.obj
+        if obj.gen == GenGCHandler.OLD and value.obj.gen == GenGCHandler.YOUNG:
+            GenGCHandler.remembered_objs[id(obj)] = obj
+
+    @staticmethod
+    def static_write_barrier(slot, value):
+        if not GCHandler.is_heap_ref(value):
+            return
+        if value.obj.gen == GenGCHandler.YOUNG:
+            GenGCHandler.remembered_slots[id(slot)] = slot
+
+    # 新生代就地压缩，返回晋升的对象，晋升的对象 gen 改成 OLD
+    @staticmethod
+    def minor_gc(young, tenure_threshold):
+        marked = GenGCHandler.mark_young()
+        ReferenceProcessor.process(lambda obj: obj if obj.gen != GenGCHandler.YOUNG or id(obj) in marked else None,
+                                   lambda obj: GenGCHandler.mark_young_keep_alive(obj, marked))
+        alive = 0
+        promoted = []
+        for obj in young:
+            if id(obj) not in marked:
+                continue
+            obj.age += 1
+            if obj.age >= tenure_threshold:
+                obj.gen = GenGCHandler.OLD
+                promoted.append(obj)
+            else:
+                young[alive] = obj
+                alive += 1
+        del young[alive:]
+        # 晋升的对象可能还引用着新生代对象
+        for obj in promoted:
+            GenGCHandler.remembered_objs[id(obj)] = obj
+        GCLog.add_promoted(len(promoted))
+        GenGCHandler.prune_remembered_set()
+        return promoted
+
+    # 只标记新生代对象，遇到老年代对象就停下，老年代到新生代的引用从 remembered set 里来
+    @staticmethod
+    def mark_young():
+        worklist = [ref.obj for ref in GCHandler.collect_root()]
+        for slot in GenGCHandler.remembered_slots.values():
+            if GCHandler.is_heap_ref(slot.ref):
+                worklist.append(slot.ref.obj)
+        for obj in GenGCHandler.remembered_objs.values():
+            worklist.extend(child.obj for child in GCHandler.child_refs(obj))
+        GCLog.add_roots(len(worklist))
+        return GenGCHandler.mark_young_from(worklist, set())
+
+    @staticmethod
+    def mark_young_from(worklist, marked):
+        young = GenGCHandler.YOUNG
+        while worklist:
+            obj = worklist.pop()
+            key = id(obj)
+            if key in marked or obj.gen != young:
+                continue
+            marked.add(key)
+            for child in GCHandler.child_refs(obj):
+                if id(child.obj) not in marked:
+                    worklist.append(child.obj)
+        return marked
+
+    @staticmethod
+    def mark_young_keep_alive(obj, marked):
+        GenGCHandler.mark_young_from([obj], marked)
+        return obj
+
+    @staticmethod
+    def major_gc(young, old, static_fields):
+        roots = GCHandler.collect_root()
+        roots.extend(static_fields)
+        GCLog.add_roots(len(roots))
+        objs = GenGCHandler.remembered_objs
+        if ParallelMarker.enabled(len(young) + len(old)):
+            index, bitmap = ParallelMarker.mark((young, old), roots)
+            ReferenceProcessor.process(lambda obj: obj if bitmap[index[id(obj)]] else None,
+                                       lambda obj: ParallelMarker.keep_alive(obj, index, bitmap))
+            for key in list(objs):
+                if not bitmap[index[key]]:
+                    del objs[key]
+            start = len(young)
+            GCHandler.sweep_bitmap(young, bitmap, 0)
+            GCHandler.sweep_bitmap(old, bitmap, start)
+        else:
+            marked = GCHandler.mark_alive(roots)
+            ReferenceProcessor.process_marked(marked, lambda obj: GCHandler.mark_keep_alive(obj, marked))
+            for key in list(objs):
+                if key not in marked:
+                    del objs[key]
+            GCHandler.sweep(young, marked)
+            GCHandler.sweep(old, marked)
+        GenGCHandler.prune_remembered_set()
+
+    # 去掉不再引用新生代对象的记录
+    @staticmethod
+    def prune_remembered_set():
+        young = GenGCHandler.YOUNG
+        objs = GenGCHandler.remembered_objs
+        for key in list(objs):
+            if not any(child.obj.gen == young for child in GCHandler.child_refs(objs[key])):
+                del objs[key]
+        slots = GenGCHandler.remembered_slots
+        for key in list(slots):
+            ref = slots[key].ref
+            if not GCHandler.is_heap_ref(ref) or ref.obj.gen != young:
+                del slots[key]
+
+
+# 并行标记: 对象很多时把对象图导出成 CSR 邻接数组 (对象下标 -> 子对象下标)，交给进程池或者 numpy 按层标记，
+# 返回按下标的标记位图给清除阶段。导出还是单线程的 python 循环，只有对象足够多、cpu 足够多时才划算
+# 目前只用在分代模式的 full gc (标记-清除)，串行模式是复制 gc，增量模式本来就是分步标记
+class ParallelMarker(object):
+    PROCESS = 'process'
+    NUMPY = 'numpy'  # 没有安装 numpy 时退回 PROCESS
+
+    mode = None  # None 表示不开启
+    workers = None  # 进程数，默认 cpu 个数
+    min_objects = 100000  # 对象少于这个数还是用串行标记
+
+    @staticmethod
+    def enabled(count):
+        return ParallelMarker.mode is not None and count >= ParallelMarker.min_objects
+
+    # heaps 里所有对象按顺序编号，返回 (id(obj) -> 下标, offsets, children, 根的下标)
+    @staticmethod
+    def export(heaps, roots):
+        index = {}
+        for heap in heaps:
+            for obj in heap:
+                index[id(obj)] = len(index)
+        offsets = array('q', [0])
+        children = array('q')
+        for heap in heaps:
+            for obj in heap:
+                children.extend(index[id(child.obj)] for child in GCHandler.child_refs(obj))
+                offsets.append(len(children))
+        return index, offsets, children, [index[id(ref.obj)] for ref in roots]
+
+    @staticmethod
+    def mark(heaps, roots):
+        index, offsets, children, root_index = ParallelMarker.export(heaps, roots)
+        if ParallelMarker.mode == ParallelMarker.NUMPY and parallel_mark.numpy is not None:
+            bitmap = parallel_mark.mark_numpy(offsets, children, root_index)
+        else:
+            bitmap = parallel_mark.mark_processes(offsets, children, root_index, ParallelMarker.workers)
+        return index, bitmap
+
+    # 处理引用时让 obj 存活: 在位图上串行标记 obj 能到达的对象
+    @staticmethod
+    def keep_alive(obj, index, bitmap):
+        worklist = [obj]
+        while worklist:
+            o = worklist.pop()
+            i = index[id(o)]
+            if bitmap[i]:
+                continue
+            bitmap[i] = 1
+            worklist.extend(child.obj for child in GCHandler.child_refs(o))
+        return obj
+
+
+# 增量 gc: 三色标记，不在 marked 里的是白色，在 marked 里并且还在 worklist 里等着扫描的是灰色，扫描过的是黑色
+# 标记分成很多小步在安全点穿插在解释器执行中，每步不超过 pause_budget 秒
+# 标记期间写屏障把新写入字段的白色对象染灰 (插入屏障)，新分配的对象直接染黑，保证黑色对象不会指向白色对象
+# 线程栈上没有屏障，所以 worklist 空了之后要重新扫描一遍根 (remark)，没有新的灰色对象才能清除
+class IncrementalGCHandler(object):
+    STEP_INTERVAL = 100  # 每隔多少次安全点做一步标记
+    CHECK_TIME_COUNT = 32  # 每扫描多少个对象看一次时间
+
+    pause_budget = 0.005
+    max_pause = 0.0
+    marking = False
+    marked = None
+    worklist = None
+    heap = None
+    collect_static_field = None
+    on_finish = None
+    countdown = 0
+
+    @staticmethod
+    def start(heap, collect_static_field, on_finish):
+        IncrementalGCHandler.heap = heap
+        IncrementalGCHandler.collect_static_field = collect_static_field
+        IncrementalGCHandler.on_finish = on_finish
+        IncrementalGCHandler.marked = set()
+        IncrementalGCHandler.worklist = []
+        IncrementalGCHandler.countdown = IncrementalGCHandler.STEP_INTERVAL
+        IncrementalGCHandler.marking = True
+        IncrementalGCHandler.shade_roots()
+        GC.barrier_handler = IncrementalGCHandler
+        GC.barrier_enabled = True
+        GC.update_safepoint_poll()
+
+    # 把根里的白色对象染灰，返回新染灰的个数
+    @staticmethod
+    def shade_roots():
+        roots = GCHandler.collect_root()
+        roots.extend(IncrementalGCHandler.collect_static_field())
+        GCLog.add_roots(len(roots))
+        marked = IncrementalGCHandler.marked
+        worklist = IncrementalGCHandler.worklist
+        count = 0
+        for ref in roots:
+            obj = ref.obj
+            if id(obj) not in marked:
+                marked.add(id(obj))
+                worklist.append(obj)
+                count += 1
+        return count
+
+    @staticmethod
+    def allocate_black(obj):
+        IncrementalGCHandler.marked.add(id(obj))
+
+    @staticmethod
+    def write_barrier(holder, value):
+        if GCHandler.is_heap_ref(value) and id(value.obj) not in IncrementalGCHandler.marked:
+            IncrementalGCHandler.marked.add(id(value.obj))
+            IncrementalGCHandler.worklist.append(value.obj)
+
+    @staticmethod
+    def static_write_barrier(slot, value):
+        IncrementalGCHandler.write_barrier(None, value)
+
+    @staticmethod
+    def poll():
+        IncrementalGCHandler.countdown -= 1
+        if IncrementalGCHandler.countdown <= 0:
+            IncrementalGCHandler.countdown = IncrementalGCHandler.STEP_INTERVAL
+            GC.incremental_step()
+
+    # 扫描灰色对象直到 worklist 空了或者用完时间，没用完时间返回 True
+    @staticmethod
+    def drain(deadline):
+        marked = IncrementalGCHandler.marked
+        worklist = IncrementalGCHandler.worklist
+        count = 0
+        while worklist:
+            obj = worklist.pop()
+            for child in GCHandler.child_refs(obj):
+                child = child.obj
+                if id(child) not in marked:
+                    marked.add(id(child))
+                    worklist.append(child)
+            count += 1
+            if deadline is not None and count % IncrementalGCHandler.CHECK_TIME_COUNT == 0 \
+                    and time.time() > deadline:
+                return not worklist
+        return True
+
+    @staticmethod
+    def step():
+        if not IncrementalGCHandler.marking:
+            return
+        start = time.time()
+        deadline = start + IncrementalGCHandler.pause_budget
+        finished = False
+        while IncrementalGCHandler.drain(deadline):
+            if IncrementalGCHandler.shade_roots() == 0:
+                finished = True
+                break
+        if finished:
+            IncrementalGCHandler.sweep()
+        IncrementalGCHandler.max_pause = max(IncrementalGCHandler.max_pause, time.time() - start)
+        if finished:
+            IncrementalGCHandler.on_finish()
+
+    # 不限时间做完标记和清除
+    @staticmethod
+    def finish():
+        IncrementalGCHandler.drain(None)
+        while IncrementalGCHandler.shade_roots() > 0:
+            IncrementalGCHandler.drain(None)
+        IncrementalGCHandler.sweep()
+
+    # 处理引用时让 obj 存活: 染灰之后把 worklist 扫描完
+    @staticmethod
+    def keep_alive(obj):
+        if id(obj) not in IncrementalGCHandler.marked:
+            IncrementalGCHandler.marked.add(id(obj))
+            IncrementalGCHandler.worklist.append(obj)
+        IncrementalGCHandler.drain(None)
+        return obj
+
+    @staticmethod
+    def sweep():
+        ReferenceProcessor.process_marked(IncrementalGCHandler.marked, IncrementalGCHandler.keep_alive)
+        GCHandler.sweep(IncrementalGCHandler.heap, IncrementalGCHandler.marked)
+        IncrementalGCHandler.marking = False
+        IncrementalGCHandler.marked = None
+        IncrementalGCHandler.worklist = None
+        GC.barrier_enabled = False
+        GC.update_safepoint_poll()
+        print_utils.print_jvm_status("!!!!!! incremental gc done !!!!!!")
+
+
+# 软 / 弱 / 虚引用和 finalize
+# java/lang/ref 下的引用对象的 referent 字段不是强引用，child_refs 跳过它，referent 只有从别的路径到达才会被标记
+# 引用对象和覆盖了 finalize 的对象创建时登记在这里，每次 gc 标记完之后 (清除之前) 按强度从强到弱处理:
+#   1. 软引用: 不要求全部清除并且最近 get 过的 (时间按空闲的堆大小换算)，referent 当作强引用标记上
+#   2. 软引用和弱引用: referent 没有被标记的清掉 referent，有 queue 的挂到 queue 上
+#   3. finalize: 没有被标记的对象复活 (连同它引用的对象)，交给 Finalizer 线程调用 finalize，每个对象只调用一次
+#   4. 虚引用和 cleaner: finalize 复活之后 referent 还是没有被标记的，清掉虚引用挂到 queue 上，cleaner 交给 Finalizer 线程
+# 不同的 gc 通过两个函数接入: alive(obj) 存活时返回对象现在的位置 (复制 gc 是 to-space 里的新对象)，否则返回 None;
+# keep_alive(obj) 标记 (或者复制) obj 和它能到达的对象，返回对象现在的位置
+class ReferenceProcessor(object):
+    SOFT = 1
+    WEAK = 2
+    PHANTOM = 3
+    KINDS = {'java/lang/ref/SoftReference': SOFT, 'java/lang/ref/WeakReference': WEAK,
+             'java/lang/ref/PhantomReference': PHANTOM}
+    REFERENT = 'referent'
+    # 软引用超过 (上次 gc 之后空闲的堆 KB 数 * MS_PER_KB) 毫秒没有 get 过就清掉，堆越空闲软引用活得越久
+    # 和 hotspot 的 SoftRefLRUPolicyMSPerMB 一样，只是这里的堆小，按 KB 算
+    MS_PER_KB = 1000
+
+    # 登记的是对象唯一的 JRef，gc 搬移对象之后更新 ref.obj，挂到 queue 上或者交给 finalize 的还是同一个 ref，
+    # java 代码里 == 比较的结果不变
+    references = []  # 登记的引用对象，referent 清掉之后就不用再处理
+    finalizable = []  # 还没有调用过 finalize 的对象
+    cleaners = []  # [referent, action]，referent 不可达之后在 Finalizer 线程调用 action()
+    clear_soft = False  # 堆满了最后一次 gc 时为 True，不管最近是否用过，清掉所有 referent 不可达的软引用
+    free_bytes = 0  # 上一次 gc 之后空闲的堆大小，Heap 设置
+    soft_class = None  # java/lang/ref/SoftReference，每次 gc 之后更新它的静态字段 clock
+    enqueued = 0  # 挂到 queue 上的引用总数，ReferenceQueue.remove 等它变化
+
+    # Finalizer 线程的任务: (ref, finalize 方法) 或者 (None, cleaner 的 action)
+    # 队列里和正在调用 finalize 的 ref 都是 gc root
+    pending = deque()
+    running = []
+    cond = threading.Condition()
+    finalizer_thread = None
+
+    # 链接类的时候确定引用类型和 finalize 方法，空的 finalize (只有 return) 不用调用
+    @staticmethod
+    def link_class(jclass):
+        kind = ReferenceProcessor.KINDS.get(jclass.name)
+        if kind is None and jclass.super_class is not None:
+            kind = jclass.super_class.reference_kind
+        jclass.reference_kind = kind
+        if jclass.name == 'java/lang/ref/SoftReference':
+            ReferenceProcessor.soft_class = jclass
+        index = jclass.vtable_map.get(('finalize', '()V'))
+        if index is not None:
+            method = jclass.vtable[index]
+            if method.jclass.name != 'java/lang/Object' and method.code is not None and len(method.code) > 1:
+                jclass.finalizer = method
+
+    # 新创建的对象
+    @staticmethod
+    def register(ref):
+        jclass = ref.obj.jclass
+        if jclass.reference_kind is not None:
+            ReferenceProcessor.references.append(ref)
+        if jclass.finalizer is not None:
+            ReferenceProcessor.finalizable.append(ref)
+
+    # 虚拟机代码用的 cleaner: ref 指向的对象不可达之后，在 Finalizer 线程调用 action()
+    @staticmethod
+    def add_cleaner(ref, action):
+        ReferenceProcessor.cleaners.append([ref.obj, action])
+
+    # 标记-清除的 gc 不搬移对象，marked 是存活对象的 id
+    @staticmethod
+    def process_marked(marked, keep_alive):
+        ReferenceProcessor.process(lambda obj: obj if id(obj) in marked else None, keep_alive)
+
+    @staticmethod
+    def process(alive, keep_alive):
+        if ReferenceProcessor.references:
+            if not ReferenceProcessor.clear_soft:
+                ReferenceProcessor.keep_soft(alive, keep_alive)
+            ReferenceProcessor.clear((ReferenceProcessor.SOFT, ReferenceProcessor.WEAK), alive)
+        if ReferenceProcessor.finalizable:
+            ReferenceProcessor.finalize(alive, keep_alive)
+        if ReferenceProcessor.references:
+            ReferenceProcessor.clear((ReferenceProcessor.SOFT, ReferenceProcessor.WEAK, ReferenceProcessor.PHANTOM),
+                                     alive)
+        if ReferenceProcessor.cleaners:
+            ReferenceProcessor.clean(alive)
+        soft_class = ReferenceProcessor.soft_class
+        if soft_class is not None:
+            soft_class.static_fields['clock'].num = ReferenceProcessor.clock()
+
+    # 虚拟机启动以来的毫秒数
+    @staticmethod
+    def clock():
+        return int((time.time() - GCLog.start_time) * 1000)
+
+    # 最近用过的软引用的 referent 当作强引用，标记上的对象里可能又有软引用，直到没有新的为止
+    @staticmethod
+    def keep_soft(alive, keep_alive):
+        soft_class = ReferenceProcessor.soft_class
+        if soft_class is None:
+            return
+        clock = soft_class.static_fields['clock'].num
+        max_interval = ReferenceProcessor.free_bytes // 1024 * ReferenceProcessor.MS_PER_KB
+        soft = ReferenceProcessor.SOFT
+        is_heap_ref = GCHandler.is_heap_ref
+        changed = True
+        while changed:
+            changed = False
+            for ref in ReferenceProcessor.references:
+                if ref.obj.jclass.reference_kind != soft:
+                    continue
+                obj = alive(ref.obj)
+                if obj is None:
+                    continue
+                referent = obj.get_field(ReferenceProcessor.REFERENT)
+                if not is_heap_ref(referent) or alive(referent.obj) is not None:
+                    continue
+                if clock - obj.get_field('timestamp') > max_interval:
+                    continue
+                keep_alive(referent.obj)
+                changed = True
+
+    # 清掉 kinds 类型里 referent 不可达的引用，更新还活着的 referent 的位置
+    # 死掉的引用对象和 referent 已经是 null 的不再登记
+    @staticmethod
+    def clear(kinds, alive):
+        references = []
+        is_heap_ref = GCHandler.is_heap_ref
+        for ref in ReferenceProcessor.references:
+            obj = alive(ref.obj)
+            if obj is None:
+                continue
+            ref.obj = obj
+            referent = obj.get_field(ReferenceProcessor.REFERENT)
+            if not is_heap_ref(referent):
+                continue
+            target = alive(referent.obj)
+            if target is not None:
+                referent.obj = target
+                references.append(ref)
+            elif obj.jclass.reference_kind in kinds:
+                obj.put_field(ReferenceProcessor.REFERENT, None)
+                ReferenceProcessor.enqueue(ref)
+            else:
+                references.append(ref)
+        ReferenceProcessor.references = references
+
+    # 挂到 ReferenceQueue 的 head 上，java 代码用 poll / remove 取走，remove 里等着的线程在 gc 结束时醒来
+    @staticmethod
+    def enqueue(ref):
+        obj = ref.obj
+        queue = obj.get_field('queue')
+        if not GCHandler.is_heap_ref(queue):
+            return
+        head = queue.obj.get_field('head')
+        obj.put_field('next', head)
+        queue.obj.put_field('head', ref)
+        ReferenceProcessor.enqueued += 1
+        if GC.barrier_enabled:
+            GC.write_barrier(ref, head)
+            GC.write_barrier(queue, ref)
+
+    @staticmethod
+    def finalize(alive, keep_alive):
+        finalizable = []
+        dead = []
+        for ref in ReferenceProcessor.finalizable:
+            obj = alive(ref.obj)
+            if obj is None:
+                dead.append(ref)
+            else:
+                ref.obj = obj
+                finalizable.append(ref)
+        ReferenceProcessor.finalizable = finalizable
+        for ref in dead:
+            ref.obj = keep_alive(ref.obj)
+            ReferenceProcessor.schedule(ref, ref.obj.jclass.finalizer)
+
+    @staticmethod
+    def clean(alive):
+        cleaners = []
+        for cleaner in ReferenceProcessor.cleaners:
+            obj = alive(cleaner[0])
+            if obj is None:
+                ReferenceProcessor.schedule(None, cleaner[1])
+            else:
+                cleaner[0] = obj
+                cleaners.append(cleaner)
+        ReferenceProcessor.cleaners = cleaners
+
+    # 交给 Finalizer 线程，第一次用到时才启动线程
+    @staticmethod
+    def schedule(ref, target):
+        with ReferenceProcessor.cond:
+            ReferenceProcessor.pending.append((ref, target))
+            ReferenceProcessor.cond.notify()
+        if ReferenceProcessor.finalizer_thread is None:
+            from jthread.jthread import FinalizerThread
+            ReferenceProcessor.finalizer_thread = FinalizerThread()
+            ReferenceProcessor.finalizer_thread.start()
+
+    # Finalizer 线程取下一个任务，没有就等着
+    @staticmethod
+    def take():
+        with ReferenceProcessor.cond:
+            while not ReferenceProcessor.pending:
+                ReferenceProcessor.cond.wait()
+            ref, target = ReferenceProcessor.pending.popleft()
+            if ref is not None:
+                ReferenceProcessor.running.append(ref)
+            return ref, target
+
+    @staticmethod
+    def done(ref):
+        if ref is None:
+            return
+        with ReferenceProcessor.cond:
+            ReferenceProcessor.running.remove(ref)
+
+    @staticmethod
+    def roots():
+        with ReferenceProcessor.cond:
+            refs = [ref for ref, _ in ReferenceProcessor.pending if ref is not None]
+            refs.extend(ReferenceProcessor.running)
+        return refs
@@ -0,0 +1,202 @@
+# coding=utf-8
+
+from array import array
+import atexit
+import ctypes
+import multiprocessing
+import random
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 在 CSR 邻接数组上做标记: 对象 i 的子对象下标是 children[offsets[i]:offsets[i + 1]]
+# 返回按对象下标的标记位图 (非 0 为存活)，和 gc 里的对象无关，可以单独拿来测速
+
+MIN_CHUNK = 1024  # frontier 太小时不值得分给子进程
+
+# 进程池和它共享的数组: 第一次用到时创建，之后每次标记复用，只有对象图放不下时才按两倍扩大并重建进程池
+# 子进程用 forkserver 启动，不是在 gc 停顿里从多线程的虚拟机进程 fork 出来
+_pool = None
+_pool_workers = 0
+_shared = None  # (offsets, children, marked)，RawArray
+_object_capacity = 0
+_edge_capacity = 0
+
+# 当前进程里共享数组的视图，子进程在 _init_worker 里设置
+_offsets = None
+_children = None
+_marked = None
+
+
+def mark_serial(offsets, children, roots):
+    marked = bytearray(len(offsets) - 1)
+    stack = []
+    for root in roots:
+        if not marked[root]:
+            marked[root] = 1
+            stack.append(root)
+    while stack:
+        i = stack.pop()
+        for child in children[offsets[i]:offsets[i + 1]]:
+            if not marked[child]:
+                marked[child] = 1
+                stack.append(child)
+    return marked
+
+
+def _view(shared, typecode):
+    return memoryview(shared).cast('B').cast(typecode)
+
+
+def _init_worker(offsets, children, marked):
+    global _offsets, _children, _marked
+    _offsets = _view(offsets, 'q')
+    _children = _view(children, 'q')
+    _marked = _view(marked, 'b')
+
+
+def _context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context()
+
+
+def _get_pool(workers, objects, edges):
+    global _pool, _pool_workers, _shared, _object_capacity, _edge_capacity
+    if _pool is not None and _pool_workers == workers and objects <= _object_capacity and edges <= _edge_capacity:
+        return _pool
+    object_capacity = max(objects, _object_capacity * 2, MIN_CHUNK)
+    edge_capacity = max(edges, _edge_capacity * 2, MIN_CHUNK)
+    close_pool()
+    context = _context()
+    _shared = (context.RawArray('q', object_capacity + 1), context.RawArray('q', edge_capacity),
+               context.RawArray('b', object_capacity))
+    _init_worker(*_shared)
+    _pool = context.Pool(workers, _init_worker, _shared)
+    _pool_workers = workers
+    _object_capacity = object_capacity
+    _edge_capacity = edge_capacity
+    return _pool
+
+
+def close_pool():
+    global _pool, _shared, _offsets, _children, _marked
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+    _pool = None
+    _shared = None
+    _offsets = _children = _marked = None
+
+
+atexit.register(close_pool)
+
+
+# 展开一段 frontier，位图在进程间共享，两个进程同时看到同一个没标记的子对象时会重复展开一次，结果不受影响
+def _expand(frontier):
+    offsets = _offsets
+    children = _children
+    marked = _marked
+    out = []
+    for i in frontier:
+        for child in children[offsets[i]:offsets[i + 1]]:
+            if not marked[child]:
+                marked[child] = 1
+                out.append(child)
+    return out
+
+
+# 按层展开: 每一层的 frontier 切成 workers 份交给进程池
+# 对象图先拷贝到共享数组里，返回的位图是共享数组的视图，下一次标记之前有效
+def mark_processes(offsets, children, roots, workers=None):
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    count = len(offsets) - 1
+    pool = _get_pool(workers, count, len(children))
+    _offsets[:len(offsets)] = offsets
+    _children[:len(children)] = children
+    ctypes.memset(_shared[2], 0, count)
+    marked = _marked[:count]
+    frontier = _expand_roots(roots, marked)
+    while frontier:
+        if len(frontier) < MIN_CHUNK * 2:
+            frontier = _expand(frontier)
+            continue
+        size = max(MIN_CHUNK, (len(frontier) + workers - 1) // workers)
+        chunks = [frontier[i:i + size] for i in range(0, len(frontier), size)]
+        frontier = []
+        for part in pool.map(_expand, chunks):
+            frontier.extend(part)
+    return marked
+
+
+def _expand_roots(roots, marked):
+    frontier = []
+    for root in roots:
+        if not marked[root]:
+            marked[root] = 1
+            frontier.append(root)
+    return frontier
+
+
+# 向量化的按层展开: 一次取出整层 frontier 的所有子对象，去掉已经标记的作为下一层
+def mark_numpy(offsets, children, roots):
+    offsets = numpy.frombuffer(offsets, dtype=numpy.int64)
+    children = numpy.frombuffer(children, dtype=numpy.int64)
+    marked = numpy.zeros(len(offsets) - 1, dtype=numpy.bool_)
+    frontier = numpy.unique(numpy.asarray(roots, dtype=numpy.int64))
+    marked[frontier] = True
+    while frontier.size:
+        starts = offsets[frontier]
+        counts = offsets[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            break
+        # 第 k 个子对象在 children 里的下标 = 所在对象的 start + 组内序号
+        index = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(total)
+        found = children[index]
+        found = numpy.unique(found[~marked[found]])
+        marked[found] = True
+        frontier = found
+    return marked
+
+
+# 随机对象图: 每个对象 degree 个子对象，roots 个根
+def random_graph(count, degree=2, roots=16, seed=1):
+    rand = random.Random(seed)
+    offsets = array('q', range(0, count * degree + 1, degree))
+    children = array('q', (rand.randrange(count) for _ in range(count * degree)))
+    return offsets, children, [rand.randrange(count) for _ in range(roots)]
+
+
+def benchmark(count, workers=None):
+    offsets, children, roots = random_graph(count)
+    # 进程池在第一次标记时创建，之后复用，计时之前先建好
+    mark_processes(offsets, children, roots, workers)
+    markers = [('serial', lambda: mark_serial(offsets, children, roots)),
+               ('process', lambda: mark_processes(offsets, children, roots, workers))]
+    if numpy is not None:
+        markers.append(('numpy', lambda: mark_numpy(offsets, children, roots)))
+    expected = None
+    for name, marker in markers:
+        start = time.time()
+        marked = marker()
+        cost = time.time() - start
+        alive = sum(1 for bit in marked if bit)
+        if expected is None:
+            expected = alive
+        print('%10d objects  %-8s %8.3fs  alive %d%s' % (count, name, cost, alive,
+                                                          '' if alive == expected else '  MISMATCH'))
+    if numpy is None:
+        print('%10d objects  numpy    not installed' % count)
+
+
+# python jgc/parallel_mark.py [对象个数 ...]，默认 10^5 和 10^6
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [10 ** 5, 10 ** 6]
+    for n in counts:
+        benchmark(n)
@@ -0,0 +1,281 @@
+# coding=utf-8
+
+import runtime
+from base.utils import error_handler
+
+# 每个方法按 pc 记录哪些操作数栈 slot 和局部变量是引用，gc 扫描线程栈时只看这些 slot，不用逐个判断类型
+# 操作数栈的类型从方法入口开始按字节码正向推导，局部变量只记录之后还会被 aload 读到的 (活跃的)，
+# 死掉的局部变量即使还留着引用也不会被当作根
+# class 文件里的 StackMapTable 只在分支目标处有类型信息，而且 parser 没有解析，这里直接从字节码算
+
+R = (True,)  # 引用
+V = (False,)  # int / float
+W = (False, False)  # long / double
+
+RETURN_CODES = (0xac, 0xad, 0xae, 0xaf, 0xb0, 0xb1)
+GOTO_CODES = (0xa7, 0xc8)
+SWITCH_CODES = (0xaa, 0xab)
+ATHROW_CODE = 0xbf
+INVOKESTATIC_CODE = 0xb8
+WIDE_CODE = 0xc4
+IINC_CODE = 0x84
+
+# 普通指令对操作数栈的影响: opcode -> (出栈 slot 数, 入栈的 slot 类型)
+EFFECTS = {}
+
+
+def _effect(codes, pop, push):
+    for code in codes:
+        EFFECTS[code] = (pop, push)
+
+
+_effect([0x00, 0x84, 0xa7, 0xc8, 0xfe, 0xff], 0, ())  # nop iinc goto goto_w impdep
+_effect([0x01], 0, R)  # aconst_null
+_effect(range(0x02, 0x09), 0, V)  # iconst
+_effect([0x09, 0x0a, 0x0e, 0x0f, 0x14], 0, W)  # lconst dconst ldc2_w
+_effect([0x0b, 0x0c, 0x0d, 0x10, 0x11], 0, V)  # fconst bipush sipush
+# xload, xload_<n>, xaload, xstore, xstore_<n>, xastore 都按 i l f d a 的顺序排列
+for _i, _push in enumerate((V, W, V, W, R)):
+    _effect([0x15 + _i], 0, _push)
+    _effect(range(0x1a + _i * 4, 0x1e + _i * 4), 0, _push)
+    _effect([0x2e + _i], 2, _push)
+    _effect([0x36 + _i], len(_push), ())
+    _effect(range(0x3b + _i * 4, 0x3f + _i * 4), len(_push), ())
+    _effect([0x4f + _i], 2 + len(_push), ())
+_effect([0x33, 0x34, 0x35], 2, V)  # baload caload saload
+_effect([0x54, 0x55, 0x56], 3, ())  # bastore castore sastore
+_effect([0x57], 1, ())  # pop
+_effect([0x58], 2, ())  # pop2
+# add sub mul div rem and or xor 按 i l f d (位运算只有 i l) 排列
+for _code in range(0x60, 0x74):
+    _effect([_code], 4 if _code % 2 else 2, W if _code % 2 else V)
+_effect([0x74, 0x76], 1, V)  # ineg fneg
+_effect([0x75, 0x77], 2, W)  # lneg dneg
+_effect([0x78, 0x7a, 0x7c], 2, V)  # ishl ishr iushr
+_effect([0x79, 0x7b, 0x7d], 3, W)  # lshl lshr lushr
+_effect([0x7e, 0x80, 0x82], 2, V)  # iand ior ixor
+_effect([0x7f, 0x81, 0x83], 4, W)  # land lor lxor
+_effect([0x85, 0x87, 0x8c, 0x8d], 1, W)  # i2l i2d f2l f2d
+_effect([0x86, 0x8b, 0x91, 0x92, 0x93], 1, V)  # i2f f2i i2b i2c i2s
+_effect([0x88, 0x89, 0x8e, 0x90], 2, V)  # l2i l2f d2i d2f
+_effect([0x8a, 0x8f], 2, W)  # l2d d2l
+_effect([0x94, 0x97, 0x98], 4, V)  # lcmp dcmpl dcmpg
+_effect([0x95, 0x96], 2, V)  # fcmpl fcmpg
+_effect(range(0x99, 0x9f), 1, ())  # if<cond>
+_effect(range(0x9f, 0xa7), 2, ())  # if_icmp<cond> if_acmp<cond>
+_effect([0xaa, 0xab, 0xac, 0xae, 0xb0], 1, ())  # tableswitch lookupswitch ireturn freturn areturn
+_effect([0xad, 0xaf], 2, ())  # lreturn dreturn
+_effect([0xb1], 0, ())  # return
+_effect([0xbb], 0, R)  # new
+_effect([0xbc, 0xbd, 0xc0], 1, R)  # newarray anewarray checkcast
+_effect([0xbe, 0xc1], 1, V)  # arraylength instanceof
+_effect([0xbf, 0xc2, 0xc3, 0xc6, 0xc7], 1, ())  # athrow monitorenter monitorexit ifnull ifnonnull
+
+# dup 系列: opcode -> (复制栈顶的 slot 数, 插到下面第几个 slot 的位置)
+DUPS = {0x59: (1, 0), 0x5a: (1, 1), 0x5b: (1, 2), 0x5c: (2, 0), 0x5d: (2, 1), 0x5e: (2, 2)}
+
+
+class RefMap(object):
+    __slots__ = ('stack', 'locals')
+
+    def __init__(self, stack, local_vars):
+        self.stack = stack  # 是引用的操作数栈 slot 下标
+        self.locals = local_vars  # 是引用并且之后还会用到的局部变量下标
+
+    # 按 pc 索引的 RefMap，第一次 gc 扫描到这个方法时计算
+    # frame.pc 是正在执行的指令的下一条 (或者跳转的目标)，这个位置的 RefMap 描述的是下一条指令执行前的状态，
+    # 对调用者来说栈顶还要加上返回值，所以扫描时只看 top_index 以下的 slot
+    @staticmethod
+    def get(method):
+        ref_maps = method.ref_maps
+        if ref_maps is None:
+            if method.instructions is None:
+                # 方法刚进入还没开始执行
+                from instruction.instruction import decode_method
+                method.instructions = decode_method(method)
+            ref_maps = RefMap.compute(method)
+            method.ref_maps = ref_maps
+        return ref_maps
+
+    @staticmethod
+    def compute(method):
+        instructions = method.instructions
+        stacks, successors = RefMap.__infer_stacks(method, instructions)
+        live = RefMap.__live_locals(instructions, successors)
+        handler_live = RefMap.__handler_live_locals(method, instructions, live)
+        ref_maps = [None] * len(instructions)
+        for pc, stack in enumerate(stacks):
+            if stack is None:
+                continue
+            local_vars = live[pc] | handler_live[pc]
+            ref_maps[pc] = RefMap(tuple(i for i, is_ref in enumerate(stack) if is_ref), tuple(sorted(local_vars)))
+        return ref_maps
+
+    # 从方法入口开始推导每条指令执行前操作数栈每个 slot 是不是引用，顺便记下控制流的后继
+    @staticmethod
+    def __infer_stacks(method, instructions):
+        constants = method.jclass.constant_pool.constants
+        stacks = [None] * len(instructions)
+        successors = [()] * len(instructions)
+        handlers = []
+        for ex in method.exceptions:
+            handlers.append((ex.start_pc, ex.end_pc, ex.handler_pc))
+        stacks[0] = ()
+        worklist = [0]
+        while worklist:
+            pc = worklist.pop()
+            ins = instructions[pc]
+            stack = RefMap.__execute(ins, stacks[pc], constants)
+            targets = [(target, stack) for target in RefMap.__branch_targets(pc, ins)]
+            for start_pc, end_pc, handler_pc in handlers:
+                if start_pc <= pc < end_pc:
+                    targets.append((handler_pc, R))  # 进入异常处理时栈上只有异常对象
+            successors[pc] = [target for target, _ in targets]
+            for target, in_stack in targets:
+                if stacks[target] is None:
+                    stacks[target] = in_stack
+                    worklist.append(target)
+                elif stacks[target] != in_stack:
+                    # 合法的字节码在汇合处类型一致，只有 null 和引用这种差别，统一当作引用
+                    merged = tuple(a or b for a, b in zip(stacks[target], in_stack))
+                    if merged != stacks[target]:
+                        stacks[target] = merged
+                        worklist.append(target)
+        return stacks, successors
+
+    @staticmethod
+    def __jump_targets(pc, ins):
+        code = type(ins).code
+        if code == 0xaa:
+            return [pc + ins.default] + [pc + offset for offset in ins.offsets]
+        if code == 0xab:
+            return [pc + ins.default] + [pc + offset for offset in ins.pairs.values()]
+        if hasattr(ins, 'branch'):
+            return [pc + ins.branch]
+        return []
+
+    @staticmethod
+    def __branch_targets(pc, ins):
+        code = type(ins).code
+        targets = RefMap.__jump_targets(pc, ins)
+        if code not in GOTO_CODES and code not in SWITCH_CODES and code not in RETURN_CODES and code != ATHROW_CODE:
+            targets.append(ins.next_pc)
+        return targets
+
+    # 一条指令执行之后的操作数栈
+    @staticmethod
+    def __execute(ins, stack, constants):
+        code = type(ins).code
+        effect = EFFECTS.get(code)
+        if effect is not None:
+            pop, push = effect
+            return stack[:len(stack) - pop] + push
+        if code in DUPS:
+            count, depth = DUPS[code]
+            top = stack[len(stack) - count:]
+            split = len(stack) - count - depth
+            return stack[:split] + top + stack[split:]
+        if code == 0x5f:  # swap
+            return stack[:-2] + (stack[-1], stack[-2])
+        if code == 0x12 or code == 0x13:  # ldc ldc_w
+            const = constants[ins.index]
+            if isinstance(const, (runtime.jclass.JInteger, runtime.jclass.JFloat)):
+                return stack + V
+            return stack + R
+        if code == WIDE_CODE:
+            return RefMap.__execute(ins.ins, stack, constants)
+        if 0xb2 <= code <= 0xb5:  # getstatic putstatic getfield putfield
+            slots = RefMap.__desc_slots(constants[ins.index].descriptor)
+            if code == 0xb2:
+                return stack + slots
+            if code == 0xb3:
+                return stack[:len(stack) - len(slots)]
+            if code == 0xb4:
+                return stack[:-1] + slots
+            return stack[:len(stack) - len(slots) - 1]
+        if 0xb6 <= code <= 0xb9:  # invokevirtual invokespecial invokestatic invokeinterface
+            method_ref = constants[ins.index]
+            pop = method_ref.arg_slot_count
+            if code != INVOKESTATIC_CODE:
+                pop += 1
+            descriptor = method_ref.descriptor
+            return stack[:len(stack) - pop] + RefMap.__desc_slots(descriptor[descriptor.find(')') + 1:])
+        if code == 0xc5:  # multianewarray
+            return stack[:len(stack) - ins.dimensions] + R
+        error_handler.rise_runtime_error('no ref map for code %x' % code)
+
+    @staticmethod
+    def __desc_slots(desc):
+        if desc == 'V':
+            return ()
+        if desc == 'J' or desc == 'D':
+            return W
+        if desc[0] == 'L' or desc[0] == '[':
+            return R
+        return V
+
+    # 返回 (读成引用的局部变量, 这条指令之后不再是引用的局部变量)
+    @staticmethod
+    def __local_use(ins):
+        code = type(ins).code
+        if code == WIDE_CODE:
+            ins = ins.ins
+            code = type(ins).code
+        if code == IINC_CODE:
+            return None, (ins.index,)
+        if 0x15 <= code <= 0x19 or 0x36 <= code <= 0x3a:
+            kind = (code - 0x15) % 0x21
+            index = ins.index
+        elif 0x1a <= code <= 0x2d:
+            kind, index = divmod(code - 0x1a, 4)
+        elif 0x3b <= code <= 0x4e:
+            kind, index = divmod(code - 0x3b, 4)
+        else:
+            return None, ()
+        if kind == 4 and code <= 0x2d:  # aload
+            return index, ()
+        if kind == 1 or kind == 3:  # long / double 占两个 slot
+            return None, (index, index + 1)
+        return None, (index,)
+
+    # 反向数据流求每条指令执行前活跃的引用局部变量
+    @staticmethod
+    def __live_locals(instructions, successors):
+        uses = [None] * len(instructions)
+        for pc, ins in enumerate(instructions):
+            if ins is not None:
+                uses[pc] = RefMap.__local_use(ins)
+        live = [frozenset()] * len(instructions)
+        changed = True
+        while changed:
+            changed = False
+            for pc in range(len(instructions) - 1, -1, -1):
+                if uses[pc] is None:
+                    continue
+                out = set()
+                for target in successors[pc]:
+                    out |= live[target]
+                use, kill = uses[pc]
+                out.difference_update(kill)
+                if use is not None:
+                    out.add(use)
+                if out != live[pc]:
+                    live[pc] = frozenset(out)
+                    changed = True
+        return live
+
+    # 被调用的方法抛出异常时从调用者的 frame.pc (调用指令的下一条) 跳到异常处理，
+    # 所以下一条指令的 RefMap 还要带上调用指令所在 try 块的异常处理会用到的局部变量
+    @staticmethod
+    def __handler_live_locals(method, instructions, live):
+        handler_live = [frozenset()] * len(instructions)
+        for pc, ins in enumerate(instructions):
+            if ins is None or ins.next_pc >= len(instructions):
+                continue
+            extra = set()
+            for ex in method.exceptions:
+                if ex.start_pc <= pc < ex.end_pc:
+                    extra |= live[ex.handler_pc]
+            if extra:
+                handler_live[ins.next_pc] = handler_live[ins.next_pc] | extra
+        return handler_live
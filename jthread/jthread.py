@@ -2,25 +2,64 @@
 
 
 from runtime.jclass import Method
+from jgc.gc import ReferenceProcessor, GCHandler
 import threading
 
 
 class JThread(object):
+    threads = []  # 启动过还没有 join 的 java 线程，虚拟机退出之前要等它们结束
+    lock = threading.Lock()
+
+    # 在新线程里执行 method，this 是 java.lang.Thread 对象
     @staticmethod
-    def start_new_thread(method):
-        t = NativeThread(method)
+    def start_new_thread(method, this):
+        t = NativeThread(method, this)
+        with JThread.lock:
+            JThread.threads.append(t)
         t.start()
 
+    # 等所有 java 线程结束，线程里又启动的线程也要等
+    @staticmethod
+    def join_all():
+        while True:
+            with JThread.lock:
+                if not JThread.threads:
+                    return
+                t = JThread.threads.pop(0)
+            t.join()
+
 
+# 线程结束之前 this 作为全局 handle 一直是 gc root，新线程建好 frame 之前 gc 也不会回收或者漏掉它
 class NativeThread(threading.Thread):
-    def __init__(self, method):
+    def __init__(self, method, this):
         super(NativeThread, self).__init__()
         self.method = method
+        self.this = this
+        GCHandler.add_global_handle(this)
 
     def run(self):
         from interpreter.interpreter import Interpreter
-        Interpreter.exec_method(self.method)
+        try:
+            Interpreter.exec_method(self.method, (self.this,))
+        finally:
+            GCHandler.remove_global_handle(self.this)
 
 
-class GCThread(object):
-    pass
+# 在单独的线程里调用不可达对象的 finalize 和 cleaner，任务由 gc 通过 ReferenceProcessor.schedule 交过来
+# 每个 finalize 在一个新的解释器里执行，this 是复活的对象; 守护线程，虚拟机退出时还没处理的任务直接丢掉
+class FinalizerThread(threading.Thread):
+    def __init__(self):
+        super(FinalizerThread, self).__init__(name='Finalizer')
+        self.daemon = True
+
+    def run(self):
+        from interpreter.interpreter import Interpreter
+        while True:
+            ref, target = ReferenceProcessor.take()
+            try:
+                if ref is None:
+                    target()
+                else:
+                    Interpreter.exec_method(target, (ref,))
+            finally:
+                ReferenceProcessor.done(ref)
@@ -1,38 +1,141 @@
 # coding=utf-8
 
 
-from base.utils import error_handler
-from jgc.gc import GC
-from base.jvm_config import heap_size
+from base.utils import error_handler, print_utils
+from jgc.gc import GC, GCHandler, GCLog, GenGCHandler, IncrementalGCHandler, ParallelMarker, ReferenceProcessor
+from base import jvm_config
 
-DEF_LENGTH = heap_size
+# 上一次 gc 之后存活的比例超过这个值，说明堆太小，堆满时先扩容而不是马上 gc
+SURVIVAL_GROW_RATIO = 0.5
+# 增量模式下已用空间超过容量的这个比例就开始增量标记，尽量在堆满之前标记完
+INCREMENTAL_START_RATIO = 0.7
 
 
+# 按对象的估算大小 (JObject.size，字节) 记账
+# 已用空间超过当前容量时扩容或者 gc，容量最大到 max_size
+# 串行模式是半区复制: _java_heap 是当前分配用的半区，_used 是分配指针，_capacity 是一个半区的大小，
+# 另一半留给 gc 时的 to-space，所以每个半区是 -Xms / -Xmx 的一半
+# 分代模式下 _java_heap / _used / _capacity 是老年代，新生代大小固定，满了做 minor gc
+# 增量模式下已用空间超过 INCREMENTAL_START_RATIO 开始增量标记，标记期间新分配的对象直接染黑
 class Heap(object):
-    _java_heap = [None for i in range(DEF_LENGTH)]
-    _index = 0  # 指向当前可用的位置
-    _length = DEF_LENGTH
+    _java_heap = []  # 堆里的对象 (JObject)
+    _used = 0  # 已经分配的字节数
+    _allocated = 0  # 启动以来累计分配的字节数，用来算分配速率
+    _capacity = jvm_config.heap_init_size
+    _max_size = jvm_config.heap_max_size
+    _survival_rate = 0.0  # 上一次 gc 之后存活的字节数 / 容量
     _jclass_heap = []
 
+    _copying = True
+    _generational = False
+    _incremental = False
+    _young = []
+    _young_used = 0
+    _young_capacity = 0
+
+    # 启动时按命令行参数设置堆大小，分代模式下新生代从总大小里划出来
+    @staticmethod
+    def init_heap(init_size, max_size, gc_mode=jvm_config.GC_SERIAL, young_size=None,
+                  pause_budget_ms=jvm_config.gc_pause_budget_ms, mark_mode=jvm_config.GC_MARK_SERIAL,
+                  mark_min_objects=jvm_config.gc_mark_min_objects):
+        Heap._generational = gc_mode == jvm_config.GC_GENERATIONAL
+        Heap._incremental = gc_mode == jvm_config.GC_INCREMENTAL
+        Heap._copying = gc_mode == jvm_config.GC_SERIAL
+        if Heap._copying:
+            init_size //= 2
+            max_size //= 2
+        IncrementalGCHandler.pause_budget = pause_budget_ms / 1000.0
+        ParallelMarker.mode = None if mark_mode == jvm_config.GC_MARK_SERIAL else mark_mode
+        ParallelMarker.min_objects = mark_min_objects
+        if Heap._generational:
+            if young_size is None:
+                young_size = init_size // 4
+            Heap._young_capacity = young_size
+            init_size -= young_size
+            max_size -= young_size
+            GC.barrier_handler = GenGCHandler
+            GC.barrier_enabled = True
+        Heap._capacity = init_size
+        Heap._max_size = max_size
+        GCLog.heap_usage = Heap.usage
+        ReferenceProcessor.free_bytes = max_size
+
     @staticmethod
     def new_jclass(jclass):
         Heap._jclass_heap.append(jclass)
 
+    # 分配: 移动分配指针，放不下时先 gc 或者扩容
     @staticmethod
-    def new_ref(ref):
-        Heap.__new_ref(ref, True)
+    def new_object(obj):
+        size = obj.size
+        Heap._allocated += size
+        if Heap._generational:
+            if size <= Heap._young_capacity:
+                if Heap._young_used + size > Heap._young_capacity:
+                    Heap.minor_gc()
+                Heap._young.append(obj)
+                Heap._young_used += size
+                return
+            obj.gen = GenGCHandler.OLD  # 新生代放不下的大对象直接分配在老年代
+        if Heap._used + size > Heap._capacity:
+            Heap.__make_room(size)
+        if Heap._incremental:
+            if not IncrementalGCHandler.marking and Heap._used + size > Heap._capacity * INCREMENTAL_START_RATIO:
+                GC.start_incremental_gc(Heap._java_heap, Heap.collect_static_field, Heap.after_gc)
+            if IncrementalGCHandler.marking:
+                IncrementalGCHandler.allocate_black(obj)
+        Heap._java_heap.append(obj)
+        Heap._used += size
 
     @staticmethod
-    def __new_ref(ref, retry):
-        if Heap._index >= Heap._length:
-            if retry:
+    def __make_room(size):
+        if Heap._survival_rate >= SURVIVAL_GROW_RATIO and Heap.__grow(size):
+            return
+        Heap.gc()
+        if Heap._used + size <= Heap._capacity or Heap.__grow(size):
+            return
+        if ReferenceProcessor.references:
+            # 放不下的时候再做一次 gc，清掉所有软引用，还是放不下才报错
+            ReferenceProcessor.clear_soft = True
+            try:
                 Heap.gc()
-                Heap.__new_ref(ref, False)
-            else:
-                error_handler.rise_runtime_error('no heap space !!!')
-        else:
-            Heap._java_heap[Heap._index] = ref
-            Heap._index += 1
+            finally:
+                ReferenceProcessor.clear_soft = False
+            if Heap._used + size <= Heap._capacity or Heap.__grow(size):
+                return
+        error_handler.rise_runtime_error('no heap space !!!')
+
+    # 容量翻倍直到放得下，不超过 max_size，放不下返回 False
+    @staticmethod
+    def __grow(size):
+        need = Heap._used + size
+        if need > Heap._max_size:
+            return False
+        capacity = Heap._capacity
+        while capacity < need:
+            capacity *= 2
+        capacity = min(capacity, Heap._max_size)
+        print_utils.print_jvm_status('heap grow: %d -> %d', Heap._capacity, capacity)
+        Heap._capacity = capacity
+        # 扩容之后重新看存活率，避免每次堆满都直接扩容
+        Heap._survival_rate = 0.0
+        return True
+
+    @staticmethod
+    def used():
+        return Heap._used + Heap._young_used
+
+    # 复制模式下包括留给 to-space 的另一半
+    @staticmethod
+    def capacity():
+        if Heap._copying:
+            return Heap._capacity * 2
+        return Heap._capacity + Heap._young_capacity
+
+    # gc 日志用: (已用字节, 容量, 对象个数, 累计分配的字节)
+    @staticmethod
+    def usage():
+        return Heap.used(), Heap.capacity(), len(Heap._java_heap) + len(Heap._young), Heap._allocated
 
     @staticmethod
     def collect_static_field():
@@ -40,16 +143,50 @@ class Heap(object):
         for jclass in Heap._jclass_heap:
             fields = jclass.static_fields
             for slot in fields.values():
-                if slot.ref is not None:
+                if GCHandler.is_heap_ref(slot.ref):
                     static_fields.append(slot.ref)
         return static_fields
 
+    @staticmethod
+    def size_of(objs):
+        size = 0
+        for obj in objs:
+            size += obj.size
+        return size
+
+    # 分代模式下 gc() 是 full gc，新生代和老年代一起回收
+    # 增量模式下如果正在标记，一次做完剩下的标记
     @staticmethod
     def gc():
-        Heap._index = GC.start_gc(Heap._java_heap, Heap.collect_static_field())
+        if Heap._generational:
+            GC.start_major_gc(Heap._young, Heap._java_heap, Heap.collect_static_field)
+            Heap._young_used = Heap.size_of(Heap._young)
+        elif IncrementalGCHandler.marking:
+            GC.finish_incremental_gc()
+        else:
+            Heap._java_heap = GC.start_gc(Heap.collect_static_field)
+        Heap.after_gc()
+        GC.stop_gc()
+
+    # 重新统计已用空间和存活率，空闲的空间决定软引用能活多久
+    @staticmethod
+    def after_gc():
+        Heap._used = Heap.size_of(Heap._java_heap)
+        Heap._survival_rate = float(Heap._used) / Heap._capacity
+        ReferenceProcessor.free_bytes = max(Heap._max_size - Heap._used, 0)
+
+    # 新生代满了，存活的对象留在新生代或者晋升到老年代，晋升之后老年代超出容量时再做 full gc 或者扩容
+    @staticmethod
+    def minor_gc():
+        promoted = GC.start_minor_gc(Heap._young, jvm_config.tenure_threshold)
+        Heap._young_used = Heap.size_of(Heap._young)
+        Heap._java_heap.extend(promoted)
+        Heap._used += Heap.size_of(promoted)
+        ReferenceProcessor.free_bytes = max(Heap._max_size - Heap._used, 0)
         GC.stop_gc()
+        if Heap._used > Heap._capacity:
+            Heap.__make_room(0)
 
 
 if __name__ == '__main__':
     Heap.gc()
-
@@ -1,10 +1,12 @@
 # coding=utf-8
 
-from base.utils import common_utils, print_utils
+from base.utils import common_utils, print_utils, error_handler
 from java_class.class_file import *
 from java_class.class_parser import ClassParser
 from runtime.thread import Slot
 from runtime.heap import Heap
+from jgc.gc import ReferenceProcessor
+from runtime.native import NativeMethods
 from base.jvm_config import jdk_path
 
 import os
@@ -19,6 +21,8 @@ class JClass(object):
     ACC_FINAL = 0x0010
     ACC_VOLATILE = 0x0040
     ACC_TRANSIENT = 0x0080
+    ACC_INTERFACE = 0x0200
+    ACC_ABSTRACT = 0x0400
     ACC_SYNTHETIC = 0x1000
     ACC_ENUM = 0x4000
 
@@ -39,13 +43,25 @@ class JClass(object):
         self.name = None
         self.super_class_name = None
         self.super_class = None
-        self.interfaces = None
+        self.interface_names = None
+        self.interfaces = None  # 直接实现 (或者继承) 的接口 JClass[]
         self.fields = None
         self.methods = None
         self.constant_pool = None
         self.class_loader = None
         self.static_fields = None  # map{ name: Slot }
         self.has_inited = False
+        self.vtable = None  # 虚方法表 Method[]
+        self.vtable_map = None  # map{ (name, descriptor): vtable 下标 }
+        self.imethod_map = None  # 接口才有，map{ (name, descriptor): 接口方法下标 }，包括父接口的方法
+        self.imethods = None  # 接口才有，按下标排列的 (name, descriptor)
+        self.itable = None  # map{ 接口 JClass: 按接口方法下标排列的实现 Method[] }
+        self.instance_size = None  # 实例的估算大小 (字节)，第一次创建实例时计算
+        self.field_layout = None  # 实例字段 Field[]，父类的字段在前，下标就是字段值在 JObject.data 里的位置
+        self.field_index = None  # map{ name: field_layout 下标 }，同名时是子类自己的字段
+        self.field_defaults = None  # 新对象的字段初始值，按 field_layout 排列
+        self.reference_kind = None  # java/lang/ref 下的软 / 弱 / 虚引用类 (包括子类) 才有，见 ReferenceProcessor
+        self.finalizer = None  # 覆盖了 Object.finalize 的类才有，对象不可达时调用
 
     def new_jclass(self, class_file):
         Heap.new_jclass(self)
@@ -56,21 +72,153 @@ class JClass(object):
         super_class = self.constant_pool.constants[common_utils.get_int_from_bytes(class_file.super_class)]
         if super_class is not None:
             self.super_class_name = super_class.class_name  # 从方法区取
-        self.interfaces = None
+        self.interface_names = []
+        for index in class_file.interfaces:
+            self.interface_names.append(self.constant_pool.constants[common_utils.get_int_from_bytes(index)].class_name)
+        self.interfaces = []
         self.static_fields = {}
         for sf in self.__get_static_fields():
-            desc = sf.descriptor
             slot = Slot()
-            if desc == 'B' or desc == 'I' or desc == 'J' or desc == 'S' or desc == 'Z':
-                slot.num = 0
-            elif desc == 'C':
-                slot.num = '0'
-            elif desc == 'F':
-                slot.num = 0.0
-            elif desc == 'D':
-                slot.num = 0.0
+            slot.num = Field.default_value(sf.descriptor)
             self.static_fields[sf.name] = slot
 
+    def is_interface(self):
+        return self.access_flag & JClass.ACC_INTERFACE != 0
+
+    # 链接时构造虚方法表: 先复制父类的表，同名同描述符的方法覆盖父类的 slot，新方法追加在后面
+    # 静态方法，私有方法和构造方法不参与动态分派，类里没有实现的接口 default 方法追加在最后
+    # 类 (包括父类) 的方法优先于 default 方法，父类表里来自接口的 default 方法可以被更具体的接口的 default 替换
+    def build_vtable(self):
+        if self.super_class is not None and self.super_class.vtable is not None:
+            vtable = list(self.super_class.vtable)
+            vtable_map = dict(self.super_class.vtable_map)
+        else:
+            vtable = []
+            vtable_map = {}
+        for m in self.methods:
+            if not JClass.is_virtual_method(m):
+                continue
+            key = (m.name, m.descriptor)
+            index = vtable_map.get(key)
+            if index is None:
+                vtable_map[key] = len(vtable)
+                vtable.append(m)
+            else:
+                vtable[index] = m
+        if not self.is_interface():
+            candidates = {}
+            for interface in self.get_all_interfaces():
+                for m in interface.methods:
+                    if JClass.is_virtual_method(m):
+                        candidates.setdefault((m.name, m.descriptor), []).append(m)
+            for key, methods in candidates.items():
+                index = vtable_map.get(key)
+                if index is not None and not vtable[index].jclass.is_interface():
+                    continue
+                m = JClass.most_specific_default(methods)
+                if m is None:
+                    continue
+                if index is None:
+                    vtable_map[key] = len(vtable)
+                    vtable.append(m)
+                else:
+                    vtable[index] = m
+        self.vtable = vtable
+        self.vtable_map = vtable_map
+
+    # 同一个方法在多个接口里声明时，去掉所在接口是其他候选接口的父接口的，剩下的里面取有方法体的 default 方法
+    # 更具体的接口重新声明成抽象方法时，父接口的 default 方法也不再适用，返回 None
+    @staticmethod
+    def most_specific_default(methods):
+        for m in methods:
+            if m.code is None:
+                continue
+            if not any(other.jclass is not m.jclass and m.jclass in other.jclass.get_all_interfaces()
+                       for other in methods):
+                return m
+        return None
+
+    # 链接时排好实例字段: 先是父类的全部字段 (包括私有字段)，再追加自己的，
+    # 所以同一个字段在这个类和所有子类的对象里下标都一样
+    def build_field_layout(self):
+        if self.super_class is not None and self.super_class.field_layout is not None:
+            layout = list(self.super_class.field_layout)
+            field_index = dict(self.super_class.field_index)
+            defaults = list(self.super_class.field_defaults)
+        else:
+            layout = []
+            field_index = {}
+            defaults = []
+        for field in self.get_instance_fields():
+            field.index = len(layout)
+            field_index[field.name] = field.index
+            layout.append(field)
+            defaults.append(Field.default_value(field.descriptor))
+        self.field_layout = layout
+        self.field_index = field_index
+        self.field_defaults = defaults
+
+    @staticmethod
+    def is_virtual_method(method):
+        return not JClass.is_static(method.access_flag) and not JClass.is_private(method.access_flag) \
+            and method.name[0] != '<'
+
+    # 所有实现的接口，包括父类实现的和父接口，按深度优先的顺序去重
+    def get_all_interfaces(self):
+        result = []
+        jclass = self
+        while jclass is not None:
+            JClass.__collect_interfaces(jclass.interfaces, result)
+            jclass = jclass.super_class
+        return result
+
+    @staticmethod
+    def __collect_interfaces(interfaces, result):
+        for interface in interfaces:
+            if interface not in result:
+                result.append(interface)
+                JClass.__collect_interfaces(interface.interfaces, result)
+
+    # 接口: 给自己和父接口声明的方法编号
+    # 类: 对每个实现的接口，按接口方法的编号排好实现的方法，没有实现的位置为 None
+    def build_itable(self):
+        if self.is_interface():
+            imethods = []
+            imethod_map = {}
+            for interface in [self] + self.get_all_interfaces():
+                for m in interface.methods:
+                    if not JClass.is_virtual_method(m):
+                        continue
+                    key = (m.name, m.descriptor)
+                    if key not in imethod_map:
+                        imethod_map[key] = len(imethods)
+                        imethods.append(key)
+            self.imethods = imethods
+            self.imethod_map = imethod_map
+            return
+        itable = {}
+        vtable = self.vtable
+        vtable_map = self.vtable_map
+        for interface in self.get_all_interfaces():
+            methods = []
+            for key in interface.imethods:
+                index = vtable_map.get(key)
+                methods.append(vtable[index] if index is not None else None)
+            itable[interface] = methods
+        self.itable = itable
+
+    # 是否是 name 这个类 / 接口本身或者它的子类 / 实现类
+    def is_subclass_of(self, name):
+        jclass = self
+        while jclass is not None:
+            if jclass.name == name:
+                return True
+            jclass = jclass.super_class
+        for interface in self.get_all_interfaces():
+            if interface.name == name:
+                return True
+        return False
+
     def get_instance_fields(self):
         return [field for field in self.fields if not JClass.is_static(field.access_flag)]
 
@@ -102,7 +250,7 @@ class ConstantPool(object):
             elif isinstance(cp, MethodRefInfo):
                 constants.append(MethodRef.new_method_ref(r_cp, cp))
             elif isinstance(cp, InterfaceMethodRefInfo):
-                constants.append(None)
+                constants.append(InterfaceMethodRef.new_interface_method_ref(r_cp, cp))
             elif isinstance(cp, StringInfo):
                 st = r_cp[common_utils.get_int_from_bytes(cp.string_index)]
                 st = common_utils.get_string_from_bytes(st.bytes)
@@ -157,6 +305,16 @@ class Field(object):
         self.constant_value_index = None
         self.signature = None  # 记录范型变量
         self.type = None  # JClass
+        self.index = None  # 实例字段在对象里的下标，见 JClass.build_field_layout
+
+    # 字段的初始值，引用类型是 None
+    @staticmethod
+    def default_value(desc):
+        if desc == 'B' or desc == 'C' or desc == 'I' or desc == 'J' or desc == 'S' or desc == 'Z':
+            return 0
+        elif desc == 'F' or desc == 'D':
+            return 0.0
+        return None
 
     def is_public(self):
         return MemberRef.check_state(self.access_flag, FieldRef.ACC_PUBLIC)
@@ -203,8 +361,14 @@ class Method(object):
         self.max_stack = None
         self.max_locals = None
         self.code = None
+        self.instructions = None  # 解码后的指令数组，按 pc 索引
+        self.handlers = None  # fast 模式使用的 (handler, next_pc) 表，见 instruction/handlers.py
+        self.ref_maps = None  # gc 扫描栈用的按 pc 索引的 RefMap
         self.exceptions = None  # ExceptionTable[]
         self.arg_desc = None
+        self.arg_slot_count = 0  # 参数占用的 slot 数，不包括 this
+        self.invoke_slot_count = 0  # 调用时从操作数栈拷贝到局部变量表的 slot 数，实例方法包括 this
+        self.native = None  # 链接时绑定的 python 实现 (NativeMethods)，调用时不建 frame
         self.jclass = None
 
     @staticmethod
@@ -216,55 +380,61 @@ class Method(object):
             nm.access_flag = common_utils.get_int_from_bytes(m.access_flags)
             nm.name = constant_pool[common_utils.get_int_from_bytes(m.name_index)]
             nm.descriptor = constant_pool[common_utils.get_int_from_bytes(m.descriptor_index)]
-            attr = get_attribute(m.attributes, constant_pool, 'Code')
-            nm.max_stack = common_utils.get_int_from_bytes(attr.max_stack)
-            nm.max_locals = common_utils.get_int_from_bytes(attr.max_locals)
-            nm.code = attr.code
             nm.exceptions = []
-            for ex in attr.exception_table:
-                jex = JException()
-                jex.start_pc = common_utils.get_int_from_bytes(ex.start_pc)
-                jex.end_pc = common_utils.get_int_from_bytes(ex.end_pc)
-                jex.handler_pc = common_utils.get_int_from_bytes(ex.handler_pc)
-                jex.catch_type = common_utils.get_int_from_bytes(ex.catch_type)
-                nm.exceptions.append(jex)
+            attr = get_attribute(m.attributes, constant_pool, 'Code')
+            # 抽象方法和 native 方法没有 Code 属性
+            if attr is None:
+                nm.max_stack = 0
+                nm.max_locals = 0
+            else:
+                nm.max_stack = common_utils.get_int_from_bytes(attr.max_stack)
+                nm.max_locals = common_utils.get_int_from_bytes(attr.max_locals)
+                nm.code = attr.code
+                for ex in attr.exception_table:
+                    jex = JException()
+                    jex.start_pc = common_utils.get_int_from_bytes(ex.start_pc)
+                    jex.end_pc = common_utils.get_int_from_bytes(ex.end_pc)
+                    jex.handler_pc = common_utils.get_int_from_bytes(ex.handler_pc)
+                    jex.catch_type = common_utils.get_int_from_bytes(ex.catch_type)
+                    nm.exceptions.append(jex)
             nm.arg_desc = Method.get_arg_desc(nm.descriptor)
+            nm.arg_slot_count = Method.get_arg_slot_count(nm.arg_desc)
+            nm.invoke_slot_count = nm.arg_slot_count
+            if not JClass.is_static(nm.access_flag):
+                nm.invoke_slot_count += 1
             methods.append(nm)
         return methods
 
+    # 把方法描述符拆成参数描述符列表，如 (I[JLjava/lang/String;)V -> ['I', '[J', 'Ljava/lang/String;']
     @staticmethod
     def get_arg_desc(descs):
         arg_desc = []
-        desc = ''
-        for s in descs:
-            if s == ')':
-                break
-            if len(desc) == 0:
-                if s == 'B' or s == 'C' or s == 'D' or s == 'F' or s == 'I' or s == 'J' or s == 'S' or s == 'Z':
-                    desc = s
-                    arg_desc.append(desc)
-                    desc = ''
-                elif s == 'L':
-                    desc += s
-            else:
-                if desc[0] == 'L':
-                    desc += s
-                    if s == ';':
-                        arg_desc.append(desc)
-                        desc = ''
-                elif desc[0] == '[':
-                    if 'L' in desc:
-                        desc += s
-                        if s == ';':
-                            arg_desc.append(desc)
-                            desc = ''
-                    else:
-                        desc += s
-                        if s != '[':
-                            arg_desc.append(desc)
-                            desc = ''
+        i = descs.find('(') + 1
+        end = descs.find(')')
+        while i < end:
+            start = i
+            while descs[i] == '[':
+                i += 1
+            if descs[i] == 'L':
+                i = descs.find(';', i)
+            i += 1
+            arg_desc.append(descs[start:i])
         return arg_desc
 
+    # long 和 double 占两个 slot，其余 (包括数组和对象引用) 占一个
+    @staticmethod
+    def get_arg_slot_width(desc):
+        if desc == 'J' or desc == 'D':
+            return 2
+        return 1
+
+    @staticmethod
+    def get_arg_slot_count(arg_desc):
+        count = 0
+        for desc in arg_desc:
+            count += Method.get_arg_slot_width(desc)
+        return count
+
 
 class JException(object):
     def __init__(self):
@@ -379,11 +549,14 @@ class FieldRef(MemberRef):
             return self.field
         if self.cache_class is None:
             self.resolve_class(class_loader)
-        fields = self.cache_class.fields
-        for f in fields:
-            if f.name == self.name:
-                self.field = f
-                break
+        # 字段可能声明在父类里
+        jclass = self.cache_class
+        while jclass is not None and self.field is None:
+            for f in jclass.fields:
+                if f.name == self.name and f.descriptor == self.descriptor:
+                    self.field = f
+                    break
+            jclass = jclass.super_class
         return self.field
 
 
@@ -391,58 +564,101 @@ class MethodRef(MemberRef):
     def __init__(self):
         super(MethodRef, self).__init__()
         self.method = None
+        self.arg_slot_count = 0  # 参数占用的 slot 数，不包括 this，分派前用来找到接收者
+        self.vtable_index = None
 
     @staticmethod
     def new_method_ref(cp, method_ref_info):
-        mr = MethodRef()
+        return MethodRef.init_method_ref(MethodRef(), cp, method_ref_info)
+
+    @staticmethod
+    def init_method_ref(mr, cp, method_ref_info):
         cl = cp[common_utils.get_int_from_bytes(method_ref_info.class_index)]
         mr.class_name = MemberRef.get_string(cp, cl.name_index)
         mr.cp = cp
         name_and_type = MemberRef.get_obj(cp, method_ref_info.name_and_type_index)
         mr.name = MemberRef.get_string(cp, name_and_type.name_index)
         mr.descriptor = MemberRef.get_string(cp, name_and_type.descriptor_index)
+        mr.arg_slot_count = Method.get_arg_slot_count(Method.get_arg_desc(mr.descriptor))
         return mr
 
     # TODO: 方法权限等的处理
+    # 和 JVMS 5.4.3.3 一样先在类和父类里找，再到父接口里找，找不到抛 NoSuchMethodError
     def resolve_method(self, class_loader, need_re_resolve=False, class_name=None):
         if self.method is not None and not need_re_resolve:
             return self.method
         if self.cache_class is None or need_re_resolve:
             self.resolve_class(class_loader, need_re_resolve, class_name)
-        methods = self.cache_class.methods
-        for m in methods:
-            if m.name == self.name and m.descriptor == self.descriptor:
-                self.method = m
-                break
-        return self.method
-
-    def resolve_method_with_super(self, class_loader):
-        self.resolve_method(class_loader, True)
-        if self.method is None:
-            super_class = self.cache_class.super_class
-            while super_class is not None:
-                for m in super_class.methods:
-                    if m.name == self.name:
-                        self.method = m
-                        break
-                if self.method is not None:
-                    break
-                super_class = super_class.super_class
-        return self.method
-
-    def re_resolve_method_with_super_by_class_name(self, class_loader, class_name):
-        self.resolve_method(class_loader, True, class_name)
-        if self.method is None:
-            super_class = self.cache_class.super_class
-            while super_class is not None:
-                for m in super_class.methods:
-                    if m.name == self.name:
-                        self.method = m
-                        break
-                if self.method is not None:
-                    break
-                super_class = super_class.super_class
-        return self.method
+        method = MethodRef.find_method(self.cache_class, self.name, self.descriptor)
+        if method is None:
+            error_handler.rise_no_such_method_error(self.class_name + '.' + self.name + self.descriptor)
+        self.method = method
+        return method
+
+    # 父接口里有多个同名方法时取最具体的 default 方法，没有 default 方法就取其中一个抽象方法
+    @staticmethod
+    def find_method(jclass, name, descriptor):
+        klass = jclass
+        while klass is not None:
+            for m in klass.methods:
+                if m.name == name and m.descriptor == descriptor:
+                    return m
+            klass = klass.super_class
+        candidates = [m for interface in jclass.get_all_interfaces() for m in interface.methods
+                      if m.name == name and m.descriptor == descriptor and JClass.is_virtual_method(m)]
+        if not candidates:
+            return None
+        method = JClass.most_specific_default(candidates)
+        return method if method is not None else candidates[0]
+
+    # 解析成声明类虚方法表里的下标，子类覆盖的方法在各自虚方法表的同一个下标上
+    # 不在虚方法表里的方法 (比如私有方法) 返回 -1，由调用方直接调用解析到的方法
+    def resolve_vtable_index(self, class_loader):
+        if self.vtable_index is not None:
+            return self.vtable_index
+        jclass = self.resolve_class(class_loader)
+        index = jclass.vtable_map.get((self.name, self.descriptor))
+        if index is None:
+            index = -1
+        self.vtable_index = index
+        return index
+
+
+class InterfaceMethodRef(MethodRef):
+    def __init__(self):
+        super(InterfaceMethodRef, self).__init__()
+        self.itable_index = None
+
+    @staticmethod
+    def new_interface_method_ref(cp, interface_method_ref_info):
+        return MethodRef.init_method_ref(InterfaceMethodRef(), cp, interface_method_ref_info)
+
+    # 解析成接口方法的编号，接口里没有声明的方法 (比如 Object 的方法) 返回 -1
+    def resolve_itable_index(self, class_loader):
+        if self.itable_index is not None:
+            return self.itable_index
+        interface = self.resolve_class(class_loader)
+        index = interface.imethod_map.get((self.name, self.descriptor))
+        if index is None:
+            index = -1
+        self.itable_index = index
+        return index
+
+    # 在接收者类的 itable 里找到实现的方法
+    def find_interface_method(self, class_loader, jclass):
+        index = self.resolve_itable_index(class_loader)
+        if index < 0:
+            vindex = jclass.vtable_map.get((self.name, self.descriptor))
+            if vindex is None:
+                error_handler.rise_no_such_method_error(self.class_name + '.' + self.name + self.descriptor)
+            return jclass.vtable[vindex]
+        methods = jclass.itable.get(self.cache_class)
+        if methods is None:
+            error_handler.rise_incompatible_class_change_error()
+        method = methods[index]
+        if method is None or method.code is None:
+            error_handler.rise_abstract_method_error()
+        return method
 
 
 class BaseType(object):
@@ -523,7 +739,7 @@ class ClassLoader(object):
             class_path = path + class_name.replace('.', '/') + '.class'
             if not os.path.exists(class_path):
                 continue
-            print_utils.print_jvm_status('load class: ' + class_path)
+            print_utils.print_jvm_status('load class: %s', class_path)
             jclass = self.define_class(class_name, class_path)
             self._loaded_classes[class_name] = jclass
             return jclass
@@ -532,10 +748,18 @@ class ClassLoader(object):
     def __load_array_class(self, class_name):
         jclass = JClass()
         jclass.super_class_name = 'java/lang/Object'
+        jclass.interface_names = []
+        jclass.interfaces = []
         jclass.class_loader = self
         jclass.has_inited = True
         jclass.name = class_name
+        # 数组类的方法都继承自 Object
+        object_class = self.load_class('java/lang/Object')
+        jclass.super_class = object_class
+        jclass.vtable = object_class.vtable
+        jclass.vtable_map = object_class.vtable_map
         self._loaded_classes[class_name] = jclass
+        return jclass
 
     def define_class(self, class_name, path):
         parser = ClassParser(path)
@@ -544,9 +768,22 @@ class ClassLoader(object):
         jclass.name = class_name
         jclass.new_jclass(parser.class_file)
         jclass.super_class = self.load_super_class(jclass)
+        jclass.interfaces = self.load_interfaces(jclass)
+        jclass.build_field_layout()
+        jclass.build_vtable()
+        jclass.build_itable()
+        ReferenceProcessor.link_class(jclass)
+        NativeMethods.link_class(jclass)
         return jclass
 
+    def load_interfaces(self, jclass):
+        interfaces = []
+        for name in jclass.interface_names:
+            interfaces.append(self.load_class(name))
+        return interfaces
+
+    # 只有 java/lang/Object 没有父类
     def load_super_class(self, jclass):
-        if jclass.super_class_name == 'java/lang/Object' or jclass.super_class_name is None:
+        if jclass.super_class_name is None:
             return
         return self.load_class(jclass.super_class_name)
@@ -1,8 +1,11 @@
 # coding=utf-8
 
-from runtime.thread import Slot
 from base.utils import error_handler
 import runtime.heap as heap
+from jgc.gc import ReferenceProcessor
+
+from array import array
+import random
 
 
 # 对应 java 中的实例对象
@@ -10,107 +13,133 @@ class JObject(object):
     TYPE_OBJ = 0
     TYPE_ARRAY = 1
 
+    # 估算对象大小用的字节数，和 hotspot 64 位开启压缩指针时差不多
+    HEADER_SIZE = 12
+    REF_SIZE = 4
+    ALIGNMENT = 8
+    FIELD_SIZE = {'B': 1, 'Z': 1, 'C': 2, 'S': 2, 'I': 4, 'F': 4, 'J': 8, 'D': 8}
+
+    __slots__ = ('type', 'jclass', 'data', 'size', 'gen', 'age', 'forward', 'hash')
+
     def __init__(self):
         self.type = JObject.TYPE_OBJ
         self.jclass = None
-        self.data = None  # 在 JObject 是map，在 JAarry 里面是 Slot 数组
+        self.data = None  # 在 JObject 里是按 jclass.field_layout 排列的字段值，在 JArray 里是元素 (见 JArray)
+        self.size = 0  # 估算的大小 (字节)，堆按这个记账
+        self.gen = 0  # 分代 gc 用: 0 新生代，1 老年代
+        self.age = 0  # 分代 gc 用: 熬过的 minor gc 次数
+        self.forward = None  # 复制 gc 用: 搬移之后指向新的对象
+        self.hash = 0  # Object.hashCode，第一次调用时生成，0 表示还没有生成
 
     @staticmethod
     def new_object(jclass):
         jobject = JObject()
         jobject.type = JObject.TYPE_OBJ
         jobject.jclass = jclass
-        jobject.data = {}
-        JObject.collect_fields(jobject.jclass, jobject.data, False)
-
-        # 收集父类 field
-        super_class = jobject.jclass.super_class
-        while super_class is not None:
-            JObject.collect_fields(super_class, jobject.data, True)
-            super_class = super_class.super_class
+        jobject.data = list(jclass.field_defaults)
+        jobject.size = JObject.get_instance_size(jclass)
         return jobject
 
+    # 对象头加上所有实例字段 (包括父类的私有字段)，按 8 字节对齐，每个类只算一次
     @staticmethod
-    def collect_fields(jclass, data, filter_private):
-        for field in jclass.get_instance_fields():
-            if filter_private and field.is_private():
-                continue
-            desc = field.descriptor
-            slot = Slot()
-            if desc == 'B' or desc == 'I' or desc == 'J' or desc == 'S' or desc == 'Z':
-                slot.num = 0
-            elif desc == 'C':
-                slot.num = '0'
-            elif desc == 'F':
-                slot.num = 0.0
-            elif desc == 'D':
-                slot.num = 0.0
-            data[field.name] = slot
+    def get_instance_size(jclass):
+        size = jclass.instance_size
+        if size is not None:
+            return size
+        size = JObject.HEADER_SIZE
+        for field in jclass.field_layout:
+            size += JObject.FIELD_SIZE.get(field.descriptor, JObject.REF_SIZE)
+        size = JObject.align(size)
+        jclass.instance_size = size
+        return size
 
+    @staticmethod
+    def align(size):
+        return (size + JObject.ALIGNMENT - 1) // JObject.ALIGNMENT * JObject.ALIGNMENT
+
+    # 复制 gc 搬移对象: 新对象直接接管字段数据，旧对象只用来留下转发指针
+    def move(self):
+        obj = JObject()
+        self.copy_header(obj)
+        return obj
+
+    def copy_header(self, obj):
+        obj.type = self.type
+        obj.jclass = self.jclass
+        obj.data = self.data
+        obj.size = self.size
+        obj.gen = self.gen
+        obj.age = self.age
+        obj.hash = self.hash
+
+    # 对象的 identity hash (31 位正数)，存在对象头里，复制 gc 搬移对象之后不变
+    def identity_hash(self):
+        value = self.hash
+        if value == 0:
+            value = random.getrandbits(31) or 1
+            self.hash = value
+        return value
+
+    # 按字段名读写，给虚拟机代码用，字节码直接用解析好的下标访问 data
     def get_field(self, name):
-        self.__check_name(name)
-        slot = self.data[name]
-        if slot.num is not None:
-            return slot.num
-        return slot.ref
-
-    def put_field(self, name, num):
-        self.__check_name(name)
-        self.data[name].num = num
-
-    def put_ref_field(self, name, ref):
-        self.__check_name(name)
-        self.data[name].ref = ref
-
-    def __check_name(self, name):
-        if name not in self.data:
+        return self.data[self.__field_index(name)]
+
+    def put_field(self, name, value):
+        self.data[self.__field_index(name)] = value
+
+    def __field_index(self, name):
+        index = self.jclass.field_index.get(name)
+        if index is None:
             error_handler.rise_runtime_error('no this field')
+        return index
 
 
 # 指向实例对象
-# 实例对象保存在 gc 堆中，ref 指向实例对象
+# 实例对象保存在 gc 堆中，ref 直接指向实例对象，复制 gc 搬移对象之后更新 ref.obj
 class JRef(object):
+    __slots__ = ('obj',)
+
     def __init__(self, obj):
-        self.handler = JHandler(obj)
+        self.obj = obj
 
     @staticmethod
     def check_null(jref):
-        if jref is not None and jref.handler is not None and jref.handler.obj is not None:
-            return False
-        return True
+        return jref is None or jref.obj is None
 
     @staticmethod
     def new_object(jclass):
-        # TODO: obj 放入 gc 堆
         obj = JObject.new_object(jclass)
-        jref = JRef(obj)
-        heap.Heap.new_ref(jref)
-        return jref
+        heap.Heap.new_object(obj)
+        ref = JRef(obj)
+        if jclass.reference_kind is not None or jclass.finalizer is not None:
+            ReferenceProcessor.register(ref)
+        return ref
 
     @staticmethod
     def new_array(jclass, atype, count):
         array = JArray.new_array(jclass, atype, count)
-        jref = JRef(array)
-        heap.Heap.new_ref(jref)
-        return jref
+        heap.Heap.new_object(array)
+        return JRef(array)
 
     @staticmethod
-    def new_ref_array(jclass, type_class_ref, count):
-        array = JArray.new_ref_array(jclass, type_class_ref, count)
-        jref = JRef(array)
-        heap.Heap.new_ref(jref)
-        return jref
-
-    def clone(self):
-        return JRef(self.handler.obj)
+    def new_ref_array(jclass, count):
+        array = JArray.new_ref_array(jclass, count)
+        heap.Heap.new_object(array)
+        return JRef(array)
 
+    @staticmethod
+    def new_array_like(jarray, count):
+        array = JArray.new_array_like(jarray, count)
+        heap.Heap.new_object(array)
+        return JRef(array)
 
-# 方便 gc
-class JHandler(object):
-    def __init__(self, obj):
-        self.obj = obj
+    def clone(self):
+        return JRef(self.obj)
 
 
+# 基本类型数组的元素放在 array.array 里，按 java 的元素宽度连续存放，新建时全部是 0
+# 引用数组的元素是 list，元素是 JRef 或者 None
+# 存入 byte / short / char 数组的值由 xASTORE 截断到元素宽度，int / long 在算术指令里已经回绕过
 class JArray(JObject):
     T_BOOLEAN = 4
     T_CHAR = 5
@@ -123,31 +152,49 @@ class JArray(JObject):
 
     T_REF = 100
 
+    ELEMENT_SIZE = {T_BOOLEAN: 1, T_CHAR: 2, T_FLOAT: 4, T_DOUBLE: 8, T_BYTE: 1, T_SHORT: 2, T_INT: 4, T_LONG: 8,
+                    T_REF: JObject.REF_SIZE}
+    # array.array 的类型码，宽度和 ELEMENT_SIZE 一致
+    TYPECODES = {T_BOOLEAN: 'b', T_CHAR: 'H', T_FLOAT: 'f', T_DOUBLE: 'd', T_BYTE: 'b', T_SHORT: 'h', T_INT: 'i',
+                 T_LONG: 'q'}
+    # 基本类型的描述符对应的 atype
+    ATYPES = {'Z': T_BOOLEAN, 'C': T_CHAR, 'F': T_FLOAT, 'D': T_DOUBLE, 'B': T_BYTE, 'S': T_SHORT, 'I': T_INT,
+              'J': T_LONG}
+
+    __slots__ = ('atype', 'length', 'descriptor')
+
     def __init__(self):
         super(JArray, self).__init__()
         self.atype = None
         self.length = 0
         self.descriptor = ''
 
-    def add_item(self, index, item):
-        self.__check_index(index)
-        self.data[index].num = item
+    def move(self):
+        array = JArray()
+        self.copy_header(array)
+        array.atype = self.atype
+        array.length = self.length
+        array.descriptor = self.descriptor
+        return array
 
-    def add_ref_item(self, index, item):
+    # 按下标读写，给虚拟机代码用，字节码直接访问 data
+    def add_item(self, index, item):
         self.__check_index(index)
-        self.data[index].ref = item
+        self.data[index] = item
 
     def get_item(self, index):
         self.__check_index(index)
-        slot = self.data[index]
-        if slot.num is not None:
-            return slot.num
-        return slot.ref
+        return self.data[index]
 
     def __check_index(self, index):
-        if index >= self.length:
+        if index < 0 or index >= self.length:
             error_handler.rise_runtime_error('index out of bounds')
 
+    # 对象头 + 4 字节的 length + 元素
+    @staticmethod
+    def get_array_size(atype, length):
+        return JObject.align(JObject.HEADER_SIZE + 4 + JArray.ELEMENT_SIZE[atype] * length)
+
     @staticmethod
     def get_array_jclass_name(atype):
         if atype == JArray.T_BOOLEAN:
@@ -168,9 +215,12 @@ class JArray(JObject):
             return '[J'
         return ''
 
+    # 元素是 class_name 的数组类名，class_name 本身是数组时直接加一维
     @staticmethod
-    def get_ref_array_jclass_name(ref_desc):
-        return '[' + ref_desc
+    def get_ref_array_jclass_name(class_name):
+        if class_name[0] == '[':
+            return '[' + class_name
+        return '[L' + class_name + ';'
 
     @staticmethod
     def new_array(jclass, atype, length):
@@ -180,20 +230,26 @@ class JArray(JObject):
         jarray.length = length
         jarray.atype = atype
         jarray.descriptor = JArray.get_array_jclass_name(atype)
-        jarray.data = []
-        for i in range(length):
-            jarray.data.append(Slot())
+        jarray.size = JArray.get_array_size(atype, length)
+        jarray.data = array(JArray.TYPECODES[atype], bytes(JArray.ELEMENT_SIZE[atype] * length))
         return jarray
 
+    # jclass 是数组类，类名就是数组的描述符
     @staticmethod
-    def new_ref_array(jclass, type_class_ref, length):
+    def new_ref_array(jclass, length):
         jarray = JArray()
         jarray.type = JObject.TYPE_ARRAY
         jarray.jclass = jclass
         jarray.length = length
         jarray.atype = JArray.T_REF
-        jarray.descriptor = JArray.get_ref_array_jclass_name(type_class_ref.class_name)
-        jarray.data = []
-        for i in range(length):
-            jarray.data.append(Slot())
+        jarray.descriptor = jclass.name
+        jarray.size = JArray.get_array_size(JArray.T_REF, length)
+        jarray.data = [None] * length
         return jarray
+
+    # 和 jarray 类型相同，长度为 length 的新数组
+    @staticmethod
+    def new_array_like(jarray, length):
+        if jarray.atype == JArray.T_REF:
+            return JArray.new_ref_array(jarray.jclass, length)
+        return JArray.new_array(jarray.jclass, jarray.atype, length)
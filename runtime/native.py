@@ -0,0 +1,34 @@
+# coding=utf-8
+
+from base.utils import error_handler
+
+
+# native 方法注册表: (类名, 方法名, 描述符) -> python 实现
+# 链接类的时候按 key 把实现绑定到 Method.native 上，invoke 指令看到 Method.native 就直接调用，不建 frame
+# 除了 ACC_NATIVE 方法，也可以给有字节码的方法注册实现 (intrinsic)，比如精简 jdk 里的 PrintStream.println
+# 实现函数的参数是调用方的 frame，从操作数栈上取参数 (实例方法包括 this)，有返回值的压回去
+class NativeMethods(object):
+    ACC_NATIVE = 0x0100
+
+    table = {}
+
+    @staticmethod
+    def register(class_name, name, descriptor, function):
+        NativeMethods.table[(class_name, name, descriptor)] = function
+
+    @staticmethod
+    def link_class(jclass):
+        table = NativeMethods.table
+        for method in jclass.methods:
+            function = table.get((jclass.name, method.name, method.descriptor))
+            if function is None and method.access_flag & NativeMethods.ACC_NATIVE:
+                function = NativeMethods.unsatisfied_link(jclass.name, method)
+            method.native = function
+
+    # 没有实现的 native 方法，调用时报错
+    @staticmethod
+    def unsatisfied_link(class_name, method):
+        def execute(frame):
+            error_handler.rise_runtime_error('java.lang.UnsatisfiedLinkError: %s.%s%s' %
+                                             (class_name, method.name, method.descriptor))
+        return execute
@@ -1,9 +1,7 @@
 # coding=utf-8
 
-from base.stack import Stack
 from base.utils.print_utils import print_jvm_status
-import runtime
-import struct
+import threading
 
 
 # 这个 thread 是抽象的 thread
@@ -13,6 +11,11 @@ class Thread(object):
     def __init__(self):
         self.pc = 0
         self.stack = JavaStack()
+        self.name = threading.current_thread().name
+        # 回收的 frame，按 (max_stack, max_locals) 分组复用，只在本线程内使用不需要加锁
+        self.frame_pool = {}
+        # 虚拟机代码 (不是字节码) 在分配对象期间临时持有的 ref，放在这里作为 gc root，用完出栈
+        self.handles = []
 
     @staticmethod
     def new_thread():
@@ -28,14 +31,31 @@ class Thread(object):
     def all_thread():
         return Thread.__thread_pool
 
+    # 优先从 frame 池里取同样大小的 frame，池里没有才新建
+    def new_frame(self, method):
+        pool = self.frame_pool.get((method.max_stack, method.max_locals))
+        if pool:
+            frame = pool.pop()
+            frame.reset(method)
+            return frame
+        return Frame(self, method)
+
     def add_frame(self, frame):
         self.stack.add_frame(frame)
 
     def top_frame(self):
         return self.stack.top_frame()
 
+    # 出栈的 frame 放回池里，复用时再重置
+    # 返回指令需要先把返回值从 frame 里取出来再出栈
     def pop_frame(self):
-        self.stack.pop_frame()
+        frame = self.stack.pop_frame()
+        key = (frame.max_stack, frame.max_locals)
+        pool = self.frame_pool.get(key)
+        if pool is None:
+            pool = []
+            self.frame_pool[key] = pool
+        pool.append(frame)
 
     def has_frame(self):
         return self.stack.has_frame()
@@ -55,7 +75,7 @@ class JavaStack(object):
         self.__frames.append(frame)
 
     def pop_frame(self):
-        self.__frames.pop()
+        return self.__frames.pop()
 
     def top_frame(self):
         return self.__frames[len(self.__frames) - 1]
@@ -65,6 +85,9 @@ class JavaStack(object):
 
 
 class Frame(object):
+    __slots__ = ('pc', 'thread', 'method', 'max_stack', 'max_locals', 'operand_stack', 'local_vars',
+                 'dynamic_linking')
+
     def __init__(self, thread, method):
         self.pc = 0
         self.thread = thread
@@ -75,32 +98,46 @@ class Frame(object):
         self.local_vars = LocalVars(self.max_locals)
         self.dynamic_linking = DynamicLinking()
 
+    # 复用同样大小的 frame，局部变量表要清空，否则残留的引用会被 gc 当作根
+    def reset(self, method):
+        self.pc = 0
+        self.method = method
+        self.operand_stack.top_index = 0
+        self.local_vars.clear()
+
     def print_cur_state(self):
-        print_jvm_status('max_stack: ' + str(self.max_stack))
-        print_jvm_status('max_locals: ' + str(self.max_locals))
-        print_jvm_status('operand_stack: ' + str(self.operand_stack.size()))
-        print_jvm_status(self.operand_stack)
-        print_jvm_status('local_vars: ' + str(self.local_vars.size()))
-        print_jvm_status(self.local_vars)
+        print_jvm_status('max_stack: %s', self.max_stack)
+        print_jvm_status('max_locals: %s', self.max_locals)
+        print_jvm_status('operand_stack: %s', self.operand_stack.size())
+        print_jvm_status('%s', self.operand_stack)
+        print_jvm_status('local_vars: %s', self.local_vars.size())
+        print_jvm_status('%s', self.local_vars)
 
 
 class Slot(object):
+    __slots__ = ('num', 'ref')
+
     def __init__(self):
         self.num = None
         self.ref = None
 
 
 # 局部变量表
+# slot 里直接存 python 值，long 和 double 占两个 slot，值放在低位的 slot 里
+# int / long 在算术指令里已经按 java 语义回绕过 (math_utils)，这里不再处理
 class LocalVars(object):
+    __slots__ = ('__size', 'slots')
+
     def __init__(self, size):
         self.__size = size
-        self.__items = [None] * size
-        for i in range(size):
-            self.__items[i] = Slot()
+        self.slots = [None] * size
+
+    def clear(self):
+        self.slots[:] = [None] * self.__size
 
     def __str__(self):
         s = ''
-        for i in self.__items:
+        for i in self.slots:
             s += str(i)
             s += '\n'
         return s
@@ -109,166 +146,135 @@ class LocalVars(object):
         return self.__size
 
     def print_state(self):
-        print_jvm_status(self.__items)
+        print_jvm_status(self.slots)
 
     def get_items(self):
-        return self.__items
-
-    def __add_num_to_item(self, index, data):
-        slot = self.__items[index]
-        slot.num = data
-
-    def __get_num_from_item(self, index):
-        return self.__items[index].num
-
-    def __add_ref_to_item(self, index, ref):
-        slot = self.__items[index]
-        slot.ref = ref
-
-    def __get_ref_from_item(self, index):
-        return self.__items[index].ref
+        return self.slots
 
     def add_int(self, index, data):
-        self.__add_num_to_item(index, struct.pack('i', data))
+        self.slots[index] = data
 
     def get_int(self, index):
-        return struct.unpack('i', self.__get_num_from_item(index))[0]
+        return self.slots[index]
 
     def add_long(self, index, data):
-        packed = struct.pack('q', data)
-        self.__add_num_to_item(index, packed[:4])
-        self.__add_num_to_item(index + 1, packed[4:])
+        slots = self.slots
+        slots[index] = data
+        slots[index + 1] = None
 
     def get_long(self, index):
-        first = self.__get_num_from_item(index)
-        last = self.__get_num_from_item(index + 1)
-        return struct.unpack('q', first + last)[0]
+        return self.slots[index]
 
-    # TODO: python3 里 float 也是 8 字节，float 精度存疑
     def add_float(self, index, data):
-        self.__add_num_to_item(index, struct.pack('f', data))
+        self.slots[index] = data
 
     def get_float(self, index):
-        return struct.unpack('f', self.__get_num_from_item(index))[0]
+        return self.slots[index]
 
     def add_double(self, index, data):
-        packed = struct.pack('d', data)
-        self.__add_num_to_item(index, packed[:4])
-        self.__add_num_to_item(index + 1, packed[4:])
+        slots = self.slots
+        slots[index] = data
+        slots[index + 1] = None
 
     def get_double(self, index):
-        first = self.__get_num_from_item(index)
-        last = self.__get_num_from_item(index + 1)
-        return struct.unpack('d', first + last)[0]
+        return self.slots[index]
 
     def add_ref(self, index, ref):
-        self.__add_ref_to_item(index, ref)
+        self.slots[index] = ref
 
     def get_ref(self, index):
-        return self.__get_ref_from_item(index)
-
-
-class Entry(object):
-    def __init__(self, data):
-        self.data = data
-
-    def __str__(self):
-        return str(self.data)
+        return self.slots[index]
 
 
 # 操作数栈
+# 按 max_stack 预先分配好 slot，top 指向下一个空位
+# 和局部变量表一样，long 和 double 占两个 slot，dup2 / pop2 这类指令不需要再判断类型
 class OperandStack(object):
+    __slots__ = ('__size', 'slots', 'top_index')
+
     def __init__(self, size):
         self.__size = size
-        self.__stack = Stack()
+        self.slots = [None] * size
+        self.top_index = 0
 
     def size(self):
         return self.__size
 
+    # 当前栈中实际占用的 slot 个数
+    def depth(self):
+        return self.top_index
+
     def print_state(self):
-        self.__stack.print_state()
+        print_jvm_status(self.get_all_data())
 
     def clear(self):
-        self.__stack.clear()
-
-    # !!! notice !!!  如果是非 jref 的数据，这个方法返回的是封装后的 eg: int 返回的实际是 JInteger   主要是方便 push 使用
-    # 如果以后需要真实数据，再改吧
-    def top(self, index=None):
-        if index is None:
-            return self.__stack.peek().data
-        else:
-            return self.__stack.get_val_at(index).data
-
-    # 类型1 指的是占一个 slot 的类型: int, float, ref
-    def is_top_type1(self, index=None):
-        ref = None
-        if index is None:
-            ref = self.__stack.peek().data
-        else:
-            ref = self.__stack.get_val_at(index).data
-        if isinstance(ref, runtime.jclass.JInteger) or isinstance(ref, runtime.jclass.JFloat) \
-                or isinstance(ref, runtime.jclass.JRef):
-            return True
-        return False
+        self.top_index = 0
+
+    # index 表示距离栈顶的 slot 数，0 为栈顶
+    def top(self, index=0):
+        return self.slots[self.top_index - 1 - index]
 
     def push(self, data):
-        entry = Entry(data)
-        self.__stack.push(entry)
+        self.slots[self.top_index] = data
+        self.top_index += 1
 
     def pop(self):
-        ref = self.__stack.pop().data
-        if isinstance(ref, runtime.jclass.JInteger) or isinstance(ref, runtime.jclass.JFloat) \
-                or isinstance(ref, runtime.jclass.JLong) or isinstance(ref, runtime.jclass.JDouble):
-            return ref.data
-        return ref
+        self.top_index -= 1
+        return self.slots[self.top_index]
 
     def pop_raw(self):
-        return self.__stack.pop().data
+        return self.pop()
 
     def push_int(self, data):
-        jint = runtime.jclass.JInteger()
-        jint.data = data
-        self.push(jint)
+        self.slots[self.top_index] = data
+        self.top_index += 1
 
     def pop_int(self):
-        return self.pop()
+        self.top_index -= 1
+        return self.slots[self.top_index]
 
     def push_long(self, data):
-        jlong = runtime.jclass.JLong()
-        jlong.data = data
-        self.push(jlong)
+        top = self.top_index
+        self.slots[top] = data
+        self.slots[top + 1] = None
+        self.top_index = top + 2
 
     def pop_long(self):
-        return self.pop()
+        self.top_index -= 2
+        return self.slots[self.top_index]
 
     def push_float(self, data):
-        jfloat = runtime.jclass.JFloat()
-        jfloat.data = data
-        self.push(jfloat)
+        self.slots[self.top_index] = data
+        self.top_index += 1
 
     def pop_float(self):
-        return self.pop()
+        self.top_index -= 1
+        return self.slots[self.top_index]
 
     def push_double(self, data):
-        jdouble = runtime.jclass.JDouble()
-        jdouble.data = data
-        self.push(jdouble)
+        top = self.top_index
+        self.slots[top] = data
+        self.slots[top + 1] = None
+        self.top_index = top + 2
 
     def pop_double(self):
-        return self.pop()
+        self.top_index -= 2
+        return self.slots[self.top_index]
 
     def push_ref(self, ref):
-        self.push(ref)
+        self.slots[self.top_index] = ref
+        self.top_index += 1
 
     def pop_ref(self):
-        return self.pop()
+        self.top_index -= 1
+        return self.slots[self.top_index]
 
     def get_all_data(self):
-        return self.__stack.items()
+        return self.slots[:self.top_index]
 
     def __str__(self):
         s = ''
-        for i in self.__stack.items():
+        for i in self.get_all_data():
             s += str(i)
             s += '\n'
         return s
@@ -1,3 +1,7 @@
+import java.lang.ref.ReferenceQueue;
+import java.lang.ref.WeakReference;
+import java.util.Arrays;
+
 public class Hello {
     static final int finalVaule = 13;
     static int staticValue = 12;
@@ -19,6 +23,11 @@ public class Hello {
         testGC();
         testSwitch();
         testReturn();
+        testInterface();
+        testFullGC();
+        testReference();
+        testArrayIntrinsics();
+        testMultiArray();
         // testException();
     }
 
@@ -215,6 +224,181 @@ public class Hello {
         System.out.println(tarray[0].m);
     }
 
+    public static void testInterface() {
+        System.out.println("======== test interface =========");
+        C c = new C();
+        System.out.println(c.m());
+        I1 i1 = c;
+        System.out.println(i1.m());
+        B b = new B();
+        System.out.println(b.m());
+        D d = new D();
+        System.out.println(d.m());
+        B db = d;
+        System.out.println(db.m());
+        E e = new E();
+        System.out.println(e.m());
+    }
+
+    // 每一轮的链表要熬过几次 minor gc 晋升到老年代，老年代放不下时 full gc
+    public static void testFullGC() {
+        System.out.println("======== test full gc =========");
+        for (int round = 0; round < 4; round ++) {
+            Node head = null;
+            for (int i = 0; i < 400; i ++) {
+                Node node = new Node();
+                node.value = i;
+                node.next = head;
+                head = node;
+            }
+            int sum = 0;
+            while (head != null) {
+                sum += head.value;
+                head = head.next;
+            }
+            System.out.println(sum);
+        }
+    }
+
+    // 弱引用的 referent 被回收之后挂到 queue 上，poll / remove 返回的就是创建时的那个引用
+    // finalize 只调用一次，复活的 this 和对象自己字段里的引用是同一个
+    public static void testReference() {
+        System.out.println("======== test reference =========");
+        ReferenceQueue queue = new ReferenceQueue();
+        Object strong = new Object();
+        WeakReference kept = new WeakReference(strong, queue);
+        WeakReference weak = new WeakReference(new Object(), queue);
+        while (weak.get() != null) {
+            int[] garbage = new int[64];
+        }
+        System.out.println(queue.poll() == weak);
+        System.out.println(kept.get() == strong);
+        System.out.println(queue.poll() == null);
+
+        Fin fin = new Fin();
+        fin.self = fin;
+        fin = null;
+        while (Fin.count == 0) {
+            int[] garbage = new int[64];
+        }
+        System.out.println(Fin.saved.self == Fin.saved);
+        Fin.saved = null;
+        WeakReference marker = new WeakReference(new Object());
+        while (marker.get() != null) {
+            int[] garbage = new int[64];
+        }
+        System.out.println(Fin.count);
+
+        // remove 阻塞到另一个线程分配对象触发 gc，把 other 挂到 queue2 上
+        ReferenceQueue queue2 = new ReferenceQueue();
+        final WeakReference other = new WeakReference(new Object(), queue2);
+        Thread allocator = new Thread() {
+            public void run() {
+                while (other.get() != null) {
+                    int[] garbage = new int[64];
+                }
+            }
+        };
+        allocator.start();
+        System.out.println(queue2.remove() == other);
+    }
+
+    // arraycopy 区间重叠时按先复制源数据处理，copyOf 分配新数组触发 gc 之后原数组还在
+    // float / double 按位比较: NaN 等于 NaN，0.0 不等于 -0.0，排序时 -0.0 在 0.0 前面，NaN 在最后
+    public static void testArrayIntrinsics() {
+        System.out.println("======== test array intrinsics =========");
+        int[] a = {1, 2, 3, 4, 5};
+        System.arraycopy(a, 0, a, 1, 4);
+        System.out.println(a[1]);
+        System.out.println(a[4]);
+        System.arraycopy(a, 1, a, 0, 4);
+        System.out.println(a[0]);
+        System.out.println(a[3]);
+        System.arraycopy(a, 5, a, 0, 0);
+        System.arraycopy(a, 0, a, 0, 5);
+        System.out.println(Arrays.hashCode(a));
+        Object[] objs = {a, null, null};
+        System.arraycopy(objs, 0, objs, 1, 2);
+        System.out.println(objs[1] == a);
+        System.out.println(objs[2] == null);
+
+        int[] b = a;
+        Object[] refs = {a};
+        for (int i = 0; i < 500; i ++) {
+            b = Arrays.copyOf(b, 5);
+            refs = Arrays.copyOfRange(refs, 0, 2);
+        }
+        System.out.println(Arrays.equals(a, b));
+        System.out.println(b == a);
+        System.out.println(refs[0] == a);
+        int[] c = Arrays.copyOfRange(a, 3, 7);
+        System.out.println(c.length);
+        System.out.println(c[1]);
+        System.out.println(c[3]);
+
+        double nan = 0.0 / 0.0;
+        double[] d = {0.0, nan, -0.0, -1.5};
+        Arrays.sort(d);
+        System.out.println(d[0]);
+        System.out.println(d[1]);
+        System.out.println(d[2]);
+        System.out.println(d[3] != d[3]);
+        double[] e = {-1.5, -0.0, 0.0, nan};
+        System.out.println(Arrays.equals(d, e));
+        System.out.println(Arrays.hashCode(d) == Arrays.hashCode(e));
+        e[1] = 0.0;
+        System.out.println(Arrays.equals(d, e));
+        System.out.println(Arrays.hashCode(d));
+        float nanf = 0.0f / 0.0f;
+        float[] f = {nanf, 1.5f, 0.0f, -0.0f};
+        Arrays.sort(f);
+        System.out.println(f[0]);
+        System.out.println(f[1]);
+        System.out.println(f[3] != f[3]);
+        System.out.println(Arrays.hashCode(f));
+    }
+
+    // 多维数组的每一行都是单独的数组，替换，填充或者排序一行不影响别的行，gc 之后也一样
+    public static void testMultiArray() {
+        System.out.println("======== test multi array =========");
+        int[][] m = new int[3][4];
+        System.out.println(m.length);
+        System.out.println(m[2].length);
+        m[1][2] = 7;
+        int[] row = {9, 3, 5, 1};
+        int[] old = m[0];
+        m[0] = row;
+        old[1] = 8;
+        System.out.println(m[0][1]);
+        System.out.println(m[1][2]);
+        Arrays.fill(m[2], 6);
+        m[2][0] = 2;
+        Arrays.sort(m[2]);
+        System.out.println(m[2][0]);
+        System.out.println(m[2][3]);
+        System.out.println(m[1][3]);
+        Arrays.sort(m[0]);
+        System.out.println(m[0][0]);
+        System.out.println(row[0]);
+
+        int[][] half = new int[2][];
+        System.out.println(half[1] == null);
+        half[1] = m[1];
+        System.out.println(half[1][2]);
+        long[][][] empty = new long[2][0][5];
+        System.out.println(empty[1].length);
+        int[][] zero = new int[0][3];
+        System.out.println(zero.length);
+
+        for (int i = 0; i < 200; i ++) {
+            int[][] garbage = new int[8][8];
+        }
+        System.out.println(m[1][2]);
+        System.out.println(old[1]);
+        System.out.println(m[2][3]);
+        System.out.println(half[1] == m[1]);
+    }
+
     public static T newT() {
         return new T();
     }
@@ -293,6 +477,55 @@ public class Hello {
         }
     }
 
+    public interface I1 {
+        default int m() {
+            return 1;
+        }
+    }
+
+    // I2 比 I1 具体，同时实现两个接口的类用 I2 的 default 方法
+    public interface I2 extends I1 {
+        default int m() {
+            return 2;
+        }
+    }
+
+    public static class C implements I1, I2 {
+    }
+
+    public static class B implements I1 {
+    }
+
+    // 父类的虚方法表里已经有 I1.m，换成 I2.m
+    public static class D extends B implements I2 {
+    }
+
+    public static class F {
+        public int m() {
+            return 3;
+        }
+    }
+
+    // 父类的方法优先于接口的 default 方法
+    public static class E extends F implements I2 {
+    }
+
+    public static class Node {
+        public int value;
+        public Node next;
+    }
+
+    public static class Fin {
+        public static int count;
+        public static Fin saved;
+        public Fin self;
+
+        protected void finalize() {
+            count ++;
+            saved = this;
+        }
+    }
+
     public static class TestException extends RuntimeException {
     }
 }
@@ -1,40 +1,23 @@
 package java.io;
 
+// println 由虚拟机实现 (instruction/natives.py)，返回 this
 public class PrintStream {
 
-    public PrintStream println(String format) {
-        return this;
-    }
+    public native PrintStream println(String format);
 
-    public PrintStream println(long format) {
-        return this;
-    }
+    public native PrintStream println(long format);
 
-    public PrintStream println(boolean format) {
-        return this;
-    }
+    public native PrintStream println(boolean format);
 
-    public PrintStream println(int format) {
-        return this;
-    }
+    public native PrintStream println(int format);
 
-    public PrintStream println(double format) {
-        return this;
-    }
+    public native PrintStream println(double format);
 
-    public PrintStream println(float format) {
-        return this;
-    }
+    public native PrintStream println(float format);
 
-    public PrintStream println(short format) {
-        return this;
-    }
+    public native PrintStream println(short format);
 
-    public PrintStream println(byte format) {
-        return this;
-    }
+    public native PrintStream println(byte format);
 
-    public PrintStream println(char format) {
-        return this;
-    }
+    public native PrintStream println(char format);
 }
@@ -1,4 +1,9 @@
 package java.lang;
 
 public class Object {
+    public native int hashCode();
+
+    public boolean equals(Object obj) {
+        return this == obj;
+    }
 }
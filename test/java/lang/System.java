@@ -3,5 +3,12 @@ package java.lang;
 import java.io.PrintStream;
 
 public class System {
-    public final static PrintStream out = null;
+    public final static PrintStream out = new PrintStream();
+
+    // native 方法由虚拟机实现 (instruction/intrinsics.py，instruction/natives.py)
+    public static native void arraycopy(Object src, int srcPos, Object dest, int destPos, int length);
+
+    public static native long nanoTime();
+
+    public static native long currentTimeMillis();
 }
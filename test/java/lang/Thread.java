@@ -1,8 +1,8 @@
 package java.lang;
 
 public class Thread {
-    public void start() {
-    }
+    // 在新线程里执行 run
+    public native void start();
 
     public void run() {
     }
@@ -0,0 +1,11 @@
+package java.lang.ref;
+
+public class PhantomReference extends Reference {
+    public PhantomReference(Object referent, ReferenceQueue queue) {
+        super(referent, queue);
+    }
+
+    public Object get() {
+        return null;
+    }
+}
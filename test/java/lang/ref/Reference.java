@@ -0,0 +1,24 @@
+package java.lang.ref;
+
+public abstract class Reference {
+    Object referent;
+    ReferenceQueue queue;
+    Reference next;
+
+    Reference(Object referent) {
+        this.referent = referent;
+    }
+
+    Reference(Object referent, ReferenceQueue queue) {
+        this.referent = referent;
+        this.queue = queue;
+    }
+
+    public Object get() {
+        return referent;
+    }
+
+    public void clear() {
+        referent = null;
+    }
+}
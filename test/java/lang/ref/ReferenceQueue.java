@@ -0,0 +1,17 @@
+package java.lang.ref;
+
+public class ReferenceQueue {
+    Reference head;
+
+    public Reference poll() {
+        Reference r = head;
+        if (r != null) {
+            head = r.next;
+            r.next = null;
+        }
+        return r;
+    }
+
+    // 队列是空的时候阻塞，直到 gc 把引用挂进来
+    public native Reference remove();
+}
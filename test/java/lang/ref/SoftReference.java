@@ -0,0 +1,24 @@
+package java.lang.ref;
+
+public class SoftReference extends Reference {
+    static long clock;
+    long timestamp;
+
+    public SoftReference(Object referent) {
+        super(referent);
+        timestamp = clock;
+    }
+
+    public SoftReference(Object referent, ReferenceQueue queue) {
+        super(referent, queue);
+        timestamp = clock;
+    }
+
+    public Object get() {
+        Object o = referent;
+        if (o != null && timestamp != clock) {
+            timestamp = clock;
+        }
+        return o;
+    }
+}
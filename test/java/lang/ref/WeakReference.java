@@ -0,0 +1,11 @@
+package java.lang.ref;
+
+public class WeakReference extends Reference {
+    public WeakReference(Object referent) {
+        super(referent);
+    }
+
+    public WeakReference(Object referent, ReferenceQueue queue) {
+        super(referent, queue);
+    }
+}
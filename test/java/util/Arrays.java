@@ -0,0 +1,90 @@
+package java.util;
+
+// 方法都由虚拟机的 intrinsic 实现 (instruction/intrinsics.py)
+public class Arrays {
+    private Arrays() {
+    }
+
+    public static native void fill(boolean[] a, boolean val);
+    public static native void fill(boolean[] a, int fromIndex, int toIndex, boolean val);
+    public static native boolean[] copyOf(boolean[] original, int newLength);
+    public static native boolean[] copyOfRange(boolean[] original, int from, int to);
+
+    public static native void fill(byte[] a, byte val);
+    public static native void fill(byte[] a, int fromIndex, int toIndex, byte val);
+    public static native byte[] copyOf(byte[] original, int newLength);
+    public static native byte[] copyOfRange(byte[] original, int from, int to);
+
+    public static native void fill(char[] a, char val);
+    public static native void fill(char[] a, int fromIndex, int toIndex, char val);
+    public static native char[] copyOf(char[] original, int newLength);
+    public static native char[] copyOfRange(char[] original, int from, int to);
+
+    public static native void fill(short[] a, short val);
+    public static native void fill(short[] a, int fromIndex, int toIndex, short val);
+    public static native short[] copyOf(short[] original, int newLength);
+    public static native short[] copyOfRange(short[] original, int from, int to);
+
+    public static native void fill(int[] a, int val);
+    public static native void fill(int[] a, int fromIndex, int toIndex, int val);
+    public static native int[] copyOf(int[] original, int newLength);
+    public static native int[] copyOfRange(int[] original, int from, int to);
+
+    public static native void fill(long[] a, long val);
+    public static native void fill(long[] a, int fromIndex, int toIndex, long val);
+    public static native long[] copyOf(long[] original, int newLength);
+    public static native long[] copyOfRange(long[] original, int from, int to);
+
+    public static native void fill(float[] a, float val);
+    public static native void fill(float[] a, int fromIndex, int toIndex, float val);
+    public static native float[] copyOf(float[] original, int newLength);
+    public static native float[] copyOfRange(float[] original, int from, int to);
+
+    public static native void fill(double[] a, double val);
+    public static native void fill(double[] a, int fromIndex, int toIndex, double val);
+    public static native double[] copyOf(double[] original, int newLength);
+    public static native double[] copyOfRange(double[] original, int from, int to);
+
+    public static native void fill(Object[] a, Object val);
+    public static native void fill(Object[] a, int fromIndex, int toIndex, Object val);
+    public static native Object[] copyOf(Object[] original, int newLength);
+    public static native Object[] copyOfRange(Object[] original, int from, int to);
+
+    public static native boolean equals(boolean[] a, boolean[] a2);
+    public static native int hashCode(boolean[] a);
+
+    public static native boolean equals(byte[] a, byte[] a2);
+    public static native int hashCode(byte[] a);
+    public static native void sort(byte[] a);
+    public static native void sort(byte[] a, int fromIndex, int toIndex);
+
+    public static native boolean equals(char[] a, char[] a2);
+    public static native int hashCode(char[] a);
+    public static native void sort(char[] a);
+    public static native void sort(char[] a, int fromIndex, int toIndex);
+
+    public static native boolean equals(short[] a, short[] a2);
+    public static native int hashCode(short[] a);
+    public static native void sort(short[] a);
+    public static native void sort(short[] a, int fromIndex, int toIndex);
+
+    public static native boolean equals(int[] a, int[] a2);
+    public static native int hashCode(int[] a);
+    public static native void sort(int[] a);
+    public static native void sort(int[] a, int fromIndex, int toIndex);
+
+    public static native boolean equals(long[] a, long[] a2);
+    public static native int hashCode(long[] a);
+    public static native void sort(long[] a);
+    public static native void sort(long[] a, int fromIndex, int toIndex);
+
+    public static native boolean equals(float[] a, float[] a2);
+    public static native int hashCode(float[] a);
+    public static native void sort(float[] a);
+    public static native void sort(float[] a, int fromIndex, int toIndex);
+
+    public static native boolean equals(double[] a, double[] a2);
+    public static native int hashCode(double[] a);
+    public static native void sort(double[] a);
+    public static native void sort(double[] a, int fromIndex, int toIndex);
+}
@@ -0,0 +1,33 @@
+# coding=utf-8
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# 用指定的解释器模式运行 test/Hello，返回退出码和输出的行
+# 线程的输出顺序不固定，所以排序后再比较; JClass 对象的地址每次都不一样，去掉
+def run_hello(mode):
+    process = subprocess.Popen([sys.executable, 'Zvm.py', '-Xinterpreter:' + mode, 'test/Hello'], cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    output = process.communicate()[0]
+    lines = [line for line in output.splitlines() if 'JClass object at' not in line]
+    return process.returncode, sorted(lines)
+
+
+class InterpreterModeTest(unittest.TestCase):
+    # fast 模式执行的是 instruction/handlers.py 生成的闭包，结果必须和 debug 模式执行指令对象一致
+    def test_fast_matches_debug(self):
+        debug_code, debug_lines = run_hello('debug')
+        fast_code, fast_lines = run_hello('fast')
+        self.assertEqual(debug_code, 0, '\n'.join(debug_lines[-20:]))
+        self.assertEqual(fast_code, 0, '\n'.join(fast_lines[-20:]))
+        self.assertTrue(debug_lines)
+        self.assertEqual(debug_lines, fast_lines)
+
+
+if __name__ == '__main__':
+    unittest.main()